@@ -0,0 +1,243 @@
+"""
+performance analytics for back test results
+every measure is calculated for a batch of runs at once: daily equity curves are stacked into a
+(run x trading day) matrix and each measure is an array operation over it, so thousands of sweep
+results are ranked without per run python loops or reading price files again
+
+returns include the first trading day (measured from the initial cash balance), ratios are
+annualized with TRADING_DAYS_PER_YEAR, alpha / beta are measured against the daily returns of a
+benchmark symbol already held in the market data (buy at the first open, hold to the last close)
+
+Tyler Pool
+2022
+"""
+
+import numpy as np
+import pricestore
+import tables
+
+TRADING_DAYS_PER_YEAR = 252
+BENCHMARK_SYMBOL = 'SPY'
+METRIC_NAMES = ('total return', 'cagr', 'volatility', 'sharpe', 'sortino', 'max drawdown', 'turnover',
+                'exposure', 'alpha', 'beta')
+# metrics where the smallest value ranks first, every other metric ranks the largest value first
+LOWER_IS_BETTER = {'max drawdown', 'volatility'}
+
+
+# --- Functions
+def get_equity_matrix(equity_curves):
+    # (run x trading day) matrix from a list of equity curves or a single curve
+    equity_matrix = np.asarray(equity_curves, dtype=np.float64)
+    if equity_matrix.ndim == 1:
+        equity_matrix = equity_matrix[np.newaxis, :]
+    if equity_matrix.ndim != 2:
+        raise ValueError("equity curves of every run must have the same number of trading days")
+    return equity_matrix
+
+
+def get_returns(equity_matrix, initial_balances):
+    # daily simple returns, the first day's return is measured from the initial balance
+    equity_matrix = get_equity_matrix(equity_matrix)
+    initial_balances = np.broadcast_to(np.asarray(initial_balances, dtype=np.float64), (len(equity_matrix),))
+    previous = np.hstack((initial_balances[:, np.newaxis], equity_matrix[:, :-1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(previous > 0.0, equity_matrix / previous - 1.0, 0.0)
+
+
+def get_total_return(equity_matrix, initial_balances):
+    equity_matrix = get_equity_matrix(equity_matrix)
+    return equity_matrix[:, -1] / np.asarray(initial_balances, dtype=np.float64) - 1.0
+
+
+def get_cagr(equity_matrix, initial_balances, trading_days_per_year=TRADING_DAYS_PER_YEAR):
+    # compound annual growth rate over the simulated trading days
+    equity_matrix = get_equity_matrix(equity_matrix)
+    years = equity_matrix.shape[1] / trading_days_per_year
+    growth = np.maximum(equity_matrix[:, -1] / np.asarray(initial_balances, dtype=np.float64), 0.0)
+    return growth ** (1.0 / years) - 1.0
+
+
+def get_volatility(returns, trading_days_per_year=TRADING_DAYS_PER_YEAR):
+    # annualized standard deviation of daily returns
+    return np.std(returns, axis=1) * np.sqrt(trading_days_per_year)
+
+
+def get_sharpe_ratio(returns, risk_free_rate=0.0, trading_days_per_year=TRADING_DAYS_PER_YEAR):
+    # risk_free_rate is annual, 0.0 where the returns do not vary
+    excess_returns = returns - risk_free_rate / trading_days_per_year
+    deviation = np.std(excess_returns, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.mean(excess_returns, axis=1) / deviation * np.sqrt(trading_days_per_year)
+    return np.where(deviation > 0.0, ratio, 0.0)
+
+
+def get_sortino_ratio(returns, risk_free_rate=0.0, trading_days_per_year=TRADING_DAYS_PER_YEAR):
+    # like the sharpe ratio but only days below the risk free rate count as risk
+    excess_returns = returns - risk_free_rate / trading_days_per_year
+    downside_deviation = np.sqrt(np.mean(np.minimum(excess_returns, 0.0) ** 2, axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.mean(excess_returns, axis=1) / downside_deviation * np.sqrt(trading_days_per_year)
+    return np.where(downside_deviation > 0.0, ratio, 0.0)
+
+
+def get_drawdowns(equity_matrix):
+    # fall from the highest equity so far on every trading day, 0.25 = 25 % below the peak
+    equity_matrix = get_equity_matrix(equity_matrix)
+    peaks = np.maximum.accumulate(equity_matrix, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(peaks > 0.0, 1.0 - equity_matrix / peaks, 0.0)
+
+
+def get_max_drawdown(equity_matrix):
+    equity_matrix = get_equity_matrix(equity_matrix)
+    if equity_matrix.shape[1] == 0:
+        return np.zeros(len(equity_matrix))
+    return np.max(get_drawdowns(equity_matrix), axis=1)
+
+
+def get_turnover(traded_value_matrix, equity_matrix, trading_days_per_year=TRADING_DAYS_PER_YEAR):
+    # annual value traded (buys and sells) as a multiple of the average equity
+    equity_matrix = get_equity_matrix(equity_matrix)
+    years = equity_matrix.shape[1] / trading_days_per_year
+    average_equity = np.mean(equity_matrix, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        turnover = np.sum(traded_value_matrix, axis=1) / average_equity / years
+    return np.where(average_equity > 0.0, turnover, 0.0)
+
+
+def get_exposure(cash_matrix, equity_matrix):
+    # average share of equity held in positions, 0.0 = always in cash, 1.0 = always fully invested
+    equity_matrix = get_equity_matrix(equity_matrix)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        invested = np.where(equity_matrix > 0.0, 1.0 - cash_matrix / equity_matrix, 0.0)
+    return np.mean(invested, axis=1)
+
+
+def get_alpha_beta(returns, benchmark_returns, risk_free_rate=0.0, trading_days_per_year=TRADING_DAYS_PER_YEAR):
+    # beta and annualized alpha of every run against one benchmark return series
+    daily_risk_free_rate = risk_free_rate / trading_days_per_year
+    excess_returns = returns - daily_risk_free_rate
+    benchmark_excess_returns = np.asarray(benchmark_returns, dtype=np.float64) - daily_risk_free_rate
+    benchmark_deviations = benchmark_excess_returns - np.mean(benchmark_excess_returns)
+    benchmark_variance = np.mean(benchmark_deviations ** 2)
+    if benchmark_variance > 0.0:
+        beta = (excess_returns - np.mean(excess_returns, axis=1)[:, np.newaxis]) @ benchmark_deviations / (
+                len(benchmark_deviations) * benchmark_variance)
+    else:
+        beta = np.zeros(len(excess_returns))
+    alpha = (np.mean(excess_returns, axis=1) - beta * np.mean(benchmark_excess_returns)) * trading_days_per_year
+    return alpha, beta
+
+
+def get_benchmark_returns(market_data, symbol=BENCHMARK_SYMBOL):
+    # daily returns of holding symbol, the first day's return is from its open to its close
+    # None if the symbol is not in the market data
+    if symbol not in market_data.symbol_index:
+        return None
+    symbol_id = market_data.get_symbol_id(symbol)
+    prices = np.concatenate((market_data.open_cents[0:1, symbol_id],
+                             market_data.close_cents[:, symbol_id])).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(prices[:-1] > 0.0, prices[1:] / prices[:-1] - 1.0, 0.0)
+
+
+def get_ledger_matrices(trade_history_list, initial_cash_balances, simulation_days):
+    # (run x trading day) matrices of dollar value traded and cash held at the close, from the trade ledgers
+    run_count = len(trade_history_list)
+    columns_list = [trade_history.get_columns() for trade_history in trade_history_list]
+    run_ids = np.repeat(np.arange(run_count), [len(columns['day']) for columns in columns_list])
+    days = np.concatenate([columns['day'] for columns in columns_list] + [np.empty(0, dtype=np.int64)])
+    qtys = np.concatenate([columns['qty'] for columns in columns_list] + [np.empty(0, dtype=np.int64)])
+    prices = np.concatenate([columns['price'] for columns in columns_list] + [np.empty(0, dtype=np.int64)])
+    cash_after = np.concatenate([columns['cash_after'] for columns in columns_list] + [np.empty(0, dtype=np.int64)])
+
+    cell_ids = run_ids * simulation_days + days
+    traded_cents = np.zeros(run_count * simulation_days, dtype=np.int64)
+    np.add.at(traded_cents, cell_ids, qtys * prices)
+
+    # cash after the last trade of each day, carried forward to the days without trades
+    last_trade = np.ones(len(cell_ids), dtype=bool)
+    last_trade[:-1] = cell_ids[1:] != cell_ids[:-1]
+    cash_cents = np.zeros(run_count * simulation_days, dtype=np.int64)
+    traded_day = np.zeros(run_count * simulation_days, dtype=bool)
+    cash_cents[cell_ids[last_trade]] = cash_after[last_trade]
+    traded_day[cell_ids[last_trade]] = True
+    cash_cents = cash_cents.reshape(run_count, simulation_days)
+    traded_day = traded_day.reshape(run_count, simulation_days)
+    last_trade_days = np.maximum.accumulate(np.where(traded_day, np.arange(simulation_days), -1), axis=1)
+    cash_cents = np.where(last_trade_days >= 0,
+                          np.take_along_axis(cash_cents, np.maximum(last_trade_days, 0), axis=1),
+                          pricestore.dollars_to_cents(np.asarray(initial_cash_balances, dtype=np.float64))[:, np.newaxis])
+    return (pricestore.cents_to_dollars(traded_cents.reshape(run_count, simulation_days)),
+            pricestore.cents_to_dollars(cash_cents))
+
+
+def compute_metrics(equity_matrix, initial_balances, benchmark_returns=None, cash_matrix=None,
+                    traded_value_matrix=None, risk_free_rate=0.0, trading_days_per_year=TRADING_DAYS_PER_YEAR):
+    # metric name -> array with a value for every run (NaN where the inputs for a metric are missing)
+    equity_matrix = get_equity_matrix(equity_matrix)
+    run_count = len(equity_matrix)
+    initial_balances = np.broadcast_to(np.asarray(initial_balances, dtype=np.float64), (run_count,))
+    returns = get_returns(equity_matrix, initial_balances)
+    not_available = np.full(run_count, np.nan)
+    metrics = {'total return': get_total_return(equity_matrix, initial_balances),
+               'cagr': get_cagr(equity_matrix, initial_balances, trading_days_per_year),
+               'volatility': get_volatility(returns, trading_days_per_year),
+               'sharpe': get_sharpe_ratio(returns, risk_free_rate, trading_days_per_year),
+               'sortino': get_sortino_ratio(returns, risk_free_rate, trading_days_per_year),
+               'max drawdown': get_max_drawdown(equity_matrix),
+               'turnover': not_available,
+               'exposure': not_available,
+               'alpha': not_available,
+               'beta': not_available}
+    if traded_value_matrix is not None:
+        metrics['turnover'] = get_turnover(traded_value_matrix, equity_matrix, trading_days_per_year)
+    if cash_matrix is not None:
+        metrics['exposure'] = get_exposure(cash_matrix, equity_matrix)
+    if benchmark_returns is not None:
+        metrics['alpha'], metrics['beta'] = get_alpha_beta(returns, benchmark_returns, risk_free_rate,
+                                                           trading_days_per_year)
+    return metrics
+
+
+def compute_result_metrics(result_list, market_data, benchmark_symbol=BENCHMARK_SYMBOL, risk_free_rate=0.0):
+    # metrics of back test results that ran over the same market data (sweep results, monte carlo
+    # replicas, ...), metric arrays follow the order of result_list
+    if len(result_list) == 0:
+        return {name: np.empty(0) for name in METRIC_NAMES}
+    equity_matrix = get_equity_matrix([result.equity_curve for result in result_list])
+    initial_balances = np.array([result.config.initial_cash_balance for result in result_list], dtype=np.float64)
+    traded_value_matrix, cash_matrix = get_ledger_matrices([result.trade_history for result in result_list],
+                                                           initial_balances,
+                                                           equity_matrix.shape[1])
+    return compute_metrics(equity_matrix,
+                           initial_balances,
+                           get_benchmark_returns(market_data, benchmark_symbol),
+                           cash_matrix,
+                           traded_value_matrix,
+                           risk_free_rate)
+
+
+def rank_results(metrics, metric_name, descending=None):
+    # run indexes ordered by a metric, best first unless descending is given, runs with a NaN value last
+    if descending is None:
+        descending = metric_name not in LOWER_IS_BETTER
+    values = np.asarray(metrics[metric_name], dtype=np.float64)
+    sort_values = np.where(np.isnan(values), np.inf, -values if descending else values)
+    return np.argsort(sort_values, kind='stable')
+
+
+def format_metrics_table(result_list, metrics, sort_by='sharpe', limit=None):
+    columns = ['trade eval', 'buy', 'sell', 'final balance'] + list(METRIC_NAMES)
+    order = rank_results(metrics, sort_by)
+    if limit is not None:
+        order = order[0:limit]
+    rows = []
+    for run in order.tolist():
+        result = result_list[run]
+        rows.append([result.config.trade_eval_strat,
+                     result.config.buy_strat,
+                     result.config.sell_strat,
+                     '%.2f' % result.final_balance] +
+                    ['%.4f' % metrics[name][run] for name in METRIC_NAMES])
+    return tables.format_table(columns, rows)
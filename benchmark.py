@@ -0,0 +1,425 @@
+"""
+back test pipeline benchmark
+synthetic price files (geometric brownian motion, Yahoo finance csv layout) are generated for
+N symbols x M trading days and every stage of the pipeline is timed on its own:
+csv load, static data fields, static cache write / read, market data, evaluation, order execution
+and valuation
+
+wall time and throughput (bars per second, a bar = one symbol on one trading day) are reported
+per stage, --profile runs every stage under cProfile and tracemalloc (per stage peak memory),
+results can be saved as json and compared against a saved baseline to catch regressions
+
+Tyler Pool
+2022
+"""
+
+import argparse
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import fastbacktest
+import marketdata
+import pricestore
+import staticcache
+import staticdata
+import tables
+import tradeeval
+import trader
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, process peak memory is not reported
+    resource = None
+
+STAGE_NAMES = ('csv load', 'static data', 'static cache write', 'static cache read', 'market data',
+               'evaluation', 'execution', 'valuation')
+FIRST_DATE = '2014-11-17'
+TRADING_DAYS_PER_YEAR = 252
+ANNUAL_DRIFT = 0.07
+ANNUAL_VOLATILITY = 0.25
+# stages faster than this are ignored when comparing against a baseline, their timings are mostly noise
+MIN_COMPARE_SECONDS = 0.01
+
+
+# --- classes
+class StageTimer:
+    # accumulated wall time for one pipeline stage, a stage can be measured in several pieces
+    # (e.g. the event loop alternates between execution and valuation every trading day)
+    def __init__(self, name, profile=False):
+        self.name = name
+        self.seconds = 0.0
+        self.bars = 0
+        self.peak_bytes = None
+        self.profiler = cProfile.Profile() if profile else None
+
+    def __repr__(self):
+        return self.name + ": " + '%.4f' % self.seconds + " s, " + str(self.bars) + " bars"
+
+    @contextlib.contextmanager
+    def measure(self):
+        if self.profiler is not None:
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.seconds += time.perf_counter() - start
+            if self.profiler is not None:
+                self.profiler.disable()
+                peak_bytes = tracemalloc.get_traced_memory()[1] - start_bytes
+                self.peak_bytes = max(self.peak_bytes or 0, peak_bytes)
+
+    def get_bars_per_second(self):
+        if self.seconds <= 0.0:
+            return 0.0
+        return self.bars / self.seconds
+
+    def get_profile_stats(self, line_limit=15):
+        if self.profiler is None:
+            return ""
+        stats_output = io.StringIO()
+        pstats.Stats(self.profiler, stream=stats_output).sort_stats('cumulative').print_stats(line_limit)
+        return stats_output.getvalue()
+
+    def to_dict(self):
+        return {'seconds': self.seconds, 'bars': self.bars, 'bars_per_second': self.get_bars_per_second(),
+                'peak_bytes': self.peak_bytes}
+
+
+class BenchmarkResult:
+    def __init__(self, symbol_count, day_count, engine, stages, peak_rss_bytes):
+        self.symbol_count = symbol_count
+        self.day_count = day_count
+        self.engine = engine
+        # stage name -> StageTimer, in pipeline order
+        self.stages = stages
+        self.peak_rss_bytes = peak_rss_bytes
+
+    def __repr__(self):
+        return ("Benchmark Result: " + str(self.symbol_count) + " symbols x " + str(self.day_count) +
+                " days (" + self.engine + "), " + '%.4f' % self.get_total_seconds() + " s")
+
+    def get_key(self):
+        return str(self.symbol_count) + "x" + str(self.day_count) + " " + self.engine
+
+    def get_total_seconds(self):
+        return sum(stage.seconds for stage in self.stages.values())
+
+    def to_dict(self):
+        return {'symbol_count': self.symbol_count,
+                'day_count': self.day_count,
+                'engine': self.engine,
+                'total_seconds': self.get_total_seconds(),
+                'peak_rss_bytes': self.peak_rss_bytes,
+                'stages': {name: stage.to_dict() for name, stage in self.stages.items()}}
+
+
+# --- Functions
+# --- --- Synthetic Data
+def get_symbols(symbol_count):
+    # SPY is always included, it is the comparison par for every back test
+    return ['SPY'] + ['SYN' + str(symbol_number).zfill(4) for symbol_number in range(1, symbol_count)]
+
+
+def get_trading_dates(day_count, first_date=FIRST_DATE):
+    # weekdays from first_date on, as YYYY-MM-DD strings
+    first_business_day = np.busday_offset(np.datetime64(first_date), 0, roll='forward')
+    return np.datetime_as_string(np.busday_offset(first_business_day, np.arange(day_count)), unit='D')
+
+
+def generate_price_data(symbol_count, day_count, seed=None,
+                        annual_drift=ANNUAL_DRIFT, annual_volatility=ANNUAL_VOLATILITY):
+    # geometric brownian motion closing prices plus open / high / low / volume columns for every symbol
+    # returns (day x symbol) matrices
+    rng = np.random.default_rng(seed)
+    dt = 1.0 / TRADING_DAYS_PER_YEAR
+    drift = annual_drift * rng.uniform(0.5, 1.5, symbol_count)
+    volatility = annual_volatility * rng.uniform(0.5, 1.5, symbol_count)
+    log_returns = ((drift - 0.5 * volatility * volatility) * dt +
+                   volatility * np.sqrt(dt) * rng.standard_normal((day_count, symbol_count)))
+    initial_prices = rng.uniform(20.0, 400.0, symbol_count)
+    closes = initial_prices * np.exp(np.cumsum(log_returns, axis=0))
+    previous_closes = np.vstack((initial_prices, closes[:-1]))
+    opens = previous_closes * (1.0 + 0.002 * rng.standard_normal((day_count, symbol_count)))
+    highs = np.maximum(opens, closes) * (1.0 + np.abs(0.005 * rng.standard_normal((day_count, symbol_count))))
+    lows = np.minimum(opens, closes) * (1.0 - np.abs(0.005 * rng.standard_normal((day_count, symbol_count))))
+    volumes = rng.lognormal(15.0, 1.0, (day_count, symbol_count)).astype(np.int64)
+    return {'opens': opens, 'highs': highs, 'lows': lows, 'closes': closes, 'volumes': volumes}
+
+
+def write_price_files(stock_data_file_path, symbols, dates, price_data):
+    # one csv file per symbol in the input/stocks layout
+    # columns: 0=date, 1=open, 2=high, 3=low, 4=close, 5=adj close, 6=volume
+    os.makedirs(stock_data_file_path, exist_ok=True)
+    for symbol_id, symbol in enumerate(symbols):
+        opens = price_data['opens'][:, symbol_id].tolist()
+        highs = price_data['highs'][:, symbol_id].tolist()
+        lows = price_data['lows'][:, symbol_id].tolist()
+        closes = price_data['closes'][:, symbol_id].tolist()
+        volumes = price_data['volumes'][:, symbol_id].tolist()
+        lines = ["Date,Open,High,Low,Close,Adj Close,Volume"]
+        for row in zip(dates.tolist(), opens, highs, lows, closes, closes, volumes):
+            lines.append('%s,%.6f,%.6f,%.6f,%.6f,%.6f,%d' % row)
+        with open(stock_data_file_path + symbol + trader.FILE_EXTENSION_TYPE, 'w') as price_file:
+            price_file.write("\n".join(lines) + "\n")
+
+
+def generate_benchmark_data(data_path, symbol_count, day_count, seed=None):
+    # writes synthetic price files under data_path and returns the back test config that reads them
+    symbols = get_symbols(symbol_count)
+    dates = get_trading_dates(day_count)
+    stock_data_file_path = os.path.join(data_path, 'stocks') + os.sep
+    static_data_file_path = os.path.join(data_path, 'static data') + os.sep
+    write_price_files(stock_data_file_path, symbols, dates, generate_price_data(symbol_count, day_count, seed))
+    os.makedirs(static_data_file_path, exist_ok=True)
+    return trader.BacktestConfig(ticker_symbol_list=symbols,
+                                 first_trading_day=str(dates[0]),
+                                 last_trading_day=str(dates[-1]),
+                                 stock_data_file_path=stock_data_file_path,
+                                 static_data_file_path=static_data_file_path,
+                                 random_seed=seed,
+                                 quiet=True)
+
+
+# --- --- Benchmark
+def run_benchmark(config: trader.BacktestConfig, engine='vectorized', profile=False):
+    # times every stage of one back test, the static data cache is cleared first so the
+    # csv load and static data stages are measured cold
+    stages = {name: StageTimer(name, profile) for name in STAGE_NAMES}
+    shutil.rmtree(config.static_data_file_path, ignore_errors=True)
+    os.makedirs(config.static_data_file_path, exist_ok=True)
+    if profile:
+        tracemalloc.start()
+    try:
+        market_data = _run_load_stages(config, stages)
+        _run_simulation_stages(config, market_data, engine, stages)
+    finally:
+        if profile:
+            tracemalloc.stop()
+    return BenchmarkResult(len(config.ticker_symbol_list), market_data.simulation_days, engine, stages,
+                           get_peak_rss_bytes())
+
+
+def _run_load_stages(config, stages):
+    stock_history_data_object_list = []
+    for symbol in config.ticker_symbol_list:
+        stock_history_object = trader.StockDataHistory(symbol,
+                                                       config.first_trading_day,
+                                                       config.last_trading_day,
+                                                       config.stock_data_file_path,
+                                                       config.static_data_file_path)
+        with stages['csv load'].measure():
+            stock_history_object.populate_stock_historical_data()
+        stages['csv load'].bars += len(stock_history_object.price_store)
+        stock_history_data_object_list.append(stock_history_object)
+    simulation_days = trader.get_static_data_is_valid(stock_history_data_object_list,
+                                                      config.first_trading_day,
+                                                      config.last_trading_day)
+    if simulation_days <= 0:
+        raise ValueError("benchmark price data failed validation")
+
+    indicator_signature = staticcache.get_indicator_signature(staticdata.get_indicator_definitions())
+    for stock_history_object in stock_history_data_object_list:
+        with stages['static data'].measure():
+            staticdata.get_static_data_fields(stock_history_object, len(stock_history_object.price_store))
+        stages['static data'].bars += len(stock_history_object.price_store)
+        with stages['static cache write'].measure():
+            staticcache.write_static_cache(staticcache.get_cache_file_name(config.static_data_file_path,
+                                                                           stock_history_object.symbol),
+                                           stock_history_object.price_store,
+                                           stock_history_object.source_fingerprint,
+                                           stock_history_object.source_digest,
+                                           indicator_signature)
+        stages['static cache write'].bars += len(stock_history_object.price_store)
+
+    # second load of the same data, mapped from the static data cache written above
+    cached_history_data_object_list = []
+    for symbol in config.ticker_symbol_list:
+        stock_history_object = trader.StockDataHistory(symbol,
+                                                       config.first_trading_day,
+                                                       config.last_trading_day,
+                                                       config.stock_data_file_path,
+                                                       config.static_data_file_path)
+        with stages['static cache read'].measure():
+            stock_history_object.populate_stock_historical_data()
+            stock_history_object.populate_technical_analysis_data(simulation_days)
+        stages['static cache read'].bars += len(stock_history_object.price_store)
+        cached_history_data_object_list.append(stock_history_object)
+
+    with stages['market data'].measure():
+        market_data = marketdata.MarketData(cached_history_data_object_list, simulation_days,
+                                            config.first_trading_day, config.last_trading_day)
+        market_data.get_indicator_matrices()
+    stages['market data'].bars = simulation_days * len(market_data.symbols)
+    return market_data
+
+
+def _run_simulation_stages(config, market_data, engine, stages):
+    bars = market_data.simulation_days * len(market_data.symbols)
+    with stages['evaluation'].measure():
+        eval_obj = tradeeval.TradeEvalObj(config.random_seed)
+        score_matrix = eval_obj.eval_trade_batch(config.trade_eval_strat, market_data.get_indicator_matrices())
+    stages['evaluation'].bars = bars
+
+    if engine == 'vectorized':
+        with stages['execution'].measure():
+            output = fastbacktest.run_vectorized(score_matrix,
+                                                 market_data.close_cents,
+                                                 pricestore.dollars_to_cents(config.initial_cash_balance),
+                                                 config.buy_strat,
+                                                 config.buy_params,
+                                                 config.sell_strat,
+                                                 config.sell_params)
+        # the fast path values holdings as part of execution, the valuation stage marks the
+        # holdings curve to market again so both engines report the same stages
+        with stages['valuation'].measure():
+            equity_curve = output.cash_curve + np.einsum('ij,ij->i', output.holdings_curve, market_data.close_cents)
+            pricestore.cents_to_dollars(equity_curve)
+    else:
+        portfolio = trader.Portfolio(config.initial_cash_balance,
+                                     config.buy_strat,
+                                     config.sell_strat,
+                                     config.ticker_symbol_list,
+                                     config.buy_params,
+                                     config.sell_params)
+        equity_curve = np.zeros(market_data.simulation_days)
+        for day in range(market_data.simulation_days):
+            with stages['execution'].measure():
+                portfolio.execute_sell_strategy(score_matrix[day], market_data, day)
+                portfolio.execute_buy_strategy(score_matrix[day], market_data, day)
+            with stages['valuation'].measure():
+                equity_curve[day] = market_data.mark_to_market(portfolio, day)
+    stages['execution'].bars = bars
+    stages['valuation'].bars = bars
+
+
+def get_peak_rss_bytes():
+    # peak resident set size of the whole process so far (not per stage)
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS, in kilobytes everywhere else
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def merge_best_times(result_list):
+    # fastest time of every stage over repeated runs of the same benchmark
+    best_result = result_list[0]
+    for result in result_list[1:]:
+        for name, stage in result.stages.items():
+            if stage.seconds < best_result.stages[name].seconds:
+                best_result.stages[name] = stage
+        best_result.peak_rss_bytes = result.peak_rss_bytes
+    return best_result
+
+
+def compare_to_baseline(result_list, baseline_list, tolerance):
+    # list of stages that are more than tolerance (fraction) slower than in the baseline
+    baseline_by_key = {}
+    for baseline in baseline_list:
+        baseline_by_key[str(baseline['symbol_count']) + "x" + str(baseline['day_count']) + " " +
+                        baseline['engine']] = baseline
+    regressions = []
+    for result in result_list:
+        baseline = baseline_by_key.get(result.get_key())
+        if baseline is None:
+            continue
+        for name, stage in result.stages.items():
+            baseline_stage = baseline['stages'].get(name)
+            if baseline_stage is None or stage.seconds < MIN_COMPARE_SECONDS:
+                continue
+            if stage.seconds > baseline_stage['seconds'] * (1.0 + tolerance):
+                regressions.append(result.get_key() + " " + name + ": " + '%.4f' % stage.seconds +
+                                   " s (baseline " + '%.4f' % baseline_stage['seconds'] + " s)")
+    return regressions
+
+
+def format_benchmark_table(result):
+    columns = ['stage', 'seconds', 'bars', 'bars/s', 'peak MB']
+    rows = []
+    for stage in result.stages.values():
+        rows.append([stage.name,
+                     '%.4f' % stage.seconds,
+                     str(stage.bars),
+                     '%.0f' % stage.get_bars_per_second(),
+                     '%.2f' % (stage.peak_bytes / 1e6) if stage.peak_bytes is not None else '-'])
+    rows.append(['total', '%.4f' % result.get_total_seconds(), '', '', ''])
+    lines = [str(result), tables.format_table(columns, rows)]
+    if result.peak_rss_bytes is not None:
+        lines.append("process peak memory = " + '%.1f' % (result.peak_rss_bytes / 1e6) + " MB")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark the back test pipeline on synthetic price data")
+    parser.add_argument('--symbols', nargs='+', type=int, default=[20], help="symbol counts to benchmark")
+    parser.add_argument('--days', nargs='+', type=int, default=[1260], help="trading day counts to benchmark")
+    parser.add_argument('--engine', nargs='+', choices=['vectorized', 'loop'], default=['vectorized'])
+    parser.add_argument('--trade-eval-strat', default=trader.TRADE_EVAL_STRAT)
+    parser.add_argument('--buy-strat', default=trader.BUY_STRAT)
+    parser.add_argument('--sell-strat', default=trader.SELL_STRAT)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1, help="run every benchmark this many times, keep the best")
+    parser.add_argument('--profile', action='store_true', help="run stages under cProfile and tracemalloc")
+    parser.add_argument('--data-dir', default=None, help="directory for the synthetic data (default: temporary)")
+    parser.add_argument('--output', default=None, help="save results as json")
+    parser.add_argument('--baseline', default=None, help="json results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    data_root = args.data_dir if args.data_dir is not None else tempfile.mkdtemp(prefix='algo-trader-benchmark-')
+    result_list = []
+    try:
+        for symbol_count in args.symbols:
+            for day_count in args.days:
+                base_config = generate_benchmark_data(os.path.join(data_root, str(symbol_count) + "x" + str(day_count)),
+                                                      symbol_count, day_count, args.seed)
+                config = base_config.copy(trade_eval_strat=args.trade_eval_strat,
+                                          buy_strat=args.buy_strat,
+                                          sell_strat=args.sell_strat)
+                for engine in args.engine:
+                    if engine == 'vectorized' and not fastbacktest.is_supported(config.buy_strat, config.buy_params,
+                                                                                config.sell_strat, config.sell_params):
+                        print("skipping vectorized engine, strategies not supported by the fast path")
+                        continue
+                    result = merge_best_times([run_benchmark(config, engine, args.profile)
+                                               for repeat in range(max(args.repeat, 1))])
+                    result_list.append(result)
+                    print(format_benchmark_table(result))
+                    if args.profile:
+                        for stage in result.stages.values():
+                            print("--- profile: " + stage.name)
+                            print(stage.get_profile_stats())
+                    print()
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(data_root, ignore_errors=True)
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump([result.to_dict() for result in result_list], output_file, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_to_baseline(result_list, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print("regression: " + regression)
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+
+# --- Main App ---
+if __name__ == '__main__':
+    sys.exit(main())
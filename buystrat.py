@@ -1,7 +1,22 @@
 """
 buy strategy module
+
+score array strategies pick the top k symbols by evaluation score with argpartition and size
+the orders with a sizing rule, they work on a single day (get_buy_order_from_scores) or on a
+whole (trading day x symbol) score matrix at once (get_buy_order_schedule)
 """
 
+import numpy as np
+
+SIZING_RULES = ('fixed', 'equal', 'score')
+
+# strategy name -> default parameters, any parameter can be overridden by the caller
+# k = max names bought per day, threshold = minimum score (exclusive) to buy
+# sizing = fixed (n_shares of each name), equal (equal cash per name) or score (cash in proportion to score)
+# cash_fraction = target fraction of available cash (or budget) spent per day by equal and score sizing
+BUY_STRATEGIES = {'highscore': {'k': 1, 'threshold': 0.0, 'sizing': 'fixed', 'n_shares': 2, 'cash_fraction': 1.0},
+                  'topk': {'k': 20, 'threshold': 0.0, 'sizing': 'equal', 'n_shares': 2, 'cash_fraction': 1.0}}
+
 
 def get_buy_order(strategy_name, trade_evaluation_scores):
 
@@ -21,3 +36,84 @@ def get_buy_order(strategy_name, trade_evaluation_scores):
             buy_order[high_score_symbol] = n_shares
 
     return buy_order
+
+
+def is_score_array_strategy(strategy_name):
+    return strategy_name in BUY_STRATEGIES
+
+
+def get_strategy_params(strategy_name, strategy_params=None):
+    params = dict(BUY_STRATEGIES[strategy_name])
+    if strategy_params:
+        params.update(strategy_params)
+    if params['sizing'] not in SIZING_RULES:
+        raise ValueError("unknown buy sizing rule: " + str(params['sizing']))
+    return params
+
+
+def get_buy_order_from_scores(strategy_name, symbols, scores, prices, cash, strategy_params=None):
+    # scores and prices are arrays aligned with symbols for a single trading day
+    # returns buy order dict of symbol -> qty, highest score first
+    params = get_strategy_params(strategy_name, strategy_params)
+    score_matrix = np.asarray(scores, dtype=np.float64).reshape(1, -1)
+    price_matrix = np.asarray(prices, dtype=np.float64).reshape(1, -1)
+    selected = select_top_k(score_matrix, params['k'], params['threshold'])
+    qty = size_buy_orders(score_matrix, price_matrix, selected, cash * params['cash_fraction'], params)[0]
+
+    buy_order = {}
+    order_ids = np.flatnonzero(qty > 0)
+    for symbol_id in order_ids[np.argsort(-score_matrix[0, order_ids], kind='stable')].tolist():
+        buy_order[symbols[symbol_id]] = int(qty[symbol_id])
+    return buy_order
+
+
+def get_buy_order_schedule(strategy_name, score_matrix, price_matrix, budget, strategy_params=None):
+    # precomputed buy orders for every trading day at once
+    # budget is the cash available per day, a scalar or one value per trading day
+    # returns (trading day x symbol) int64 matrix of qty to buy
+    params = get_strategy_params(strategy_name, strategy_params)
+    score_matrix = np.asarray(score_matrix, dtype=np.float64)
+    selected = select_top_k(score_matrix, params['k'], params['threshold'])
+    day_budget = np.asarray(budget, dtype=np.float64) * params['cash_fraction']
+    return size_buy_orders(score_matrix, np.asarray(price_matrix, dtype=np.float64), selected, day_budget, params)
+
+
+def select_top_k(score_matrix, k, threshold):
+    # boolean (trading day x symbol) mask of the k highest scores above threshold on each day
+    # NaN scores (no data) are never selected, with k = 1 ties go to the first symbol
+    eligible = score_matrix > threshold
+    masked_scores = np.where(eligible, score_matrix, -np.inf)
+    selected = np.zeros(score_matrix.shape, dtype=bool)
+    symbol_count = score_matrix.shape[1]
+    if k <= 0 or symbol_count == 0:
+        return selected
+    if k == 1:
+        top_ids = np.argmax(masked_scores, axis=1)[:, np.newaxis]
+    elif k >= symbol_count:
+        return eligible
+    else:
+        top_ids = np.argpartition(-masked_scores, k - 1, axis=1)[:, :k]
+    np.put_along_axis(selected, top_ids, True, axis=1)
+    return selected & eligible
+
+
+def size_buy_orders(score_matrix, price_matrix, selected, budget, params):
+    # qty to buy for every selected (trading day, symbol), budget is a scalar or one value per day
+    sizing = params['sizing']
+    if sizing == 'fixed':
+        return np.where(selected, params['n_shares'], 0).astype(np.int64)
+
+    if sizing == 'score':
+        weights = np.where(selected, np.maximum(score_matrix, 0.0), 0.0)
+        weight_totals = weights.sum(axis=1, keepdims=True)
+        # days where every selected score is 0.0 fall back to equal weights
+        equal_weights = selected / np.maximum(selected.sum(axis=1, keepdims=True), 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = np.where(weight_totals > 0.0, weights / weight_totals, equal_weights)
+    else:
+        weights = selected / np.maximum(selected.sum(axis=1, keepdims=True), 1)
+
+    allocation = weights * np.reshape(budget, (-1, 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        qty = np.floor(np.where(selected & (price_matrix > 0.0), allocation / price_matrix, 0.0))
+    return qty.astype(np.int64)
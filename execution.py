@@ -0,0 +1,206 @@
+"""
+order execution model
+turns the orders placed by the buy / sell strategies into fills: fill price (same day close or
+next trading day open), spread and market impact slippage, commissions and partial fills capped
+at a share of the bar's volume
+
+a model is a named set of parameters, any parameter can be overridden by the caller and new
+models can be registered, the default ideal model fills every order at the close with no costs
+(the original back test behaviour)
+
+every calculation works on arrays of orders, a whole day (event loop) or a whole simulation
+(vectorized fast path) at once, cash and holdings checks are verified for a batch with
+cumulative sums and only fall back to one order at a time from the first order that fails one
+
+prices, commissions and cash are int64 cents
+
+Tyler Pool
+2022
+"""
+
+import numpy as np
+import ledger
+import pricestore
+
+FILL_PRICES = ('close', 'next_open')
+DEFAULT_EXECUTION_MODEL = 'ideal'
+# smaller batches (e.g. one day of a small universe) are filled one order at a time, the bulk
+# verification only pays off over its numpy call overhead for larger batches
+BULK_FILL_MIN_ORDERS = 16
+
+# model name -> parameters
+# fill_price = close (fill at the close of the day the order is placed) or next_open (at the open of the next
+#   trading day, orders placed on the last day are not filled)
+# commission_per_trade / commission_per_share / min_commission are dollars, commission_rate is a fraction of the
+#   trade value, commission = max(per trade + per share * qty + rate * value, min commission)
+# spread = full bid / ask spread as a fraction of the price, every fill pays half of it
+# impact = market impact, the price moves impact * sqrt(fill qty / bar volume) against the order
+# max_volume_fraction = largest fill as a fraction of the bar volume (partial fills), None = no cap
+EXECUTION_MODELS = {'ideal': {'fill_price': 'close', 'commission_per_trade': 0.0, 'commission_per_share': 0.0,
+                              'commission_rate': 0.0, 'min_commission': 0.0, 'spread': 0.0, 'impact': 0.0,
+                              'max_volume_fraction': None},
+                    'retail': {'fill_price': 'next_open', 'commission_per_trade': 0.0, 'commission_per_share': 0.0,
+                               'commission_rate': 0.0, 'min_commission': 0.0, 'spread': 0.001, 'impact': 0.1,
+                               'max_volume_fraction': 0.01},
+                    'broker': {'fill_price': 'next_open', 'commission_per_trade': 0.0, 'commission_per_share': 0.005,
+                               'commission_rate': 0.0, 'min_commission': 1.0, 'spread': 0.0005, 'impact': 0.1,
+                               'max_volume_fraction': 0.05}}
+
+
+# --- Functions
+def register_execution_model(model_name: str, params: dict):
+    # new models start from the ideal model parameters
+    model_params = dict(EXECUTION_MODELS[DEFAULT_EXECUTION_MODEL])
+    model_params.update(params)
+    _validate_params(model_params)
+    EXECUTION_MODELS[model_name] = model_params
+
+
+def get_execution_params(model_name=None, params=None):
+    if model_name is None:
+        model_name = DEFAULT_EXECUTION_MODEL
+    if model_name not in EXECUTION_MODELS:
+        raise ValueError("unknown execution model: " + str(model_name))
+    model_params = dict(EXECUTION_MODELS[model_name])
+    if params:
+        model_params.update(params)
+    _validate_params(model_params)
+    return model_params
+
+
+def get_fill_day_offset(params):
+    # trading days between placing an order and filling it
+    return 1 if params['fill_price'] == 'next_open' else 0
+
+
+def get_base_prices(params, market_data, fill_days, symbol_ids):
+    # price before slippage of orders filled on fill_days
+    if params['fill_price'] == 'next_open':
+        return market_data.open_cents[fill_days, symbol_ids]
+    return market_data.close_cents[fill_days, symbol_ids]
+
+
+def get_fills(params, sides, qtys, base_prices, volumes, available=None):
+    # fill qty, fill price and commission (cents) of every order
+    # orders for symbols without a bar on the fill day (available False) are not filled (qty 0)
+    sides = np.asarray(sides, dtype=np.int64)
+    fill_qtys = np.asarray(qtys, dtype=np.int64)
+    base_prices = np.asarray(base_prices, dtype=np.int64)
+    volumes = np.asarray(volumes, dtype=np.int64)
+    if available is not None:
+        fill_qtys = np.where(available, fill_qtys, 0)
+    if params['max_volume_fraction'] is not None:
+        fill_qtys = np.minimum(fill_qtys, np.floor(volumes * params['max_volume_fraction']).astype(np.int64))
+
+    fill_prices = base_prices
+    if params['spread'] > 0.0 or params['impact'] > 0.0:
+        slippage = params['spread'] / 2.0
+        if params['impact'] > 0.0:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                participation = np.where(volumes > 0, fill_qtys / volumes, 0.0)
+            slippage = slippage + params['impact'] * np.sqrt(participation)
+        fill_prices = np.round(base_prices * (1.0 + sides * slippage)).astype(np.int64)
+
+    commissions = np.zeros(len(fill_qtys), dtype=np.int64)
+    if (params['commission_per_trade'] > 0.0 or params['commission_per_share'] > 0.0 or
+            params['commission_rate'] > 0.0 or params['min_commission'] > 0.0):
+        commission_dollars = np.maximum(params['commission_per_trade'] +
+                                        params['commission_per_share'] * fill_qtys +
+                                        params['commission_rate'] * pricestore.cents_to_dollars(fill_qtys * fill_prices),
+                                        params['min_commission'])
+        commissions = np.where(fill_qtys > 0, pricestore.dollars_to_cents(commission_dollars), 0)
+    return fill_qtys, fill_prices, commissions
+
+
+def fill_orders(symbol_ids, sides, qtys, prices, commissions, cash_cents, holdings):
+    # cash and holdings checks of a batch of orders in execution order, the same checks the
+    # portfolio makes one order at a time: a buy needs more cash than its cost plus commission,
+    # a sell needs at least qty shares held, orders that fail are skipped, qty 0 orders are skipped
+    # holdings = shares held per symbol id before the batch
+    # returns (filled mask, cash after every order, number of orders filled one at a time)
+    # small batches are always filled one at a time (see BULK_FILL_MIN_ORDERS)
+    symbol_ids = np.asarray(symbol_ids, dtype=np.int64)
+    sides = np.asarray(sides, dtype=np.int64)
+    qtys = np.asarray(qtys, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.int64)
+    commissions = np.asarray(commissions, dtype=np.int64)
+    if len(symbol_ids) >= BULK_FILL_MIN_ORDERS:
+        filled, cash_after, first_failed = _fill_optimistic(symbol_ids, sides, qtys, prices, commissions,
+                                                            cash_cents, holdings)
+    else:
+        filled = np.zeros(len(symbol_ids), dtype=bool)
+        cash_after = np.zeros(len(symbol_ids), dtype=np.int64)
+        first_failed = 0
+    sequential_count = 0
+    if first_failed < len(symbol_ids):
+        sequential_count = len(symbol_ids) - first_failed
+        _fill_sequential(symbol_ids, sides, qtys, prices, commissions, filled, cash_after, first_failed,
+                         cash_cents, holdings)
+    return filled & (qtys > 0), cash_after, sequential_count
+
+
+def _fill_optimistic(symbol_ids, sides, qtys, prices, commissions, cash_cents, holdings):
+    # fill every order, then find the first order whose cash or holdings check would have failed
+    # every order before that one is filled exactly as one at a time filling would fill it
+    order_count = len(symbol_ids)
+    cash_flows = -sides * (prices * qtys) - commissions
+    cash_after = cash_cents + np.cumsum(cash_flows)
+    # holdings of the order's symbol before the order, per symbol running sum of signed qty
+    by_symbol = np.argsort(symbol_ids, kind='stable')
+    signed_qty = (sides * qtys)[by_symbol]
+    running = np.cumsum(signed_qty)
+    group_start = np.flatnonzero(np.diff(np.concatenate(([-1], symbol_ids[by_symbol]))))
+    group_offset = np.repeat(running[group_start] - signed_qty[group_start],
+                             np.diff(np.concatenate((group_start, [order_count]))))
+    holdings_before = np.empty(order_count, dtype=np.int64)
+    holdings_before[by_symbol] = running - group_offset - signed_qty
+    holdings_before += np.asarray(holdings, dtype=np.int64)[symbol_ids]
+
+    buy_ok = (sides != ledger.SIDE_BUY) | (cash_after > 0)
+    sell_ok = (sides != ledger.SIDE_SELL) | (holdings_before >= qtys)
+    failed = np.flatnonzero(~(buy_ok & sell_ok) & (qtys > 0))
+    first_failed = int(failed[0]) if len(failed) > 0 else order_count
+    filled = np.zeros(order_count, dtype=bool)
+    filled[:first_failed] = True
+    return filled, cash_after, first_failed
+
+
+def _fill_sequential(symbol_ids, sides, qtys, prices, commissions, filled, cash_after, first_order,
+                     cash_cents, holdings):
+    # state after the orders filled in bulk
+    holdings = np.array(holdings, dtype=np.int64)
+    if first_order > 0:
+        np.add.at(holdings, symbol_ids[:first_order], (sides * qtys)[:first_order])
+    holdings = holdings.tolist()
+    cash = int(cash_after[first_order - 1]) if first_order > 0 else int(cash_cents)
+
+    filled_list = []
+    cash_list = []
+    for symbol_id, side, qty, price, commission in zip(symbol_ids[first_order:].tolist(),
+                                                       sides[first_order:].tolist(),
+                                                       qtys[first_order:].tolist(),
+                                                       prices[first_order:].tolist(),
+                                                       commissions[first_order:].tolist()):
+        if qty == 0:
+            is_filled = False
+        elif side == ledger.SIDE_SELL:
+            is_filled = holdings[symbol_id] >= qty
+            if is_filled:
+                holdings[symbol_id] -= qty
+                cash += price * qty - commission
+        else:
+            is_filled = cash > (qty * price + commission)
+            if is_filled:
+                holdings[symbol_id] += qty
+                cash -= price * qty + commission
+        filled_list.append(is_filled)
+        cash_list.append(cash)
+    filled[first_order:] = filled_list
+    cash_after[first_order:] = cash_list
+
+
+def _validate_params(params):
+    if params['fill_price'] not in FILL_PRICES:
+        raise ValueError("unknown fill price: " + str(params['fill_price']))
+    if params['max_volume_fraction'] is not None and params['max_volume_fraction'] <= 0.0:
+        raise ValueError("max volume fraction must be above 0.0")
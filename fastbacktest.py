@@ -0,0 +1,143 @@
+"""
+vectorized back test fast path for stateless strategies
+
+supported strategies are the score array buy / sell strategies whose orders can be scheduled
+for the whole simulation ahead of time (fixed sizing), orders then only depend on the score
+matrix plus the cash and holdings checks made when they are filled
+
+orders are turned into a flat list of order events in execution order (by day, sells first,
+then by score), the execution model gives every event its fill day, qty, price and commission,
+the cash and holdings checks are then verified for all events at once with cumulative sums
+(see execution.fill_orders), position, cash and equity curves are built from the filled events
+with cumulative sums
+
+prices, cash and equity are int64 cents, so running balances are exact in any summation order
+
+Tyler Pool
+2022
+"""
+
+import numpy as np
+import buystrat
+import execution
+import ledger
+import pricestore
+import sellstrat
+
+SIDE_BUY = ledger.SIDE_BUY
+SIDE_SELL = ledger.SIDE_SELL
+
+
+# --- classes
+class FastBacktestOutput:
+    def __init__(self, trade_days, trade_symbol_ids, trade_sides, trade_qtys, trade_prices, trade_cash_after,
+                 trade_commissions, holdings_curve, cash_curve, equity_curve, final_holdings, final_cash,
+                 sequential_event_count):
+        # filled trades in execution order
+        self.trade_days = trade_days
+        self.trade_symbol_ids = trade_symbol_ids
+        self.trade_sides = trade_sides
+        self.trade_qtys = trade_qtys
+        self.trade_prices = trade_prices
+        self.trade_cash_after = trade_cash_after
+        self.trade_commissions = trade_commissions
+        # (trading day x symbol) shares held and per day cash / equity at the close
+        self.holdings_curve = holdings_curve
+        self.cash_curve = cash_curve
+        self.equity_curve = equity_curve
+        self.final_holdings = final_holdings
+        self.final_cash = final_cash
+        # number of order events that could not be verified in bulk and were filled one at a time
+        self.sequential_event_count = sequential_event_count
+
+    def __repr__(self):
+        return ("Fast Backtest Output: " + str(len(self.trade_days)) + " trades, final cash = $" +
+                pricestore.cents_to_str(self.final_cash) + ", sequential events = " + str(self.sequential_event_count))
+
+
+# --- Functions
+def is_supported(buy_strat, buy_params, sell_strat, sell_params):
+    if not buystrat.is_score_array_strategy(buy_strat) or not sellstrat.is_score_array_strategy(sell_strat):
+        return False
+    return (buystrat.get_strategy_params(buy_strat, buy_params)['sizing'] == 'fixed' and
+            sellstrat.get_strategy_params(sell_strat, sell_params)['sizing'] == 'fixed')
+
+
+def run_vectorized(score_matrix, close_cents, initial_cash_cents,
+                   buy_strat, buy_params, sell_strat, sell_params,
+                   execution_params=None, open_cents=None, volumes=None, available=None):
+    # execution_params defaults to the ideal execution model (fill at the close, no costs), other models
+    # need the (trading day x symbol) open_cents, volumes and available arrays of the market data
+    if execution_params is None:
+        execution_params = execution.get_execution_params()
+    score_matrix = np.asarray(score_matrix, dtype=np.float64)
+    close_cents = np.asarray(close_cents, dtype=np.int64)
+    simulation_days, symbol_count = score_matrix.shape
+    buy_schedule = buystrat.get_buy_order_schedule(buy_strat, score_matrix, pricestore.cents_to_dollars(close_cents),
+                                                   pricestore.cents_to_dollars(initial_cash_cents), buy_params)
+    sell_schedule = sellstrat.get_sell_order_schedule(sell_strat, score_matrix, sell_params)
+
+    # order events in the same order the event loop places them
+    sell_days, sell_ids = np.nonzero(sell_schedule)
+    buy_days, buy_ids = np.nonzero(buy_schedule)
+    event_days = np.concatenate((sell_days, buy_days))
+    event_ids = np.concatenate((sell_ids, buy_ids))
+    event_sides = np.concatenate((np.full(len(sell_days), SIDE_SELL), np.full(len(buy_days), SIDE_BUY)))
+    event_qtys = np.concatenate((sell_schedule[sell_days, sell_ids], buy_schedule[buy_days, buy_ids]))
+    event_scores = score_matrix[event_days, event_ids]
+    # sells lowest score first, buys highest score first, ties by symbol id
+    event_order = np.lexsort((event_ids, event_scores * -event_sides, event_sides, event_days))
+    event_days = event_days[event_order]
+    event_ids = event_ids[event_order]
+    event_sides = event_sides[event_order]
+    event_qtys = event_qtys[event_order].astype(np.int64)
+
+    # orders placed on a day are filled on the day (close) or the next trading day (next open)
+    day_offset = execution.get_fill_day_offset(execution_params)
+    if day_offset > 0:
+        in_simulation = event_days + day_offset < simulation_days
+        event_days = event_days[in_simulation] + day_offset
+        event_ids = event_ids[in_simulation]
+        event_sides = event_sides[in_simulation]
+        event_qtys = event_qtys[in_simulation]
+    if execution_params['fill_price'] == 'next_open':
+        base_prices = np.asarray(open_cents, dtype=np.int64)[event_days, event_ids]
+    else:
+        base_prices = close_cents[event_days, event_ids]
+    event_volumes = np.zeros(len(event_days), dtype=np.int64)
+    if volumes is not None:
+        event_volumes = np.asarray(volumes)[event_days, event_ids]
+    event_available = None
+    if available is not None:
+        event_available = np.asarray(available)[event_days, event_ids]
+    event_qtys, event_prices, event_commissions = execution.get_fills(execution_params, event_sides, event_qtys,
+                                                                      base_prices, event_volumes, event_available)
+
+    filled, cash_after, sequential_event_count = execution.fill_orders(event_ids, event_sides, event_qtys,
+                                                                       event_prices, event_commissions,
+                                                                       initial_cash_cents,
+                                                                       np.zeros(symbol_count, dtype=np.int64))
+
+    trade_days = event_days[filled]
+    trade_symbol_ids = event_ids[filled]
+    trade_sides = event_sides[filled]
+    trade_qtys = event_qtys[filled]
+    trade_prices = event_prices[filled]
+    trade_cash_after = cash_after[filled]
+    trade_commissions = event_commissions[filled]
+
+    holdings_delta = np.zeros((simulation_days, symbol_count), dtype=np.int64)
+    np.add.at(holdings_delta, (trade_days, trade_symbol_ids), trade_sides * trade_qtys)
+    holdings_curve = np.cumsum(holdings_delta, axis=0)
+    # cash at the close is the cash after the last trade made on or before that day
+    last_trade = np.searchsorted(trade_days, np.arange(simulation_days), side='right') - 1
+    cash_curve = np.full(simulation_days, initial_cash_cents, dtype=np.int64)
+    if len(trade_days) > 0:
+        cash_curve = np.where(last_trade >= 0, trade_cash_after[np.maximum(last_trade, 0)], cash_curve)
+    equity_curve = cash_curve + np.einsum('ij,ij->i', holdings_curve, close_cents)
+    final_holdings = holdings_curve[-1] if simulation_days > 0 else np.zeros(symbol_count, dtype=np.int64)
+    final_cash = int(trade_cash_after[-1]) if len(trade_days) > 0 else initial_cash_cents
+
+    return FastBacktestOutput(trade_days, trade_symbol_ids, trade_sides, trade_qtys, trade_prices, trade_cash_after,
+                              trade_commissions, holdings_curve, cash_curve, equity_curve, final_holdings, final_cash,
+                              sequential_event_count)
@@ -0,0 +1,170 @@
+"""
+append only trade ledger
+trades are held in growable, preallocated typed columns (day index, symbol id, side, qty,
+price, cash after the trade, commission), nothing is formatted as text until a trade is printed
+or exported, prices, cash and commissions are int64 cents
+
+Tyler Pool
+2022
+"""
+
+import csv
+import numpy as np
+import pricestore
+
+SIDE_BUY = 1
+SIDE_SELL = -1
+SIDE_NAMES = {SIDE_BUY: "Buy", SIDE_SELL: "Sell"}
+LEDGER_COLUMN_DTYPES = (('day', np.int64),
+                        ('symbol_id', np.int32),
+                        ('side', np.int8),
+                        ('qty', np.int64),
+                        ('price', np.int64),
+                        ('cash_after', np.int64),
+                        ('commission', np.int64))
+INITIAL_CAPACITY = 256
+
+
+# --- classes
+class TradeLedger:
+    def __init__(self, symbols=(), initial_capacity=INITIAL_CAPACITY):
+        self.symbols = list(symbols)
+        self.symbol_index = {symbol: symbol_id for symbol_id, symbol in enumerate(self.symbols)}
+        self._size = 0
+        self._columns = {name: np.empty(max(initial_capacity, 1), dtype=dtype)
+                         for name, dtype in LEDGER_COLUMN_DTYPES}
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        # trades formatted one at a time, so callers that printed the old string trade history still work
+        for trade_number in range(self._size):
+            yield self.format_trade(trade_number)
+
+    def __getitem__(self, trade_number):
+        if trade_number < 0:
+            trade_number += self._size
+        if trade_number < 0 or trade_number >= self._size:
+            raise IndexError("trade number out of range")
+        return self.format_trade(trade_number)
+
+    def __eq__(self, other):
+        if not isinstance(other, TradeLedger) or len(self) != len(other):
+            return False
+        own_columns = self.get_columns()
+        other_columns = other.get_columns()
+        return (all(np.array_equal(own_columns[name], other_columns[name]) for name, dtype in LEDGER_COLUMN_DTYPES
+                    if name != 'symbol_id') and
+                self.get_trade_symbols() == other.get_trade_symbols())
+
+    def __repr__(self):
+        return "Trade Ledger: " + str(self._size) + " trades"
+
+    def __getstate__(self):
+        # only the filled part of the columns is pickled, e.g. when results come back from sweep workers
+        return {'symbols': self.symbols, 'columns': {name: column.copy() for name, column in self.get_columns().items()}}
+
+    def __setstate__(self, state):
+        self.symbols = state['symbols']
+        self.symbol_index = {symbol: symbol_id for symbol_id, symbol in enumerate(self.symbols)}
+        self._size = len(state['columns']['day'])
+        self._columns = {name: _get_column(state['columns'], name, dtype, self._size)
+                         for name, dtype in LEDGER_COLUMN_DTYPES}
+        if self._size == 0:
+            self._columns = {name: np.empty(1, dtype=dtype) for name, dtype in LEDGER_COLUMN_DTYPES}
+
+    def get_symbol_id(self, symbol):
+        symbol_id = self.symbol_index.get(symbol)
+        if symbol_id is None:
+            symbol_id = len(self.symbols)
+            self.symbols.append(symbol)
+            self.symbol_index[symbol] = symbol_id
+        return symbol_id
+
+    def append(self, day, symbol, side, qty, price_cents, cash_after_cents, commission_cents=0):
+        if self._size == len(self._columns['day']):
+            self._grow(self._size + 1)
+        trade_number = self._size
+        self._columns['day'][trade_number] = day
+        self._columns['symbol_id'][trade_number] = self.get_symbol_id(symbol)
+        self._columns['side'][trade_number] = side
+        self._columns['qty'][trade_number] = qty
+        self._columns['price'][trade_number] = price_cents
+        self._columns['cash_after'][trade_number] = cash_after_cents
+        self._columns['commission'][trade_number] = commission_cents
+        self._size += 1
+
+    def extend(self, days, symbol_ids, sides, qtys, price_cents, cash_after_cents, commission_cents=0):
+        # bulk append, symbol ids refer to this ledger's symbol list
+        trade_count = len(days)
+        if self._size + trade_count > len(self._columns['day']):
+            self._grow(self._size + trade_count)
+        new_values = {'day': days, 'symbol_id': symbol_ids, 'side': sides,
+                      'qty': qtys, 'price': price_cents, 'cash_after': cash_after_cents,
+                      'commission': commission_cents}
+        for name, dtype in LEDGER_COLUMN_DTYPES:
+            self._columns[name][self._size:self._size + trade_count] = new_values[name]
+        self._size += trade_count
+
+    def get_columns(self):
+        # views of the filled part of every column
+        return {name: column[0:self._size] for name, column in self._columns.items()}
+
+    def get_trade_symbols(self):
+        return [self.symbols[symbol_id] for symbol_id in self._columns['symbol_id'][0:self._size].tolist()]
+
+    def format_trade(self, trade_number):
+        commission = int(self._columns['commission'][trade_number])
+        return ("On Day " + str(int(self._columns['day'][trade_number])) +
+                ": " + SIDE_NAMES[int(self._columns['side'][trade_number])] +
+                " " + str(int(self._columns['qty'][trade_number])) +
+                " x " + self.symbols[int(self._columns['symbol_id'][trade_number])] +
+                " @ $" + pricestore.cents_to_str(self._columns['price'][trade_number]) +
+                " cash = $" + pricestore.cents_to_str(self._columns['cash_after'][trade_number]) +
+                (" commission = $" + pricestore.cents_to_str(commission) if commission != 0 else ""))
+
+    def get_trade_history_str(self):
+        if self._size == 0:
+            return ""
+        return "\n".join(self) + "\n"
+
+    def to_csv(self, file_name):
+        columns = self.get_columns()
+        with open(file_name, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['day', 'symbol', 'side', 'qty', 'price', 'cash_after', 'commission'])
+            writer.writerows(zip(columns['day'].tolist(),
+                                 self.get_trade_symbols(),
+                                 [SIDE_NAMES[side] for side in columns['side'].tolist()],
+                                 columns['qty'].tolist(),
+                                 [pricestore.cents_to_str(price) for price in columns['price'].tolist()],
+                                 [pricestore.cents_to_str(cash) for cash in columns['cash_after'].tolist()],
+                                 [pricestore.cents_to_str(commission) for commission in columns['commission'].tolist()]))
+
+    def to_binary(self, file_name):
+        # columnar binary export (numpy .npz), read back with read_binary
+        np.savez(file_name, symbols=np.array(self.symbols, dtype=str), **self.get_columns())
+
+    def _grow(self, required_size):
+        new_capacity = max(required_size, len(self._columns['day']) * 2)
+        for name, column in self._columns.items():
+            new_column = np.empty(new_capacity, dtype=column.dtype)
+            new_column[0:self._size] = column[0:self._size]
+            self._columns[name] = new_column
+
+
+# --- Functions
+def read_binary(file_name):
+    with np.load(file_name) as ledger_file:
+        trade_count = len(ledger_file['day'])
+        trade_ledger = TradeLedger(ledger_file['symbols'].tolist(), trade_count)
+        trade_ledger.extend(*(_get_column(ledger_file, name, dtype, trade_count) for name, dtype in LEDGER_COLUMN_DTYPES))
+    return trade_ledger
+
+
+def _get_column(columns, name, dtype, trade_count):
+    # ledgers saved before the commission column was added have no commissions
+    if name not in columns:
+        return np.zeros(trade_count, dtype=dtype)
+    return np.array(columns[name], dtype=dtype)
@@ -0,0 +1,247 @@
+"""
+symbol indexed market data for a trading simulation
+prices for every symbol are held in date aligned (trading day x symbol) arrays so single
+lookups are an index and bulk lookups / portfolio valuation are array operations
+
+trading days come from a master calendar, the union of every symbol's dates between the first
+and last trading day of the run, each symbol is
+aligned onto it once with a sorted search on the int YYYYMMDD date keys, days a symbol has no bar
+for (before its first bar or gaps in its history) are flagged in the available mask and its
+prices / indicators are carried forward from its last bar (0.0 before its first bar, volume 0),
+bars before the first trading day stay in the price stores, so indicators warm up on them
+
+prices are held as int64 cents (used for fills and valuation, so balances are exact) and as
+float dollars (used by the strategies)
+
+a window of trading days (e.g. one walk forward test period) is another MarketData whose arrays
+are views into the full history, indicators keep the values computed over the full history so
+their warm up uses the days before the window
+
+Tyler Pool
+2022
+"""
+
+import numpy as np
+import pricestore
+
+
+# --- classes
+class MarketData:
+    def __init__(self, stock_history_data_object_list: list, simulation_days: int,
+                 first_trading_day=None, last_trading_day=None):
+        self.stock_history_data_object_list = stock_history_data_object_list
+        self.simulation_days = simulation_days
+        self.symbols = [stock_history_object.symbol for stock_history_object in stock_history_data_object_list]
+        self.symbol_index = {symbol: symbol_id for symbol_id, symbol in enumerate(self.symbols)}
+        self.price_stores = [stock_history_object.price_store for stock_history_object in stock_history_data_object_list]
+
+        # master trading calendar, YYYYMMDD int date of every trading day from first to last trading day
+        calendar = get_trading_calendar(self.price_stores)
+        first_day, end_day = get_calendar_range(calendar, first_trading_day, last_trading_day)
+        self.calendar = calendar[first_day:end_day][0:simulation_days]
+        self.simulation_days = len(self.calendar)
+        # (trading day, symbol id) -> row in that symbol's price store of the last bar on or before
+        # the trading day, -1 before the symbol's first bar
+        self.row_index = np.empty((self.simulation_days, len(self.symbols)), dtype=np.int64)
+        # (trading day, symbol id) -> True if the symbol has a bar for the trading day
+        self.available = np.zeros((self.simulation_days, len(self.symbols)), dtype=bool)
+        for symbol_id, price_store in enumerate(self.price_stores):
+            rows = np.searchsorted(price_store.dates, self.calendar, side='right') - 1
+            self.row_index[:, symbol_id] = rows
+            self.available[:, symbol_id] = (rows >= 0) & (price_store.dates[np.maximum(rows, 0)] == self.calendar)
+        # date of the bar used for each trading day (older than the trading day for forward filled bars)
+        self.dates = self._align_column('dates')
+        self.open_cents = self._align_column('open_cents')
+        self.close_cents = self._align_column('close_cents')
+        self.opens = pricestore.cents_to_dollars(self.open_cents)
+        self.closes = pricestore.cents_to_dollars(self.close_cents)
+        self.volumes = np.where(self.available, self._align_column('volumes'), 0)
+        self._indicator_matrices = {}
+        # full history market data and its first trading day, for windows created by get_window
+        self.parent = None
+        self.first_day = 0
+
+    def __len__(self):
+        return self.simulation_days
+
+    def __repr__(self):
+        return ("Market Data: " + str(len(self.symbols)) + " symbols x " +
+                str(self.simulation_days) + " trading days")
+
+    def get_window(self, first_day, day_count):
+        # market data for day_count trading days starting at first_day, nothing is copied
+        if first_day < 0 or day_count <= 0 or first_day + day_count > self.simulation_days:
+            raise ValueError("window of " + str(day_count) + " days from day " + str(first_day) +
+                             " is outside the " + str(self.simulation_days) + " trading days of market data")
+        root = self if self.parent is None else self.parent
+        window_slice = slice(first_day, first_day + day_count)
+        window = MarketData.__new__(MarketData)
+        window.stock_history_data_object_list = self.stock_history_data_object_list
+        window.simulation_days = day_count
+        window.symbols = self.symbols
+        window.symbol_index = self.symbol_index
+        window.price_stores = self.price_stores
+        window.calendar = self.calendar[window_slice]
+        window.row_index = self.row_index[window_slice]
+        window.available = self.available[window_slice]
+        window.dates = self.dates[window_slice]
+        window.open_cents = self.open_cents[window_slice]
+        window.close_cents = self.close_cents[window_slice]
+        window.opens = self.opens[window_slice]
+        window.closes = self.closes[window_slice]
+        window.volumes = self.volumes[window_slice]
+        window._indicator_matrices = {}
+        window.parent = root
+        window.first_day = self.first_day + first_day
+        return window
+
+    def get_date_str(self, day):
+        return pricestore.date_int_to_str(int(self.calendar[day]))
+
+    def get_day_index(self, date):
+        # trading day index of a YYYY-MM-DD string or YYYYMMDD int date, the next trading day if the
+        # date is not a trading day
+        if isinstance(date, str):
+            date = pricestore.date_str_to_int(date)
+        return int(np.searchsorted(self.calendar, date))
+
+    def get_symbol_id(self, symbol):
+        return self.symbol_index[symbol]
+
+    def get_symbol_ids(self, symbols):
+        return np.fromiter((self.symbol_index[symbol] for symbol in symbols), dtype=np.int64, count=len(symbols))
+
+    def get_stock_history(self, symbol):
+        return self.stock_history_data_object_list[self.symbol_index[symbol]]
+
+    def get_row(self, symbol, day):
+        # -1 if the symbol has no bar on or before the trading day
+        return int(self.row_index[day, self.symbol_index[symbol]])
+
+    def is_available(self, symbol, day):
+        return bool(self.available[day, self.symbol_index[symbol]])
+
+    def mask_scores(self, score_matrix):
+        # NaN score (never traded by the score array strategies) on days a symbol has no bar for
+        return np.where(self.available, score_matrix, np.nan)
+
+    def get_closing_price(self, symbol, day):
+        return float(self.closes[day, self.symbol_index[symbol]])
+
+    def get_closing_price_cents(self, symbol, day):
+        return int(self.close_cents[day, self.symbol_index[symbol]])
+
+    def get_closing_prices(self, symbols, day):
+        return self.closes[day, self.get_symbol_ids(symbols)]
+
+    def get_indicator_matrix(self, indicator_name):
+        # (trading day x symbol) matrix of an indicator, built once and reused
+        indicator_matrix = self._indicator_matrices.get(indicator_name)
+        if indicator_matrix is None and self.parent is not None:
+            # view of the full history matrix, built once for every window
+            indicator_matrix = self.parent.get_indicator_matrix(indicator_name)[
+                self.first_day:self.first_day + self.simulation_days]
+            self._indicator_matrices[indicator_name] = indicator_matrix
+        elif indicator_matrix is None and len(self.price_stores) == 0:
+            raise KeyError("no indicator matrix for " + indicator_name)
+        elif indicator_matrix is None:
+            indicator_matrix = np.empty(self.row_index.shape, dtype=np.float64)
+            for symbol_id, price_store in enumerate(self.price_stores):
+                indicator_matrix[:, symbol_id] = _take_rows(price_store.get_indicator(indicator_name),
+                                                            self.row_index[:, symbol_id])
+            self._indicator_matrices[indicator_name] = indicator_matrix
+        return indicator_matrix
+
+    def get_indicator_matrices(self, indicator_names=None):
+        # indicator name -> (trading day x symbol) matrix, every indicator held by the price stores by default
+        if indicator_names is None and len(self.price_stores) > 0:
+            indicator_names = self.price_stores[0].get_indicator_names()
+        elif indicator_names is None:
+            # market data built from arrays (see from_arrays) holds its indicator matrices itself
+            indicator_names = list(self._indicator_matrices.keys())
+        return {indicator_name: self.get_indicator_matrix(indicator_name) for indicator_name in indicator_names}
+
+    def get_holdings_vector(self, position_book):
+        # share qty held per symbol id
+        holdings = np.zeros(len(self.symbols), dtype=np.int64)
+        for position in position_book:
+            if position.qty != 0:
+                holdings[self.symbol_index[position.symbol]] = position.qty
+        return holdings
+
+    def get_position_value(self, position_book, day):
+        return pricestore.cents_to_dollars(self.get_position_value_cents(position_book, day))
+
+    def get_position_value_cents(self, position_book, day):
+        return int(self.get_holdings_vector(position_book) @ self.close_cents[day])
+
+    def mark_to_market(self, portfolio, day):
+        # cash plus every held position valued at the closing price of the day
+        return pricestore.cents_to_dollars(portfolio.cash_cents + self.get_position_value_cents(portfolio.position_book,
+                                                                                                day))
+
+    def _align_column(self, column_name):
+        aligned_column = None
+        for symbol_id, price_store in enumerate(self.price_stores):
+            column = getattr(price_store, column_name)
+            if aligned_column is None:
+                aligned_column = np.empty(self.row_index.shape, dtype=column.dtype)
+            aligned_column[:, symbol_id] = _take_rows(column, self.row_index[:, symbol_id])
+        if aligned_column is None:
+            aligned_column = np.empty(self.row_index.shape, dtype=np.float64)
+        return aligned_column
+
+
+# --- Functions
+def get_trading_calendar(price_stores):
+    # sorted union of every price store's dates
+    if len(price_stores) == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate([np.asarray(price_store.dates, dtype=np.int64) for price_store in price_stores]))
+
+
+def get_calendar_range(calendar, first_trading_day=None, last_trading_day=None):
+    # (first, end) calendar positions of the trading days from first_trading_day to last_trading_day
+    # (YYYY-MM-DD, both included, None = no limit), first == end when the range holds no trading day
+    first_day = 0
+    end_day = len(calendar)
+    if first_trading_day is not None:
+        first_day = int(np.searchsorted(calendar, pricestore.date_str_to_int(first_trading_day), side='left'))
+    if last_trading_day is not None:
+        end_day = int(np.searchsorted(calendar, pricestore.date_str_to_int(last_trading_day), side='right'))
+    return first_day, max(first_day, end_day)
+
+
+def from_arrays(symbols, calendar, row_index, available, open_cents, close_cents, volumes, indicator_matrices,
+                dates=None):
+    # market data over already aligned (trading day x symbol) arrays, e.g. arrays mapped from shared
+    # memory or resampled price paths, nothing is copied and there are no price stores behind it
+    market_data = MarketData.__new__(MarketData)
+    market_data.stock_history_data_object_list = []
+    market_data.symbols = list(symbols)
+    market_data.symbol_index = {symbol: symbol_id for symbol_id, symbol in enumerate(market_data.symbols)}
+    market_data.price_stores = []
+    market_data.calendar = calendar
+    market_data.simulation_days = len(calendar)
+    market_data.row_index = row_index
+    market_data.available = available
+    if dates is None:
+        dates = np.broadcast_to(calendar[:, np.newaxis], row_index.shape)
+    market_data.dates = dates
+    market_data.open_cents = open_cents
+    market_data.close_cents = close_cents
+    market_data.opens = pricestore.cents_to_dollars(open_cents)
+    market_data.closes = pricestore.cents_to_dollars(close_cents)
+    market_data.volumes = volumes
+    market_data._indicator_matrices = dict(indicator_matrices)
+    market_data.parent = None
+    market_data.first_day = 0
+    return market_data
+
+
+def _take_rows(column, rows):
+    # values at rows, 0 for rows before the first bar (-1)
+    column = np.asarray(column)
+    if len(column) == 0:
+        return np.zeros(len(rows), dtype=column.dtype)
+    return np.where(rows >= 0, column[np.maximum(rows, 0)], 0)
@@ -0,0 +1,321 @@
+"""
+monte carlo robustness runs
+runs many replicas of one back test config and reports the distribution of final balance, max
+drawdown and alpha (return over the S&P 500 par of buying SPY on the first day and holding it)
+
+every replica gets its own random stream spawned from one base seed (numpy SeedSequence), so a
+run is reproducible from the base seed and replicas never share random numbers whichever worker
+process runs them, the block bootstrap option also resamples the price paths: the daily returns
+of every symbol are rebuilt from blocks of consecutive trading days drawn with replacement (the
+same days for every symbol so moves across symbols stay correlated) and indicators are
+recalculated on the new prices
+
+price data is loaded once, the aligned market data arrays are copied into shared memory and the
+worker processes map them instead of loading or receiving their own copy
+
+Tyler Pool
+2022
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import analytics
+import marketdata
+import pricestore
+import staticdata
+import sweep
+import tables
+import trader
+
+MARKET_ARRAY_NAMES = ('calendar', 'row_index', 'available', 'dates', 'open_cents', 'close_cents', 'volumes')
+INDICATOR_ARRAY_PREFIX = 'indicator:'
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# worker process market data mapped from shared memory, and the blocks that keep it mapped
+_worker_market_data = None
+_worker_shared_blocks = []
+
+
+# --- classes
+class SharedMarketData:
+    # aligned market data arrays copied once into shared memory blocks
+    # get_spec() is small and picklable, attach_market_data(spec) maps the arrays in another process
+    def __init__(self, market_data: marketdata.MarketData):
+        self.symbols = list(market_data.symbols)
+        self.blocks = []
+        self.array_specs = {}
+        arrays = {name: getattr(market_data, name) for name in MARKET_ARRAY_NAMES}
+        for indicator_name, indicator_matrix in market_data.get_indicator_matrices().items():
+            arrays[INDICATOR_ARRAY_PREFIX + indicator_name] = indicator_matrix
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.array_specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def __repr__(self):
+        return ("Shared Market Data: " + str(len(self.symbols)) + " symbols, " + str(len(self.blocks)) +
+                " shared memory blocks, " + str(sum(block.size for block in self.blocks)) + " bytes")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_spec(self):
+        return self.symbols, self.array_specs
+
+    def close(self):
+        # release and remove the shared memory, workers must be done with it
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+class ReplicaResult:
+    def __init__(self, replica, random_seed, final_balance, par_balance, max_drawdown, trade_count, alpha):
+        self.replica = replica
+        self.random_seed = random_seed
+        self.final_balance = final_balance
+        self.par_balance = par_balance
+        # largest fall from a previous equity peak, 0.25 = 25 %
+        self.max_drawdown = max_drawdown
+        self.trade_count = trade_count
+        # return over the S&P 500 par return, 0.1 = 10 % of the initial cash balance
+        self.alpha = alpha
+
+    def __repr__(self):
+        return ("Replica Result " + str(self.replica) + ": final balance = $" + '%.2f' % self.final_balance +
+                ", max drawdown = " + '%.4f' % self.max_drawdown + ", alpha = " + '%.4f' % self.alpha)
+
+
+class MonteCarloSummary:
+    def __init__(self, config, replica_results, block_days, entropy):
+        self.config = config
+        self.replica_results = replica_results
+        # block length of the bootstrapped price paths, None if every replica uses the loaded prices
+        self.block_days = block_days
+        # entropy of the base seed sequence, passing it back as the base seed repeats the run
+        self.entropy = entropy
+        self.final_balances = np.array([result.final_balance for result in replica_results], dtype=np.float64)
+        self.max_drawdowns = np.array([result.max_drawdown for result in replica_results], dtype=np.float64)
+        self.alphas = np.array([result.alpha for result in replica_results], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.replica_results)
+
+    def __repr__(self):
+        return ("Monte Carlo Summary: " + str(len(self)) + " replicas, median final balance = $" +
+                '%.2f' % np.median(self.final_balances) + ", " + repr(self.config))
+
+    def get_distributions(self):
+        # measure name -> values of every replica
+        return {'final balance': self.final_balances,
+                'max drawdown': self.max_drawdowns,
+                'alpha': self.alphas}
+
+    def get_probability_of_loss(self):
+        return float(np.mean(self.final_balances < self.config.initial_cash_balance))
+
+    def get_probability_of_positive_alpha(self):
+        return float(np.mean(self.alphas[~np.isnan(self.alphas)] > 0.0))
+
+
+# --- Functions
+def get_replica_seeds(replica_count, base_seed=None):
+    # base seed sequence and one independent child seed sequence per replica
+    base_seed_sequence = np.random.SeedSequence(base_seed)
+    return base_seed_sequence, base_seed_sequence.spawn(replica_count)
+
+
+def get_bootstrap_days(rng, return_days, block_days):
+    # source day (index into the daily returns) of every simulated daily return, blocks of
+    # block_days consecutive days starting at random days (moving block bootstrap)
+    block_days = min(max(int(block_days), 1), return_days)
+    block_count = -(-return_days // block_days)
+    block_starts = rng.integers(0, return_days - block_days + 1, size=block_count)
+    return (block_starts[:, np.newaxis] + np.arange(block_days)).ravel()[0:return_days]
+
+
+def bootstrap_market_data(market_data: marketdata.MarketData, rng, block_days):
+    # market data with price paths rebuilt from block bootstrapped daily returns
+    # symbols keep their trading days (available mask), first close and open / close ratios,
+    # days without a bar are carried forward the same way as in the loaded market data
+    close_cents = market_data.close_cents
+    available = market_data.available
+    simulation_days = market_data.simulation_days
+    if simulation_days < 2:
+        return market_data
+    listed = close_cents > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_returns = np.where(listed[:-1] & listed[1:], np.log(close_cents[1:] / close_cents[:-1]), 0.0)
+        open_ratios = np.where(listed, market_data.open_cents / close_cents, 1.0)
+    source_days = get_bootstrap_days(rng, simulation_days - 1, block_days)
+
+    # a symbol only moves on days it has a bar, starting from its first close
+    moves = np.where(available[1:] & listed[:-1], log_returns[source_days], 0.0)
+    path = np.vstack((np.zeros((1, len(market_data.symbols))), np.cumsum(moves, axis=0)))
+    first_listed_day = np.argmax(listed, axis=0)
+    first_close = close_cents[first_listed_day, np.arange(len(market_data.symbols))]
+    new_close_cents = np.where(listed, np.round(first_close * np.exp(path)), 0).astype(np.int64)
+    bar_days = np.concatenate(([0], source_days + 1))
+    new_open_cents = np.round(new_close_cents * open_ratios[bar_days]).astype(np.int64)
+    new_open_cents = _forward_fill(new_open_cents, available)
+    new_volumes = np.where(available, market_data.volumes[bar_days], 0)
+
+    # indicators over each symbol's own bars, aligned onto the calendar like MarketData does
+    new_closes = pricestore.cents_to_dollars(new_close_cents)
+    indicator_matrices = {name: np.zeros(close_cents.shape, dtype=np.float64)
+                          for name in staticdata.get_indicator_names()}
+    for symbol_id in range(len(market_data.symbols)):
+        rows = market_data.row_index[:, symbol_id]
+        indicator_columns = staticdata.compute_indicators(new_closes[available[:, symbol_id], symbol_id])
+        for name, indicator_column in indicator_columns.items():
+            if len(indicator_column) > 0:
+                indicator_matrices[name][:, symbol_id] = np.where(rows >= 0, indicator_column[np.maximum(rows, 0)],
+                                                                  0.0)
+    return marketdata.from_arrays(market_data.symbols,
+                                  market_data.calendar,
+                                  market_data.row_index,
+                                  available,
+                                  new_open_cents,
+                                  new_close_cents,
+                                  new_volumes,
+                                  indicator_matrices,
+                                  market_data.dates)
+
+
+def attach_market_data(spec):
+    # market data over the shared memory arrays of SharedMarketData.get_spec()
+    # returns the market data and the shared memory blocks, which must stay open while it is used
+    symbols, array_specs = spec
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in array_specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    indicator_matrices = {name[len(INDICATOR_ARRAY_PREFIX):]: array for name, array in arrays.items()
+                          if name.startswith(INDICATOR_ARRAY_PREFIX)}
+    market_data = marketdata.from_arrays(symbols,
+                                         arrays['calendar'],
+                                         arrays['row_index'],
+                                         arrays['available'],
+                                         arrays['open_cents'],
+                                         arrays['close_cents'],
+                                         arrays['volumes'],
+                                         indicator_matrices,
+                                         arrays['dates'])
+    return market_data, blocks
+
+
+def run_replica(task, market_data=None):
+    # task = (config, replica number, bootstrap seed sequence, block days), run in the worker processes
+    config, replica, bootstrap_seed_sequence, block_days = task
+    if market_data is None:
+        market_data = _worker_market_data
+    if block_days:
+        market_data = bootstrap_market_data(market_data, np.random.default_rng(bootstrap_seed_sequence), block_days)
+    # the S&P 500 par is priced from the replica's (possibly resampled) SPY prices
+    result = trader.simulate_back_test(config, market_data, False)
+    return ReplicaResult(replica,
+                         config.random_seed,
+                         result.final_balance,
+                         result.comparison_par_balance,
+                         float(analytics.get_max_drawdown(result.equity_curve)[0]),
+                         result.trade_count,
+                         (result.final_balance - result.comparison_par_balance) / config.initial_cash_balance)
+
+
+def run_monte_carlo(config: trader.BacktestConfig, replica_count, block_days=None, base_seed=None,
+                    max_workers=None, market_data=None):
+    # replica_count runs of config, returns a MonteCarloSummary (None if the data is invalid)
+    # block_days resamples the price paths of every replica, None runs every replica on the loaded prices
+    if market_data is None:
+        market_data = trader.load_market_data(config)
+        if market_data is None:
+            return None
+    base_seed_sequence, replica_seeds = get_replica_seeds(replica_count, base_seed)
+    task_list = []
+    for replica, replica_seed_sequence in enumerate(replica_seeds):
+        # separate streams for the strategy (trade evaluation) and the price path resampling
+        strategy_seed_sequence, bootstrap_seed_sequence = replica_seed_sequence.spawn(2)
+        replica_config = config.copy(random_seed=int(strategy_seed_sequence.generate_state(1)[0]))
+        task_list.append((replica_config, replica, bootstrap_seed_sequence, block_days))
+
+    if max_workers == 1:
+        replica_results = [run_replica(task, market_data) for task in task_list]
+    else:
+        with SharedMarketData(market_data) as shared_market_data:
+            with ProcessPoolExecutor(max_workers=max_workers,
+                                     initializer=_init_worker,
+                                     initargs=(shared_market_data.get_spec(),)) as executor:
+                replica_results = list(executor.map(run_replica, task_list,
+                                                    chunksize=sweep.get_chunk_size(len(task_list), max_workers)))
+    return MonteCarloSummary(config, replica_results, block_days, base_seed_sequence.entropy)
+
+
+def format_summary_table(summary: MonteCarloSummary):
+    columns = ['measure', 'mean', 'std'] + ['p' + str(percentile) for percentile in PERCENTILES]
+    rows = []
+    for name, values in summary.get_distributions().items():
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            rows.append([name, '-', '-'] + ['-' for _ in PERCENTILES])
+            continue
+        rows.append([name, '%.4f' % np.mean(values), '%.4f' % np.std(values)] +
+                    ['%.4f' % value for value in np.percentile(values, PERCENTILES)])
+    return tables.format_table(columns, rows)
+
+
+def _forward_fill(values, available):
+    # values of days without a bar replaced by the symbol's last bar value, 0 before its first bar
+    day_numbers = np.arange(len(values))[:, np.newaxis]
+    last_bar_days = np.maximum.accumulate(np.where(available, day_numbers, -1), axis=0)
+    filled = np.take_along_axis(values, np.maximum(last_bar_days, 0), axis=0)
+    return np.where(last_bar_days >= 0, filled, 0)
+
+
+def _init_worker(spec):
+    global _worker_market_data, _worker_shared_blocks
+    _worker_market_data, _worker_shared_blocks = attach_market_data(spec)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="monte carlo / bootstrap robustness runs of an algorithmic trading back test")
+    parser.add_argument('--replicas', type=int, default=1000)
+    parser.add_argument('--block-days', type=int, default=None,
+                        help="resample price paths in blocks of this many trading days (default: loaded prices)")
+    parser.add_argument('--seed', type=int, default=None, help="base seed of the replica random streams")
+    parser.add_argument('--trade-eval-strat', default=trader.TRADE_EVAL_STRAT)
+    parser.add_argument('--buy-strat', default=trader.BUY_STRAT)
+    parser.add_argument('--sell-strat', default=trader.SELL_STRAT)
+    parser.add_argument('--initial-cash-balance', type=float, default=trader.INITIAL_CASH_BALANCE)
+    parser.add_argument('--symbols', nargs='+', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    config = trader.BacktestConfig(trade_eval_strat=args.trade_eval_strat,
+                                   buy_strat=args.buy_strat,
+                                   sell_strat=args.sell_strat,
+                                   ticker_symbol_list=args.symbols,
+                                   initial_cash_balance=args.initial_cash_balance,
+                                   quiet=True)
+    summary = run_monte_carlo(config, args.replicas, args.block_days, args.seed, args.workers)
+    if summary is None:
+        return None
+    print(format_summary_table(summary))
+    print("probability of loss = " + '%.4f' % summary.get_probability_of_loss())
+    print("probability of beating the S&P 500 par = " + '%.4f' % summary.get_probability_of_positive_alpha())
+    print("base seed = " + str(summary.entropy))
+    return summary
+
+
+# --- Main App ---
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+position book for the portfolio
+holdings are kept per symbol as lots (one lot per buy) instead of one object per share,
+so buys, sells and quantity lookups cost the same no matter how many shares are held
+
+prices, cost basis and realized P&L are int64 cents
+
+Tyler Pool
+2022
+"""
+
+from collections import deque
+import pricestore
+
+SALE_TYPES = ('FIFO', 'LIFO', 'AVG')
+
+
+# --- classes
+class Lot:
+    __slots__ = ('symbol', 'qty', 'price', 'date', 'sold_qty', 'realized_pnl')
+
+    def __init__(self, symbol, qty, price, date):
+        self.symbol = symbol
+        self.qty = qty  # shares still held from this lot
+        self.price = price  # purchase price per share, cents
+        self.date = date
+        self.sold_qty = 0
+        self.realized_pnl = 0  # cents
+
+    def __repr__(self):
+        return ("Lot: " + str(self.qty) + " x " + str(self.symbol) + " @ $" + pricestore.cents_to_str(self.price) +
+                " on " + str(self.date) + ", sold = " + str(self.sold_qty) +
+                ", realized P&L = $" + pricestore.cents_to_str(self.realized_pnl))
+
+
+class Position:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.lots = deque()  # open lots, oldest first
+        self.closed_lots = []
+        self.qty = 0
+        self.cost_basis = 0  # total purchase cost of the shares still held, cents
+        self.realized_pnl = 0  # cents
+
+    def __repr__(self):
+        return ("Position: " + str(self.qty) + " x " + str(self.symbol) +
+                ", cost basis = $" + pricestore.cents_to_str(self.cost_basis) +
+                ", realized P&L = $" + pricestore.cents_to_str(self.realized_pnl))
+
+    def get_average_cost(self):
+        # cents per share, not rounded
+        if self.qty == 0:
+            return 0.0
+        return self.cost_basis / self.qty
+
+    def add_lot(self, qty, price, date):
+        self.lots.append(Lot(self.symbol, qty, price, date))
+        self.qty += qty
+        self.cost_basis += qty * price
+
+    def remove_qty(self, qty, price, sale_type="FIFO"):
+        # sell qty shares at price (cents), returns the realized P&L of the sale in cents
+        # FIFO and LIFO realize P&L against the price of the lots consumed, AVG against the average cost
+        # of the whole position (lots are still consumed oldest first to keep the holding periods)
+        # AVG cost of the first k shares sold is cost basis * k // qty, so the costs of the lots
+        # consumed add up to whole cents and selling the whole position removes the whole cost basis
+        if sale_type not in SALE_TYPES:
+            raise ValueError("unknown sale type: " + str(sale_type))
+        if qty > self.qty:
+            raise ValueError("can not sell " + str(qty) + " x " + str(self.symbol) +
+                             ", position only holds " + str(self.qty))
+        position_qty = self.qty
+        position_cost_basis = self.cost_basis
+        sale_pnl = 0
+        remaining_qty = qty
+        while remaining_qty > 0:
+            lot = self.lots[-1] if sale_type == "LIFO" else self.lots[0]
+            lot_qty_sold = min(lot.qty, remaining_qty)
+            if sale_type == "AVG":
+                sold_qty = qty - remaining_qty
+                lot_cost = (position_cost_basis * (sold_qty + lot_qty_sold) // position_qty -
+                            position_cost_basis * sold_qty // position_qty)
+            else:
+                lot_cost = lot_qty_sold * lot.price
+            lot_pnl = lot_qty_sold * price - lot_cost
+            lot.qty -= lot_qty_sold
+            lot.sold_qty += lot_qty_sold
+            lot.realized_pnl += lot_pnl
+            self.cost_basis -= lot_cost
+            sale_pnl += lot_pnl
+            remaining_qty -= lot_qty_sold
+            if lot.qty == 0:
+                if sale_type == "LIFO":
+                    self.lots.pop()
+                else:
+                    self.lots.popleft()
+                self.closed_lots.append(lot)
+        self.qty -= qty
+        self.realized_pnl += sale_pnl
+        return sale_pnl
+
+
+class PositionBook:
+    def __init__(self):
+        self.positions = {}  # symbol -> Position
+
+    def __repr__(self):
+        return "Position Book: " + str({symbol: position.qty for symbol, position in self.positions.items()})
+
+    def __iter__(self):
+        return iter(self.positions.values())
+
+    def get_position(self, symbol):
+        position = self.positions.get(symbol)
+        if position is None:
+            position = Position(symbol)
+            self.positions[symbol] = position
+        return position
+
+    def get_qty(self, symbol):
+        position = self.positions.get(symbol)
+        if position is None:
+            return 0
+        return position.qty
+
+    def add(self, symbol, qty, price, date):
+        self.get_position(symbol).add_lot(qty, price, date)
+
+    def remove(self, symbol, qty, price, sale_type="FIFO"):
+        return self.get_position(symbol).remove_qty(qty, price, sale_type)
+
+    def get_realized_pnl(self):
+        # cents
+        return sum(position.realized_pnl for position in self.positions.values())
+
+    def get_open_lots(self):
+        # open lots across every symbol, mostly useful for reporting
+        return [lot for position in self.positions.values() for lot in position.lots]
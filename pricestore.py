@@ -0,0 +1,240 @@
+"""
+columnar storage for daily stock price history and derived technical analysis fields
+
+every column is a contiguous numpy array indexed by trading day row, TradingDay objects
+are only created on demand as lightweight views into a row of the store
+
+prices are fixed point int64 cents, parsed once when the price file is loaded, float dollar
+columns are derived from them when first used (indicators, strategies)
+
+Tyler Pool
+2022
+"""
+
+from collections.abc import MutableMapping, Sequence
+import numpy as np
+
+PRICE_COLUMN_NAMES = ('date', 'open', 'close', 'volume')
+CENTS_PER_DOLLAR = 100
+
+
+# --- classes
+class PriceStore:
+    def __init__(self, symbol, dates=(), open_cents=(), close_cents=(), volumes=()):
+        self.symbol = symbol
+        # dates held as YYYYMMDD integers so they sort and compare numerically
+        self.dates = np.asarray(dates, dtype=np.int64)
+        self.open_cents = np.asarray(open_cents, dtype=np.int64)
+        self.close_cents = np.asarray(close_cents, dtype=np.int64)
+        self.volumes = np.asarray(volumes, dtype=np.int64)
+        # named indicator columns, each a float64 array with one value per trading day
+        self.indicators = {}
+        self._opens = None
+        self._closes = None
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __str__(self):
+        return "Price Store for: " + str(self.symbol)
+
+    def __repr__(self):
+        return "Price Store for: " + str(self.symbol) + " (" + str(len(self)) + " rows)"
+
+    @property
+    def opens(self):
+        # float dollar prices
+        if self._opens is None:
+            self._opens = cents_to_dollars(self.open_cents)
+        return self._opens
+
+    @property
+    def closes(self):
+        if self._closes is None:
+            self._closes = cents_to_dollars(self.close_cents)
+        return self._closes
+
+    def get_indicator_names(self):
+        return list(self.indicators.keys())
+
+    def get_indicator(self, name):
+        return self.indicators[name]
+
+    def set_indicator(self, name, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) != len(self):
+            raise ValueError("indicator column " + name + " has " + str(len(values)) +
+                             " rows, expected " + str(len(self)))
+        self.indicators[name] = values
+
+    def get_date_str(self, row):
+        return date_int_to_str(self.dates[row])
+
+    def get_trading_day(self, row):
+        return TradingDay(self, row)
+
+    def get_trading_day_list(self):
+        return TradingDayList(self)
+
+
+class TradingDay:
+    # read only view of a single row of a PriceStore, kept for compatibility with code
+    # written against the original object per day model
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    @property
+    def symbol(self):
+        return self._store.symbol
+
+    @property
+    def date(self):
+        return self._store.get_date_str(self._row)
+
+    @property
+    def open(self):
+        return cents_to_dollars(int(self._store.open_cents[self._row]))
+
+    @property
+    def close(self):
+        return cents_to_dollars(int(self._store.close_cents[self._row]))
+
+    @property
+    def volume(self):
+        return int(self._store.volumes[self._row])
+
+    @property
+    def technical_analysis_data(self):
+        return TechnicalAnalysisRow(self._store, self._row)
+
+    def __str__(self):
+        return "date = " + str(self.date) + ", open = " + str(self.open)
+
+    def __repr__(self):
+        return ('Trading Day Object: ' + str(self.symbol) +
+                '\n date = ' + str(self.date) +
+                '\n open-close-vol = ' + str(self.open) + '-' + str(self.close) + '-' + str(self.volume) +
+                '\n technical data dict:\n' + str(dict(self.technical_analysis_data)))
+
+
+class TechnicalAnalysisRow(MutableMapping):
+    # dict like view of the indicator columns for one trading day
+    # 'date' is served from the price columns so existing callers still find it in the dict
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, key):
+        if key == 'date':
+            return self._store.get_date_str(self._row)
+        return float(self._store.indicators[key][self._row])
+
+    def __setitem__(self, key, value):
+        if key == 'date':
+            if value != self._store.get_date_str(self._row):
+                raise ValueError("date is a price column and can not be changed through technical analysis data")
+            return
+        if key not in self._store.indicators:
+            self._store.indicators[key] = np.full(len(self._store), np.nan)
+        self._store.indicators[key][self._row] = float(value)
+
+    def __delitem__(self, key):
+        raise TypeError("technical analysis columns can not be removed one day at a time")
+
+    def __iter__(self):
+        yield 'date'
+        yield from self._store.indicators
+
+    def __len__(self):
+        return len(self._store.indicators) + 1
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class TradingDayList(Sequence):
+    # list like access to TradingDay views, nothing is materialized until indexed
+    __slots__ = ('_store',)
+
+    def __init__(self, store):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [TradingDay(self._store, row) for row in range(*index.indices(len(self._store)))]
+        if index < 0:
+            index += len(self._store)
+        if index < 0 or index >= len(self._store):
+            raise IndexError("trading day index out of range")
+        return TradingDay(self._store, index)
+
+
+# --- Functions
+def date_str_to_int(date_str: str):
+    # '2014-11-17' -> 20141117
+    return int(date_str[0:4]) * 10000 + int(date_str[5:7]) * 100 + int(date_str[8:10])
+
+
+def date_int_to_str(date_int):
+    date_int = int(date_int)
+    return '%04d-%02d-%02d' % (date_int // 10000, (date_int // 100) % 100, date_int % 100)
+
+
+def price_str_to_cents(price_str: str):
+    # '201.660004' -> 20166, truncated to whole cents without going through float
+    return price_bytes_to_cents(price_str.encode('ascii'))
+
+
+def price_bytes_to_cents(field):
+    # bytes version of price_str_to_cents, raises ValueError for values that are not prices (e.g. b'null')
+    field = field.strip()
+    sign = 1
+    if field[0:1] == b'-':
+        sign = -1
+        field = field[1:]
+    decimal_point = field.find(b'.')
+    if decimal_point < 0:
+        return sign * int(field) * CENTS_PER_DOLLAR
+    fraction = field[decimal_point + 1:decimal_point + 3]
+    if fraction and not fraction.isdigit():
+        raise ValueError("invalid price: " + repr(field))
+    return sign * (int(field[0:decimal_point] or b'0') * CENTS_PER_DOLLAR + int(fraction.ljust(2, b'0')))
+
+
+def price_to_dollars(price):
+    # price string ('201.660004') or float dollar value (e.g. an indicator) truncated to whole cents
+    if isinstance(price, str):
+        return cents_to_dollars(price_str_to_cents(price))
+    return float(truncate_to_cents(price))
+
+
+def truncate_to_cents(dollars):
+    # float dollar values truncated to whole cents, arrays are converted as a whole
+    return np.trunc(np.round(np.asarray(dollars, dtype=np.float64) * CENTS_PER_DOLLAR, 4)) / CENTS_PER_DOLLAR
+
+
+def dollars_to_cents(dollars):
+    # rounds to the nearest cent, arrays are converted as a whole
+    if isinstance(dollars, np.ndarray):
+        return np.round(dollars * CENTS_PER_DOLLAR).astype(np.int64)
+    return int(round(dollars * CENTS_PER_DOLLAR))
+
+
+def cents_to_dollars(cents):
+    if isinstance(cents, np.ndarray):
+        return np.asarray(cents, dtype=np.float64) / CENTS_PER_DOLLAR
+    return cents / CENTS_PER_DOLLAR
+
+
+def cents_to_str(cents):
+    # 2016 -> '20.16'
+    cents = int(cents)
+    return ('-' if cents < 0 else '') + '%d.%02d' % (abs(cents) // CENTS_PER_DOLLAR, abs(cents) % CENTS_PER_DOLLAR)
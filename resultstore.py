@@ -0,0 +1,288 @@
+"""
+persistent back test result store (SQLite)
+every run is stored under a run key, a digest of everything the result depends on: the config
+(strategies, parameters, execution model, symbols, date range, seed), the source code of the
+modules that produce the result, the indicator definitions and the content of every price file,
+running the same config on the same code and data again returns the stored result instead of
+simulating it
+
+summary values and performance metrics are table columns that can be queried and ranked across
+runs, the trade ledger (columnar .npz) and equity curve (float64) are stored as compressed blobs
+
+price file digests are remembered per file size and modification time, so working out the run
+key of a config does not read the price files again unless they changed
+
+runs of configs that draw random numbers without a random seed are never stored, they can not be
+repeated
+
+Tyler Pool
+2022
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import zlib
+from datetime import datetime
+import numpy as np
+import analytics
+import ledger
+import staticcache
+import staticdata
+import tables
+
+RESULT_STORE_FILE_NAME = 'output/results.sqlite'
+# modules whose code decides the result of a back test
+RESULT_SOURCE_MODULES = ('trader', 'tradeeval', 'buystrat', 'sellstrat', 'execution', 'fastbacktest', 'positions',
+                         'marketdata', 'pricestore', 'stockloader', 'staticdata', 'ledger', 'analytics')
+# trade evaluation strategies that only repeat with a random seed
+RANDOM_TRADE_EVAL_STRATS = ('eval_random',)
+# config settings that do not change the result (the sale type only changes position book lot accounting)
+RESULT_NEUTRAL_CONFIG_KEYS = ('quiet', 'load_workers', 'vectorized', 'sale_type')
+METRIC_COLUMNS = tuple(name.replace(' ', '_') for name in analytics.METRIC_NAMES)
+RUN_COLUMNS = (('run_key', 'TEXT PRIMARY KEY'),
+               ('created', 'TEXT'),
+               ('config', 'TEXT'),
+               ('trade_eval_strat', 'TEXT'),
+               ('buy_strat', 'TEXT'),
+               ('sell_strat', 'TEXT'),
+               ('execution_model', 'TEXT'),
+               ('random_seed', 'INTEGER'),
+               ('initial_cash_balance', 'REAL'),
+               ('first_trading_day', 'TEXT'),
+               ('last_trading_day', 'TEXT'),
+               ('simulation_days', 'INTEGER'),
+               ('cash_balance', 'REAL'),
+               ('final_balance', 'REAL'),
+               ('comparison_par_balance', 'REAL'),
+               ('trade_count', 'INTEGER'),
+               ('vectorized', 'INTEGER')) + tuple((name, 'REAL') for name in METRIC_COLUMNS)
+BLOB_COLUMNS = ('equity_curve', 'trade_ledger')
+
+
+# --- classes
+class StoredRun:
+    def __init__(self, row, equity_curve, trade_history):
+        # column name -> value of every summary and metric column
+        self.row = row
+        self.run_key = row['run_key']
+        self.equity_curve = equity_curve
+        self.trade_history = trade_history
+
+    def __repr__(self):
+        return ("Stored Run " + self.run_key + ": final balance = $" + str(self.row['final_balance']) +
+                ", trades = " + str(self.row['trade_count']))
+
+    def get_metrics(self):
+        # metric name -> value, same names as analytics.METRIC_NAMES
+        return {name: _get_float(self.row[column]) for name, column in zip(analytics.METRIC_NAMES, METRIC_COLUMNS)}
+
+
+class ResultStore:
+    def __init__(self, file_name=RESULT_STORE_FILE_NAME):
+        self.file_name = file_name
+        directory = os.path.dirname(file_name)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(file_name)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS runs (" +
+                                    ", ".join(name + " " + column_type for name, column_type in RUN_COLUMNS) +
+                                    ", " + ", ".join(name + " BLOB" for name in BLOB_COLUMNS) + ")")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS data_versions (file_name TEXT PRIMARY KEY, "
+                                    "size INTEGER, mtime_ns INTEGER, digest TEXT)")
+        self._source_digest = None
+
+    def __repr__(self):
+        return "Result Store: " + self.file_name + ", " + str(len(self)) + " runs"
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get_run_key(self, config, source_file_names):
+        # digest of the config, result source code and price file contents, None if the run can not be repeated
+        if config.random_seed is None and config.trade_eval_strat in RANDOM_TRADE_EVAL_STRATS:
+            return None
+        config_values = {key: value for key, value in vars(config).items() if key not in RESULT_NEUTRAL_CONFIG_KEYS}
+        config_values['execution_params'] = config.get_execution_params()
+        if config.trade_eval_strat not in RANDOM_TRADE_EVAL_STRATS:
+            # the seed does not change the result of deterministic strategies
+            config_values['random_seed'] = None
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(json.dumps(config_values, sort_keys=True, default=repr).encode())
+        digest.update(self.get_source_digest().encode())
+        digest.update(staticcache.get_indicator_signature(staticdata.get_indicator_definitions()).encode())
+        for source_file_name in source_file_names:
+            digest.update(source_file_name.encode())
+            digest.update(self.get_data_version(source_file_name).encode())
+        return digest.hexdigest()
+
+    def get_source_digest(self):
+        # digest of the result source modules, read once per store
+        if self._source_digest is None:
+            digest = hashlib.blake2b(digest_size=16)
+            module_path = os.path.dirname(os.path.abspath(__file__))
+            for module_name in RESULT_SOURCE_MODULES:
+                digest.update(module_name.encode())
+                digest.update(staticcache.get_source_digest(os.path.join(module_path, module_name + '.py')).encode())
+            self._source_digest = digest.hexdigest()
+        return self._source_digest
+
+    def get_data_version(self, source_file_name):
+        # content digest of a price file, recalculated only when its size or modification time changes
+        if not os.path.exists(source_file_name):
+            return 'missing'
+        size, mtime_ns = staticcache.get_source_fingerprint(source_file_name)
+        row = self.connection.execute("SELECT size, mtime_ns, digest FROM data_versions WHERE file_name = ?",
+                                      (source_file_name,)).fetchone()
+        if row is not None and row['size'] == size and row['mtime_ns'] == mtime_ns:
+            return row['digest']
+        source_digest = staticcache.get_source_digest(source_file_name)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO data_versions VALUES (?, ?, ?, ?)",
+                                    (source_file_name, size, mtime_ns, source_digest))
+        return source_digest
+
+    def load_run(self, run_key):
+        # StoredRun for the run key, None if the run is not stored
+        if run_key is None:
+            return None
+        row = self.connection.execute("SELECT * FROM runs WHERE run_key = ?", (run_key,)).fetchone()
+        if row is None:
+            return None
+        summary = {name: row[name] for name, column_type in RUN_COLUMNS}
+        equity_curve = np.frombuffer(zlib.decompress(row['equity_curve']), dtype='<f8').astype(np.float64)
+        trade_history = ledger.read_binary(io.BytesIO(zlib.decompress(row['trade_ledger'])))
+        return StoredRun(summary, equity_curve, trade_history)
+
+    def save_run(self, run_key, result, metrics=None):
+        # result is a trader.BacktestResult, metrics a dict of metric name -> value (see analytics.METRIC_NAMES)
+        if run_key is None:
+            return
+        if metrics is None:
+            metrics = {}
+        config = result.config
+        ledger_file = io.BytesIO()
+        result.trade_history.to_binary(ledger_file)
+        values = [run_key,
+                  datetime.now().isoformat(timespec='seconds'),
+                  repr(config),
+                  config.trade_eval_strat,
+                  config.buy_strat,
+                  config.sell_strat,
+                  config.execution_model,
+                  config.random_seed,
+                  config.initial_cash_balance,
+                  config.first_trading_day,
+                  config.last_trading_day,
+                  result.simulation_days,
+                  result.cash_balance,
+                  result.final_balance,
+                  result.comparison_par_balance,
+                  result.trade_count,
+                  int(result.vectorized)]
+        values.extend(_get_sql_value(metrics.get(name)) for name in analytics.METRIC_NAMES)
+        values.append(zlib.compress(np.asarray(result.equity_curve, dtype='<f8').tobytes()))
+        values.append(zlib.compress(ledger_file.getvalue()))
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO runs VALUES (" + ", ".join("?" * len(values)) + ")",
+                                    values)
+
+    def query_runs(self, order_by='final_balance', descending=True, limit=None, **filters):
+        # summary rows (dicts, no ledger or equity curve) of stored runs, filters are column = value
+        # e.g. query_runs('sharpe', limit=10, trade_eval_strat='moving_avg')
+        column_names = [name for name, column_type in RUN_COLUMNS]
+        for column_name in [order_by] + list(filters.keys()):
+            if column_name not in column_names:
+                raise ValueError("unknown result column: " + str(column_name))
+        query = "SELECT " + ", ".join(column_names) + " FROM runs"
+        if len(filters) > 0:
+            query += " WHERE " + " AND ".join(column_name + " = ?" for column_name in filters.keys())
+        query += " ORDER BY " + order_by + (" DESC" if descending else " ASC")
+        if limit is not None:
+            query += " LIMIT " + str(int(limit))
+        return [dict(row) for row in self.connection.execute(query, list(filters.values()))]
+
+    def delete_runs(self, **filters):
+        # remove stored runs matching every filter (all runs without filters), returns the number removed
+        column_names = [name for name, column_type in RUN_COLUMNS]
+        for column_name in filters.keys():
+            if column_name not in column_names:
+                raise ValueError("unknown result column: " + str(column_name))
+        query = "DELETE FROM runs"
+        if len(filters) > 0:
+            query += " WHERE " + " AND ".join(column_name + " = ?" for column_name in filters.keys())
+        with self.connection:
+            return self.connection.execute(query, list(filters.values())).rowcount
+
+
+# --- Functions
+def format_runs_table(run_rows):
+    columns = ['final balance', 'S&P 500 par', 'trades', 'trade eval', 'buy', 'sell', 'execution', 'seed', 'sharpe',
+               'max drawdown', 'created']
+    rows = []
+    for run_row in run_rows:
+        rows.append(['%.2f' % run_row['final_balance'],
+                     '%.2f' % _get_float(run_row['comparison_par_balance']),
+                     str(run_row['trade_count']),
+                     run_row['trade_eval_strat'],
+                     run_row['buy_strat'],
+                     run_row['sell_strat'],
+                     str(run_row['execution_model']),
+                     str(run_row['random_seed']),
+                     '%.4f' % _get_float(run_row['sharpe']),
+                     '%.4f' % _get_float(run_row['max_drawdown']),
+                     run_row['created']])
+    return tables.format_table(columns, rows)
+
+
+def _get_sql_value(value):
+    # NaN metrics (e.g. no benchmark) are stored as NULL
+    if value is None or np.isnan(value):
+        return None
+    return float(value)
+
+
+def _get_float(value):
+    return float('nan') if value is None else value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="list stored algorithmic trading back test results")
+    parser.add_argument('--store', default=RESULT_STORE_FILE_NAME)
+    parser.add_argument('--order-by', default='final_balance')
+    parser.add_argument('--ascending', action='store_true')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--trade-eval-strat', default=None)
+    parser.add_argument('--buy-strat', default=None)
+    parser.add_argument('--sell-strat', default=None)
+    parser.add_argument('--execution-model', default=None)
+    args = parser.parse_args(argv)
+
+    filters = {name: value for name, value in (('trade_eval_strat', args.trade_eval_strat),
+                                               ('buy_strat', args.buy_strat),
+                                               ('sell_strat', args.sell_strat),
+                                               ('execution_model', args.execution_model)) if value is not None}
+    with ResultStore(args.store) as store:
+        run_rows = store.query_runs(args.order_by, not args.ascending, args.limit, **filters)
+        print(format_runs_table(run_rows))
+        print(str(len(run_rows)) + " of " + str(len(store)) + " stored runs")
+    return run_rows
+
+
+# --- Main App ---
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,22 @@
 """
 sell strat module
+
+score array strategies pick the bottom k symbols by evaluation score (the top k of the negated
+scores, see buystrat.select_top_k) for a single day or for a whole (trading day x symbol)
+score matrix at once
 """
 
+import numpy as np
+import buystrat
+
+SIZING_RULES = ('fixed', 'all', 'fraction')
+
+# strategy name -> default parameters, any parameter can be overridden by the caller
+# k = max names sold per day, threshold = maximum score (exclusive) to sell
+# sizing = fixed (n_shares of each name), all (whole holding) or fraction (sell_fraction of the holding)
+SELL_STRATEGIES = {'lowscore': {'k': 1, 'threshold': 0.0, 'sizing': 'fixed', 'n_shares': 2, 'sell_fraction': 1.0},
+                   'bottomk': {'k': 20, 'threshold': 0.0, 'sizing': 'all', 'n_shares': 2, 'sell_fraction': 1.0}}
+
 
 def get_sell_order(strategy_name, trade_evaluation_scores):
     # for now, return buy order as simple dict with symbols for keys and qty to purchase as values
@@ -19,3 +34,64 @@ def get_sell_order(strategy_name, trade_evaluation_scores):
             n_shares = 2
             sell_order[score_symbol] = n_shares
     return sell_order
+
+
+def is_score_array_strategy(strategy_name):
+    return strategy_name in SELL_STRATEGIES
+
+
+def get_strategy_params(strategy_name, strategy_params=None):
+    params = dict(SELL_STRATEGIES[strategy_name])
+    if strategy_params:
+        params.update(strategy_params)
+    if params['sizing'] not in SIZING_RULES:
+        raise ValueError("unknown sell sizing rule: " + str(params['sizing']))
+    return params
+
+
+def needs_holdings(strategy_name, strategy_params=None):
+    return get_strategy_params(strategy_name, strategy_params)['sizing'] != 'fixed'
+
+
+def get_sell_order_from_scores(strategy_name, symbols, scores, holdings=None, strategy_params=None):
+    # scores and holdings (share qty held) are arrays aligned with symbols for a single trading day
+    # holdings are only needed by the all and fraction sizing rules
+    # returns sell order dict of symbol -> qty, lowest score first
+    params = get_strategy_params(strategy_name, strategy_params)
+    score_matrix = np.asarray(scores, dtype=np.float64).reshape(1, -1)
+    selected = select_bottom_k(score_matrix, params['k'], params['threshold'])
+    if params['sizing'] != 'fixed' and holdings is None:
+        raise ValueError(params['sizing'] + " sell sizing needs the current holdings")
+    qty = size_sell_orders(selected, holdings, params)[0]
+
+    sell_order = {}
+    order_ids = np.flatnonzero(qty > 0)
+    for symbol_id in order_ids[np.argsort(score_matrix[0, order_ids], kind='stable')].tolist():
+        sell_order[symbols[symbol_id]] = int(qty[symbol_id])
+    return sell_order
+
+
+def get_sell_order_schedule(strategy_name, score_matrix, strategy_params=None):
+    # precomputed sell orders for every trading day at once, only fixed sizing can be scheduled
+    # ahead because the other rules depend on holdings at the time of the sale
+    # returns (trading day x symbol) int64 matrix of qty to sell
+    params = get_strategy_params(strategy_name, strategy_params)
+    if params['sizing'] != 'fixed':
+        raise ValueError(params['sizing'] + " sell sizing depends on holdings and can not be scheduled ahead")
+    selected = select_bottom_k(np.asarray(score_matrix, dtype=np.float64), params['k'], params['threshold'])
+    return size_sell_orders(selected, None, params)
+
+
+def select_bottom_k(score_matrix, k, threshold):
+    # boolean (trading day x symbol) mask of the k lowest scores below threshold on each day
+    return buystrat.select_top_k(-score_matrix, k, -threshold)
+
+
+def size_sell_orders(selected, holdings, params):
+    sizing = params['sizing']
+    if sizing == 'fixed':
+        return np.where(selected, params['n_shares'], 0).astype(np.int64)
+    holdings = np.asarray(holdings, dtype=np.int64)
+    if sizing == 'all':
+        return np.where(selected, holdings, 0).astype(np.int64)
+    return np.where(selected, np.floor(holdings * params['sell_fraction']), 0).astype(np.int64)
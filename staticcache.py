@@ -0,0 +1,177 @@
+"""
+binary, memory mapped cache of price history and static data (technical analysis) fields
+
+cache file layout:
+    8 bytes   magic b'ATSDCACH'
+    4 bytes   format version (little endian uint32)
+    4 bytes   header length (little endian uint32)
+    n bytes   json header: symbol, row count, date range, indicator set and the
+              fingerprints of the source price file and the indicator definitions
+    padding   zero bytes up to the next DATA_ALIGNMENT boundary
+    columns   int64 date, int64 open cents, int64 close cents, int64 volume, then one float64
+              column per indicator in header order, each column is row count * 8 bytes
+
+files are mapped read only, so runs never parse the cache and concurrent runs share the
+same page cache pages
+
+Tyler Pool
+2022
+"""
+
+import hashlib
+import json
+import os
+import struct
+import numpy as np
+import pricestore
+import staticdata
+
+CACHE_MAGIC = b'ATSDCACH'
+CACHE_VERSION = 2
+CACHE_FILE_SUFFIX = ' SD.bin'
+DATA_ALIGNMENT = 64
+PREAMBLE_FORMAT = '<8sII'
+PRICE_COLUMN_DTYPES = (('date', np.int64),
+                       ('open', np.int64),
+                       ('close', np.int64),
+                       ('volume', np.int64))
+# digest of the staticdata module source, part of every indicator signature
+_staticdata_source_digest = None
+
+
+# --- classes
+class StaticCache:
+    def __init__(self, file_name, header, price_store):
+        self.file_name = file_name
+        self.header = header
+        self.price_store = price_store
+
+    def __repr__(self):
+        return "Static Cache: " + str(self.file_name)
+
+    def source_is_unchanged(self, source_fingerprint):
+        # cheap check, file size and modification time of the source price file
+        return (self.header['source_size'] == source_fingerprint[0] and
+                self.header['source_mtime_ns'] == source_fingerprint[1])
+
+    def source_digest_matches(self, source_digest):
+        return self.header['source_digest'] == source_digest
+
+    def indicators_are_valid(self, indicator_signature, row_count):
+        return (self.header['indicator_signature'] == indicator_signature and
+                self.header['rows'] == row_count)
+
+
+# --- Functions
+def get_cache_file_name(static_data_file_path, symbol):
+    return static_data_file_path + symbol + CACHE_FILE_SUFFIX
+
+
+def get_source_fingerprint(source_file_name):
+    stat_result = os.stat(source_file_name)
+    return stat_result.st_size, stat_result.st_mtime_ns
+
+
+def get_source_digest(source_file_name):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(source_file_name, 'rb') as source_file:
+        for chunk in iter(lambda: source_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_indicator_signature(indicator_definitions):
+    # changes whenever an indicator is added, removed, re-parameterised or its kernel code changes
+    # the staticdata source is part of it, kernels share helpers (RollingContext, window sums) whose
+    # changes do not show in the kernel's own code
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(get_staticdata_source_digest().encode())
+    for definition in indicator_definitions:
+        kernel = staticdata.INDICATOR_KERNELS[definition.kernel_name]
+        digest.update(repr((definition.name, definition.kernel_name, definition.window)).encode())
+        code = getattr(kernel, '__code__', None)
+        if code is not None:
+            digest.update(code.co_code)
+            digest.update(repr(code.co_consts).encode())
+    return digest.hexdigest()
+
+
+def get_staticdata_source_digest():
+    # read once per process, the staticdata module does not change while it is loaded
+    global _staticdata_source_digest
+    if _staticdata_source_digest is None:
+        _staticdata_source_digest = get_source_digest(staticdata.__file__)
+    return _staticdata_source_digest
+
+
+def read_static_cache(file_name):
+    # returns None when there is no usable cache file, the caller then rebuilds it
+    if not os.path.exists(file_name):
+        return None
+    try:
+        mapped_file = np.memmap(file_name, dtype=np.uint8, mode='r')
+    except (OSError, ValueError):
+        return None
+    preamble_size = struct.calcsize(PREAMBLE_FORMAT)
+    if len(mapped_file) < preamble_size:
+        return None
+    magic, version, header_length = struct.unpack(PREAMBLE_FORMAT, mapped_file[0:preamble_size].tobytes())
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        return None
+    try:
+        header = json.loads(mapped_file[preamble_size:preamble_size + header_length].tobytes().decode('utf-8'))
+    except ValueError:
+        return None
+
+    rows = header['rows']
+    offset = _get_data_offset(preamble_size + header_length)
+    if len(mapped_file) != offset + 8 * rows * (len(PRICE_COLUMN_DTYPES) + len(header['indicators'])):
+        return None
+    columns = []
+    for column_name, dtype in PRICE_COLUMN_DTYPES:
+        columns.append(mapped_file[offset:offset + 8 * rows].view(dtype))
+        offset += 8 * rows
+    price_store = pricestore.PriceStore(header['symbol'], *columns)
+    for indicator_name in header['indicators']:
+        price_store.set_indicator(indicator_name, mapped_file[offset:offset + 8 * rows].view(np.float64))
+        offset += 8 * rows
+
+    return StaticCache(file_name, header, price_store)
+
+
+def write_static_cache(file_name, price_store, source_fingerprint, source_digest, indicator_signature):
+    rows = len(price_store)
+    indicator_names = price_store.get_indicator_names()
+    header = {'symbol': price_store.symbol,
+              'rows': rows,
+              'first_date': price_store.get_date_str(0) if rows > 0 else '',
+              'last_date': price_store.get_date_str(rows - 1) if rows > 0 else '',
+              'indicators': indicator_names,
+              'indicator_signature': indicator_signature,
+              'source_size': source_fingerprint[0],
+              'source_mtime_ns': source_fingerprint[1],
+              'source_digest': source_digest}
+    header_bytes = json.dumps(header).encode('utf-8')
+    preamble = struct.pack(PREAMBLE_FORMAT, CACHE_MAGIC, CACHE_VERSION, len(header_bytes))
+    padding = _get_data_offset(len(preamble) + len(header_bytes)) - len(preamble) - len(header_bytes)
+
+    # write to a temporary file and swap it in, runs that already mapped the old file keep their pages
+    temp_file_name = file_name + '.' + str(os.getpid()) + '.tmp'
+    with open(temp_file_name, 'wb') as cache_file:
+        cache_file.write(preamble)
+        cache_file.write(header_bytes)
+        cache_file.write(b'\0' * padding)
+        cache_file.write(np.ascontiguousarray(price_store.dates, dtype=np.int64).tobytes())
+        cache_file.write(np.ascontiguousarray(price_store.open_cents, dtype=np.int64).tobytes())
+        cache_file.write(np.ascontiguousarray(price_store.close_cents, dtype=np.int64).tobytes())
+        cache_file.write(np.ascontiguousarray(price_store.volumes, dtype=np.int64).tobytes())
+        for indicator_name in indicator_names:
+            cache_file.write(np.ascontiguousarray(price_store.get_indicator(indicator_name),
+                                                  dtype=np.float64).tobytes())
+    os.replace(temp_file_name, file_name)
+
+    return header
+
+
+def _get_data_offset(header_end):
+    return (header_end + DATA_ALIGNMENT - 1) // DATA_ALIGNMENT * DATA_ALIGNMENT
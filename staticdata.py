@@ -2,38 +2,344 @@
 module for generating data fields that can be derived for every trading day
 and do not rely on inputs from trading simulation
 
+indicators are registered by name against a rolling window kernel, every kernel works on
+trailing windows only (the value for day i never uses closing prices after day i) and
+days without a full window of history are given a value of 0.0
+
+every kernel also has an incremental version that takes one new close per symbol at a time
+(streaming / paper trading), it keeps running totals instead of the whole history and performs
+the same float operations as the array kernel so both give the same values
+
 Tyler Pool
 2022
 """
 
+import numpy as np
+
+
+# --- classes
+class IndicatorDefinition:
+    def __init__(self, name, kernel_name, window):
+        self.name = name
+        self.kernel_name = kernel_name
+        self.window = window
+
+    def __repr__(self):
+        return self.name + " = " + self.kernel_name + "(" + str(self.window) + ")"
+
+
+class RollingContext:
+    # shared intermediate arrays for a single close price column
+    # cumulative sums are built once on first use and reused by every kernel that needs them
+    def __init__(self, closes):
+        self.closes = np.asarray(closes, dtype=np.float64)
+        self._cumsum = None
+        self._cumsum_sq = None
+        self._cumsum_gain = None
+        self._cumsum_loss = None
+
+    def __len__(self):
+        return len(self.closes)
+
+    def get_cumsum(self):
+        if self._cumsum is None:
+            self._cumsum = _padded_cumsum(self.closes)
+        return self._cumsum
+
+    def get_cumsum_sq(self):
+        if self._cumsum_sq is None:
+            self._cumsum_sq = _padded_cumsum(self.closes * self.closes)
+        return self._cumsum_sq
+
+    def get_cumsum_gain_loss(self):
+        if self._cumsum_gain is None:
+            changes = np.diff(self.closes, prepend=self.closes[:1])
+            self._cumsum_gain = _padded_cumsum(np.maximum(changes, 0.0))
+            self._cumsum_loss = _padded_cumsum(np.maximum(-changes, 0.0))
+        return self._cumsum_gain, self._cumsum_loss
+
+
+class RunningWindowSum:
+    # running total of a value for each symbol plus the totals of the last window days, so every
+    # update gives the trailing window sum exactly as the padded cumsum of the array kernels would
+    def __init__(self, symbol_count, window):
+        self.window = window
+        # values added per symbol
+        self.counts = np.zeros(symbol_count, dtype=np.int64)
+        self._totals = np.zeros(symbol_count)
+        self._ring = np.zeros((max(window, 1), symbol_count))
+
+    def update(self, symbol_ids, values):
+        # window sums for symbol_ids, only full windows (counts >= window) are meaningful
+        slots = (self.counts[symbol_ids] + 1) % self.window
+        totals = self._totals[symbol_ids] + values
+        window_sums = totals - self._ring[slots, symbol_ids]
+        self._totals[symbol_ids] = totals
+        self._ring[slots, symbol_ids] = totals
+        self.counts[symbol_ids] += 1
+        return window_sums
+
+
+class IncrementalSma:
+    def __init__(self, symbol_count, window):
+        self.window = window
+        # latest value for every symbol
+        self.values = np.zeros(symbol_count)
+        self._sums = RunningWindowSum(symbol_count, window)
+
+    def update(self, symbol_ids, closes):
+        if self.window <= 0:
+            return
+        window_sums = self._sums.update(symbol_ids, closes)
+        self.values[symbol_ids] = np.where(self._sums.counts[symbol_ids] >= self.window,
+                                           window_sums / self.window, 0.0)
+
+
+class IncrementalEma:
+    def __init__(self, symbol_count, window):
+        self.window = window
+        self.values = np.zeros(symbol_count)
+        self._counts = np.zeros(symbol_count, dtype=np.int64)
+        self._seed_sums = np.zeros(symbol_count)
+
+    def update(self, symbol_ids, closes):
+        if self.window <= 0:
+            return
+        alpha = 2.0 / (self.window + 1.0)
+        counts = self._counts[symbol_ids] + 1
+        self._counts[symbol_ids] = counts
+        self._seed_sums[symbol_ids] += np.where(counts <= self.window, closes, 0.0)
+        values = self.values[symbol_ids]
+        values = np.where(counts == self.window, self._seed_sums[symbol_ids] / self.window, values)
+        self.values[symbol_ids] = np.where(counts > self.window, values + alpha * (closes - values), values)
+
+
+class IncrementalRollingStd:
+    def __init__(self, symbol_count, window):
+        self.window = window
+        self.values = np.zeros(symbol_count)
+        self._sums = RunningWindowSum(symbol_count, window)
+        self._sums_sq = RunningWindowSum(symbol_count, window)
+
+    def update(self, symbol_ids, closes):
+        if self.window <= 0:
+            return
+        mean = self._sums.update(symbol_ids, closes) / self.window
+        mean_sq = self._sums_sq.update(symbol_ids, closes * closes) / self.window
+        self.values[symbol_ids] = np.where(self._sums.counts[symbol_ids] >= self.window,
+                                           np.sqrt(np.maximum(mean_sq - mean * mean, 0.0)), 0.0)
+
+
+class IncrementalRsi:
+    def __init__(self, symbol_count, window):
+        self.window = window
+        self.values = np.zeros(symbol_count)
+        self._last_closes = np.zeros(symbol_count)
+        self._gains = RunningWindowSum(symbol_count, window)
+        self._losses = RunningWindowSum(symbol_count, window)
+
+    def update(self, symbol_ids, closes):
+        if self.window <= 0:
+            return
+        # the first close of a symbol has no change
+        changes = np.where(self._gains.counts[symbol_ids] > 0, closes - self._last_closes[symbol_ids], 0.0)
+        self._last_closes[symbol_ids] = closes
+        avg_gain = self._gains.update(symbol_ids, np.maximum(changes, 0.0)) / self.window
+        avg_loss = self._losses.update(symbol_ids, np.maximum(-changes, 0.0)) / self.window
+        total = avg_gain + avg_loss
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi_values = np.where(total > 0.0, 100.0 * avg_gain / total, 50.0)
+        self.values[symbol_ids] = np.where(self._gains.counts[symbol_ids] > self.window, rsi_values, 0.0)
+
+
+class IncrementalKernelHistory:
+    # fallback for kernels without an incremental version, keeps each symbol's closes and
+    # recalculates the kernel over them on every update (not constant time)
+    def __init__(self, symbol_count, window, kernel):
+        self.window = window
+        self.kernel = kernel
+        self.values = np.zeros(symbol_count)
+        self._closes = [[] for symbol_id in range(symbol_count)]
+
+    def update(self, symbol_ids, closes):
+        for symbol_id, close in zip(np.asarray(symbol_ids).tolist(), np.asarray(closes).tolist()):
+            self._closes[symbol_id].append(close)
+            self.values[symbol_id] = self.kernel(RollingContext(self._closes[symbol_id]), self.window)[-1]
+
+
+# --- Functions
+# --- --- Kernels
+# every kernel takes a RollingContext and a window length and returns one float64 value per day
+def sma(context, window):
+    output = np.zeros(len(context))
+    if 0 < window <= len(context):
+        output[window - 1:] = _window_sums(context.get_cumsum(), window) / window
+    return output
 
-def get_static_data_fields(stock_data_history_obj,
-                           number_of_trading_days):
 
-    trading_day_object_list = stock_data_history_obj.trading_day_object_list
+def ema(context, window):
+    # exponential moving avg seeded with the simple moving avg of the first full window
+    output = np.zeros(len(context))
+    if 0 < window <= len(context):
+        alpha = 2.0 / (window + 1.0)
+        closes = context.closes.tolist()
+        value = sum(closes[0:window]) / window
+        values = [value]
+        for close in closes[window:]:
+            value += alpha * (close - value)
+            values.append(value)
+        output[window - 1:] = values
+    return output
 
-    # date column
-    for trading_day_obj in trading_day_object_list:
-        trading_day_obj.technical_analysis_data['date'] = trading_day_obj.date
 
-    # 15 day moving avg
-    moving_avg_length = 15
-    for i in range(number_of_trading_days):
-        if i > moving_avg_length:
-            closing_price_from_all_days = stock_data_history_obj.get_closing_prices()
-            moving_avg = sum(closing_price_from_all_days[i:i + moving_avg_length]) / moving_avg_length
-            trading_day_object_list[i].technical_analysis_data['15_day_moving_avg'] = moving_avg
+def rolling_std(context, window):
+    # population standard deviation of closing prices over the trailing window
+    output = np.zeros(len(context))
+    if 0 < window <= len(context):
+        mean = _window_sums(context.get_cumsum(), window) / window
+        mean_sq = _window_sums(context.get_cumsum_sq(), window) / window
+        output[window - 1:] = np.sqrt(np.maximum(mean_sq - mean * mean, 0.0))
+    return output
+
+
+def rsi(context, window):
+    # relative strength index using simple (Cutler) averages of gains and losses over the
+    # trailing window, so it stays a pure rolling window calculation
+    output = np.zeros(len(context))
+    if 0 < window < len(context):
+        cumsum_gain, cumsum_loss = context.get_cumsum_gain_loss()
+        avg_gain = _window_sums(cumsum_gain, window)[1:] / window
+        avg_loss = _window_sums(cumsum_loss, window)[1:] / window
+        total = avg_gain + avg_loss
+        with np.errstate(divide='ignore', invalid='ignore'):
+            output[window:] = np.where(total > 0.0, 100.0 * avg_gain / total, 50.0)
+    return output
+
+
+INDICATOR_KERNELS = {'sma': sma,
+                     'ema': ema,
+                     'rolling_std': rolling_std,
+                     'rsi': rsi}
+# kernel name -> incremental version of the kernel, created with (symbol count, window)
+INCREMENTAL_KERNELS = {'sma': IncrementalSma,
+                       'ema': IncrementalEma,
+                       'rolling_std': IncrementalRollingStd,
+                       'rsi': IncrementalRsi}
+
+_registered_indicators = {}
+
+
+# --- --- Registry
+def register_indicator(name: str, kernel_name: str, window: int):
+    if kernel_name not in INDICATOR_KERNELS:
+        raise ValueError("unknown indicator kernel: " + str(kernel_name))
+    if name == 'date':
+        raise ValueError("date is reserved for the trading day date column")
+    _registered_indicators[name] = IndicatorDefinition(name, kernel_name, int(window))
+
+
+def unregister_indicator(name: str):
+    del _registered_indicators[name]
+
+
+def register_indicator_kernel(kernel_name: str, kernel, incremental=None):
+    # incremental is a class like IncrementalSma, without one streaming recalculates the kernel every update
+    INDICATOR_KERNELS[kernel_name] = kernel
+    if incremental is not None:
+        INCREMENTAL_KERNELS[kernel_name] = incremental
+    else:
+        INCREMENTAL_KERNELS.pop(kernel_name, None)
+
+
+def get_indicator_names():
+    return list(_registered_indicators.keys())
+
+
+def get_indicator_definitions():
+    return list(_registered_indicators.values())
+
+
+# --- --- Calculation
+def compute_indicators(closes, indicator_definitions=None):
+    # calculate every registered indicator from a single close price column
+    if indicator_definitions is None:
+        indicator_definitions = get_indicator_definitions()
+    context = RollingContext(closes)
+    indicator_columns = {}
+    for definition in indicator_definitions:
+        indicator_columns[definition.name] = INDICATOR_KERNELS[definition.kernel_name](context,
+                                                                                       definition.window)
+    return indicator_columns
+
+
+def extend_indicators(closes, indicator_columns, computed_rows, indicator_definitions=None):
+    # extend indicator columns computed for the first computed_rows closes to cover every close
+    # the result is exactly what compute_indicators gives for all the closes, so a cache extended with
+    # new rows and one rebuilt from the same price file hold the same values: ema carries on from its
+    # last value (the same float operations as the full pass), every other kernel is recalculated over
+    # the whole history, its cumulative sums must start at the first close like the full pass ones
+    if indicator_definitions is None:
+        indicator_definitions = get_indicator_definitions()
+    closes = np.asarray(closes, dtype=np.float64)
+    context = RollingContext(closes)
+    extended_columns = {}
+    for definition in indicator_definitions:
+        kernel = INDICATOR_KERNELS[definition.kernel_name]
+        old_column = np.asarray(indicator_columns[definition.name], dtype=np.float64)[0:computed_rows]
+        if definition.kernel_name == 'ema' and computed_rows >= definition.window > 0:
+            alpha = 2.0 / (definition.window + 1.0)
+            value = float(old_column[-1])
+            values = []
+            for close in closes[computed_rows:].tolist():
+                value += alpha * (close - value)
+                values.append(value)
+            new_values = np.array(values, dtype=np.float64)
         else:
-            trading_day_object_list[i].technical_analysis_data['15_day_moving_avg'] = 0.0
-
-    # 50 day moving avg
-    moving_avg_length = 50
-    for i in range(number_of_trading_days):
-        if i > moving_avg_length:
-            closing_price_from_all_days = stock_data_history_obj.get_closing_prices()
-            moving_avg = sum(closing_price_from_all_days[i:i + moving_avg_length]) / moving_avg_length
-            trading_day_object_list[i].technical_analysis_data['50_day_moving_avg'] = moving_avg
+            new_values = kernel(context, definition.window)[computed_rows:]
+        extended_columns[definition.name] = np.concatenate((old_column, new_values))
+    return extended_columns
+
+
+def create_incremental_indicators(symbol_count, indicator_definitions=None):
+    # indicator name -> incremental indicator state for symbol_count symbols
+    if indicator_definitions is None:
+        indicator_definitions = get_indicator_definitions()
+    incremental_indicators = {}
+    for definition in indicator_definitions:
+        incremental_kernel = INCREMENTAL_KERNELS.get(definition.kernel_name)
+        if incremental_kernel is not None:
+            incremental_indicators[definition.name] = incremental_kernel(symbol_count, definition.window)
         else:
-            trading_day_object_list[i].technical_analysis_data['50_day_moving_avg'] = 0.0
+            incremental_indicators[definition.name] = IncrementalKernelHistory(symbol_count, definition.window,
+                                                                               INDICATOR_KERNELS[definition.kernel_name])
+    return incremental_indicators
+
+
+def get_static_data_fields(stock_data_history_obj,
+                           number_of_trading_days):
+
+    price_store = stock_data_history_obj.price_store
+    closing_price_from_all_days = stock_data_history_obj.get_closing_prices()[0:number_of_trading_days]
+
+    for name, column in compute_indicators(closing_price_from_all_days).items():
+        price_store.set_indicator(name, column)
+
+    return stock_data_history_obj.trading_day_object_list
+
+
+def _padded_cumsum(values):
+    output = np.zeros(len(values) + 1)
+    np.cumsum(values, out=output[1:])
+    return output
+
+
+def _window_sums(padded_cumsum, window):
+    # sum of each full trailing window, first entry is the window ending on day window - 1
+    return padded_cumsum[window:] - padded_cumsum[:-window]
+
 
-    return trading_day_object_list
+# --- default indicators
+register_indicator('15_day_moving_avg', 'sma', 15)
+register_indicator('50_day_moving_avg', 'sma', 50)
+# SPY 200 day moving avg used by the meb faber indicator
+register_indicator('200_day_moving_avg', 'sma', 200)
@@ -0,0 +1,123 @@
+"""
+streaming loader for Yahoo finance historical data csv files
+rows are parsed straight from fixed size binary chunks into typed columns (prices as int64
+cents), there is no list of row strings for the whole file, and a scan can start part way through the file so rows
+appended since the last load are the only rows parsed
+
+historical data csv file format:
+columns: 0=date, 1=open, 2=high, 3=low, 4=close, 5=adj close, 6=volume
+0 row is column titles
+
+Tyler Pool
+2022
+"""
+
+from array import array
+import hashlib
+import numpy as np
+import pricestore
+
+CHUNK_SIZE = 1 << 20
+FILE_COLUMN_WIDTH = 7
+
+
+# --- classes
+class PriceFileScan:
+    def __init__(self, symbol, dates, open_cents, close_cents, volumes, source_size, source_digest, prefix_digest,
+                 skipped_rows):
+        self.symbol = symbol
+        self.dates = dates
+        self.open_cents = open_cents
+        self.close_cents = close_cents
+        self.volumes = volumes
+        self.source_size = source_size
+        # digest of the whole file and of the first prefix_length bytes (None if no prefix was requested)
+        self.source_digest = source_digest
+        self.prefix_digest = prefix_digest
+        # rows with the wrong number of columns or missing ('null') values
+        self.skipped_rows = skipped_rows
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __repr__(self):
+        return ("Price File Scan for: " + str(self.symbol) + " (" + str(len(self)) + " rows, " +
+                str(self.skipped_rows) + " skipped)")
+
+    def get_price_store(self):
+        return pricestore.PriceStore(self.symbol, self.dates, self.open_cents, self.close_cents, self.volumes)
+
+
+# --- Functions
+def scan_price_file(symbol, file_name, parse_from=0, prefix_length=None, chunk_size=CHUNK_SIZE):
+    # parse rows starting at byte offset parse_from (0 = whole file, header row skipped) and digest the
+    # whole file in the same pass, prefix_length asks for an extra digest of the file's first bytes so
+    # callers can confirm a file was only appended to since it was last loaded
+    digest = hashlib.blake2b(digest_size=16)
+    prefix_digest = None
+    dates = array('q')
+    open_cents = array('q')
+    close_cents = array('q')
+    volumes = array('q')
+    skipped_rows = 0
+    position = 0
+    partial_line = b''
+    skip_header = parse_from == 0
+
+    with open(file_name, 'rb') as source_file:
+        for chunk in iter(lambda: source_file.read(chunk_size), b''):
+            chunk_end = position + len(chunk)
+            if prefix_length is not None and prefix_digest is None and chunk_end >= prefix_length:
+                digest.update(chunk[0:prefix_length - position])
+                prefix_digest = digest.copy().hexdigest()
+                digest.update(chunk[prefix_length - position:])
+            else:
+                digest.update(chunk)
+            if chunk_end > parse_from:
+                parse_chunk = chunk[max(parse_from - position, 0):]
+                lines = (partial_line + parse_chunk).split(b'\n')
+                partial_line = lines.pop()
+                for line in lines:
+                    if skip_header:
+                        skip_header = False
+                        continue
+                    skipped_rows += _parse_row(line, dates, open_cents, close_cents, volumes)
+            position = chunk_end
+    if partial_line.strip() and not skip_header:
+        # last row without a trailing new line
+        skipped_rows += _parse_row(partial_line, dates, open_cents, close_cents, volumes)
+    if prefix_length is not None and prefix_digest is None and position == prefix_length:
+        prefix_digest = digest.hexdigest()
+
+    return PriceFileScan(symbol,
+                         np.frombuffer(dates, dtype=np.int64),
+                         np.frombuffer(open_cents, dtype=np.int64),
+                         np.frombuffer(close_cents, dtype=np.int64),
+                         np.frombuffer(volumes, dtype=np.int64),
+                         position,
+                         digest.hexdigest(),
+                         prefix_digest,
+                         skipped_rows)
+
+
+def _parse_row(line, dates, open_cents, close_cents, volumes):
+    # appends one row to the columns, returns 1 if the row was skipped
+    line = line.strip()
+    if not line:
+        return 0
+    fields = line.split(b',')
+    if len(fields) != FILE_COLUMN_WIDTH:
+        return 1
+    try:
+        date = pricestore.date_str_to_int(fields[0].decode('ascii'))
+        open_price = pricestore.price_bytes_to_cents(fields[1])
+        close_price = pricestore.price_bytes_to_cents(fields[4])
+        volume = int(fields[6])
+    except ValueError:
+        # Yahoo writes 'null' for every price column on days without data
+        return 1
+    dates.append(date)
+    open_cents.append(open_price)
+    close_cents.append(close_price)
+    volumes.append(volume)
+    return 0
@@ -0,0 +1,300 @@
+"""
+streaming (bar by bar) trading engine for paper trading and replayed back tests
+
+the engine takes one new bar per symbol for each trading day, updates the indicators
+incrementally (running totals, constant time per bar), scores the day with TradeEvalObj and
+places the buy / sell strategy orders against a persistent Portfolio, the same Portfolio order
+code the event loop back test uses
+
+CsvReplaySource streams the price csv files day by day, optionally paced in real time, so a
+replayed run goes through exactly the same code as paper trading, replayed runs of
+deterministic strategies match the batch back test (eval_random draws its random numbers one
+day at a time here, so its scores differ from the batch run for the same seed)
+
+Tyler Pool
+2022
+"""
+
+import argparse
+import time
+import numpy as np
+import ledger
+import marketdata
+import pricestore
+import staticdata
+import stockloader
+import tradeeval
+import trader
+
+INITIAL_CAPACITY = 256
+
+
+# --- classes
+class Bar:
+    __slots__ = ('symbol', 'date', 'open_cents', 'close_cents', 'volume')
+
+    def __init__(self, symbol, date, open_cents, close_cents, volume):
+        self.symbol = symbol
+        # YYYYMMDD int
+        self.date = date
+        self.open_cents = open_cents
+        self.close_cents = close_cents
+        self.volume = volume
+
+    def __repr__(self):
+        return ("Bar: " + str(self.symbol) + " " + pricestore.date_int_to_str(self.date) +
+                " open = $" + pricestore.cents_to_str(self.open_cents) +
+                " close = $" + pricestore.cents_to_str(self.close_cents) + " volume = " + str(self.volume))
+
+
+class Order:
+    # filled order placed by the engine for one bar
+    __slots__ = ('day', 'symbol', 'side', 'qty', 'price_cents')
+
+    def __init__(self, day, symbol, side, qty, price_cents):
+        self.day = day
+        self.symbol = symbol
+        self.side = side
+        self.qty = qty
+        self.price_cents = price_cents
+
+    def __repr__(self):
+        return ("Order: Day " + str(self.day) + " " + ledger.SIDE_NAMES[self.side] + " " + str(self.qty) +
+                " x " + str(self.symbol) + " @ $" + pricestore.cents_to_str(self.price_cents))
+
+
+class StreamingMarketData(marketdata.MarketData):
+    # MarketData that grows one trading day at a time, the aligned arrays are views into
+    # preallocated buffers that double in size when full, missing bars are carried forward
+    # from the symbol's last bar the same way MarketData aligns a loaded history
+    def __init__(self, symbols, initial_capacity=INITIAL_CAPACITY):
+        self.stock_history_data_object_list = []
+        self.symbols = list(symbols)
+        self.symbol_index = {symbol: symbol_id for symbol_id, symbol in enumerate(self.symbols)}
+        self.price_stores = []
+        self.simulation_days = 0
+        self._indicator_matrices = {}
+        self.parent = None
+        self.first_day = 0
+        # bars received per symbol, the next bar's row in that symbol's own history
+        self._bar_counts = np.zeros(len(self.symbols), dtype=np.int64)
+        symbol_count = len(self.symbols)
+        capacity = max(initial_capacity, 1)
+        self._buffers = {'calendar': np.zeros(capacity, dtype=np.int64),
+                         'row_index': np.full((capacity, symbol_count), -1, dtype=np.int64),
+                         'available': np.zeros((capacity, symbol_count), dtype=bool),
+                         'dates': np.zeros((capacity, symbol_count), dtype=np.int64),
+                         'open_cents': np.zeros((capacity, symbol_count), dtype=np.int64),
+                         'close_cents': np.zeros((capacity, symbol_count), dtype=np.int64),
+                         'opens': np.zeros((capacity, symbol_count), dtype=np.float64),
+                         'closes': np.zeros((capacity, symbol_count), dtype=np.float64),
+                         'volumes': np.zeros((capacity, symbol_count), dtype=np.int64)}
+        self._set_views()
+
+    def append_day(self, date, symbol_ids, open_cents, close_cents, volumes):
+        # adds a trading day with bars for symbol_ids, returns the new trading day index
+        if self.simulation_days > 0 and date <= self.calendar[-1]:
+            raise ValueError("bars must arrive in date order, " + pricestore.date_int_to_str(date) +
+                             " is not after " + pricestore.date_int_to_str(self.calendar[-1]))
+        day = self.simulation_days
+        if day == len(self._buffers['calendar']):
+            self._grow()
+        buffers = self._buffers
+        if day > 0:
+            for name in ('row_index', 'dates', 'open_cents', 'close_cents', 'opens', 'closes'):
+                buffers[name][day] = buffers[name][day - 1]
+        buffers['calendar'][day] = date
+        buffers['row_index'][day, symbol_ids] = self._bar_counts[symbol_ids]
+        buffers['available'][day, symbol_ids] = True
+        buffers['dates'][day, symbol_ids] = date
+        buffers['open_cents'][day, symbol_ids] = open_cents
+        buffers['close_cents'][day, symbol_ids] = close_cents
+        buffers['opens'][day, symbol_ids] = pricestore.cents_to_dollars(np.asarray(open_cents, dtype=np.int64))
+        buffers['closes'][day, symbol_ids] = pricestore.cents_to_dollars(np.asarray(close_cents, dtype=np.int64))
+        buffers['volumes'][day, symbol_ids] = volumes
+        self._bar_counts[symbol_ids] += 1
+        self.simulation_days += 1
+        self._set_views()
+        return day
+
+    def _set_views(self):
+        for name, buffer in self._buffers.items():
+            setattr(self, name, buffer[0:self.simulation_days])
+
+    def _grow(self):
+        for name, buffer in self._buffers.items():
+            new_buffer = np.zeros((len(buffer) * 2,) + buffer.shape[1:], dtype=buffer.dtype)
+            new_buffer[0:self.simulation_days] = buffer[0:self.simulation_days]
+            self._buffers[name] = new_buffer
+
+
+class StreamingEngine:
+    def __init__(self, config: trader.BacktestConfig, symbols=None):
+        if symbols is None:
+            symbols = config.ticker_symbol_list
+        self.config = config
+        self.market_data = StreamingMarketData(symbols)
+        # indicator name -> incremental indicator, values hold the latest value for every symbol
+        self.indicators = staticdata.create_incremental_indicators(len(self.market_data.symbols))
+        self.eval_obj = tradeeval.TradeEvalObj(config.random_seed)
+        self.portfolio = trader.Portfolio(config.initial_cash_balance,
+                                          config.buy_strat,
+                                          config.sell_strat,
+                                          self.market_data.symbols,
+                                          config.buy_params,
+                                          config.sell_params,
+                                          config.get_execution_params(),
+                                          config.sale_type)
+        self.equity_curve = []
+
+    def __repr__(self):
+        return ("Streaming Engine: " + str(self.market_data.simulation_days) + " trading days, " +
+                str(len(self.portfolio.trade_history)) + " trades")
+
+    def on_bars(self, date, bars):
+        # one trading day of bars (at most one per symbol), returns the orders filled for the day
+        if isinstance(date, str):
+            date = pricestore.date_str_to_int(date)
+        bar_list = list(bars)
+        symbol_index = self.market_data.symbol_index
+        symbol_ids = np.fromiter((symbol_index[bar.symbol] for bar in bar_list), dtype=np.int64, count=len(bar_list))
+        return self.on_bar_arrays(date,
+                                  symbol_ids,
+                                  np.fromiter((bar.open_cents for bar in bar_list), dtype=np.int64, count=len(bar_list)),
+                                  np.fromiter((bar.close_cents for bar in bar_list), dtype=np.int64, count=len(bar_list)),
+                                  np.fromiter((bar.volume for bar in bar_list), dtype=np.int64, count=len(bar_list)))
+
+    def on_bar_arrays(self, date, symbol_ids, open_cents, close_cents, volumes):
+        # array version of on_bars, values aligned with symbol_ids (market data symbol ids)
+        market_data = self.market_data
+        day = market_data.append_day(date, symbol_ids, open_cents, close_cents, volumes)
+        closes = market_data.closes[day, symbol_ids]
+        for indicator in self.indicators.values():
+            indicator.update(symbol_ids, closes)
+
+        indicator_rows = {name: indicator.values[np.newaxis, :] for name, indicator in self.indicators.items()}
+        day_scores = self.eval_obj.eval_trade_batch(self.config.trade_eval_strat, indicator_rows)[0]
+        # symbols without a bar today are skipped by the strategies
+        day_scores = np.where(market_data.available[day], day_scores, np.nan)
+
+        first_trade = len(self.portfolio.trade_history)
+        # orders placed on the previous day that fill at today's open
+        self.portfolio.fill_pending_orders(market_data, day)
+        # sales first to maximize potential cash to buy, same order as the back test
+        self.portfolio.execute_sell_strategy(day_scores, market_data, day)
+        self.portfolio.execute_buy_strategy(day_scores, market_data, day)
+        self.equity_curve.append(market_data.mark_to_market(self.portfolio, day))
+        return self.get_orders(first_trade)
+
+    def get_orders(self, first_trade=0):
+        trade_history = self.portfolio.trade_history
+        columns = trade_history.get_columns()
+        return [Order(day, symbol, side, qty, price_cents)
+                for day, symbol, side, qty, price_cents in zip(columns['day'][first_trade:].tolist(),
+                                                               trade_history.get_trade_symbols()[first_trade:],
+                                                               columns['side'][first_trade:].tolist(),
+                                                               columns['qty'][first_trade:].tolist(),
+                                                               columns['price'][first_trade:].tolist())]
+
+    def get_result(self, print_to_console=False):
+        # back test result for the days streamed so far, the S&P 500 par comes from the streamed SPY prices
+        if self.market_data.simulation_days == 0:
+            raise ValueError("no bars have been streamed")
+        last_day = self.market_data.simulation_days - 1
+        return trader.report_back_test(self.config,
+                                       self.market_data,
+                                       self.portfolio.trade_history,
+                                       self.portfolio.cash_cents,
+                                       self.market_data.get_position_value_cents(self.portfolio.position_book, last_day),
+                                       np.array(self.equity_curve),
+                                       False,
+                                       print_to_console)
+
+
+class CsvReplaySource:
+    # streams the price csv files of the config symbols one trading day at a time
+    # days_per_second paces the replay in real time, None replays as fast as possible
+    def __init__(self, config: trader.BacktestConfig, days_per_second=None, symbols=None):
+        if symbols is None:
+            symbols = config.ticker_symbol_list
+        self.symbols = list(symbols)
+        self.stock_data_file_path = config.stock_data_file_path
+        self.days_per_second = days_per_second
+
+    def __repr__(self):
+        return "Csv Replay Source: " + str(len(self.symbols)) + " symbols"
+
+    def __iter__(self):
+        # yields (YYYYMMDD date, list of Bar) for every trading day in the master calendar
+        scans = [stockloader.scan_price_file(symbol, self.stock_data_file_path + symbol + trader.FILE_EXTENSION_TYPE)
+                 for symbol in self.symbols]
+        calendar = marketdata.get_trading_calendar(scans)
+        # (trading day x symbol) row of each symbol's bar, -1 if the symbol has no bar that day
+        bar_rows = np.full((len(calendar), len(scans)), -1, dtype=np.int64)
+        for symbol_id, scan in enumerate(scans):
+            bar_rows[np.searchsorted(calendar, scan.dates), symbol_id] = np.arange(len(scan))
+        start_time = time.perf_counter()
+        for day, date in enumerate(calendar.tolist()):
+            if self.days_per_second:
+                delay = start_time + day / self.days_per_second - time.perf_counter()
+                if delay > 0.0:
+                    time.sleep(delay)
+            bars = []
+            for symbol_id, row in enumerate(bar_rows[day].tolist()):
+                if row >= 0:
+                    scan = scans[symbol_id]
+                    bars.append(Bar(scan.symbol, date, int(scan.open_cents[row]), int(scan.close_cents[row]),
+                                    int(scan.volumes[row])))
+            yield date, bars
+
+
+# --- Functions
+def run_replay(config: trader.BacktestConfig, days_per_second=None, print_to_console=False):
+    # replays the config's price files through the streaming engine and reports it like a back test
+    engine = StreamingEngine(config)
+    for date, bars in CsvReplaySource(config, days_per_second):
+        orders = engine.on_bars(date, bars)
+        if print_to_console and not config.quiet:
+            for order in orders:
+                print(pricestore.date_int_to_str(date) + " " + repr(order))
+    return engine.get_result(print_to_console)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="replay price files through the streaming (paper trading) engine")
+    parser.add_argument('--trade-eval-strat', default=trader.TRADE_EVAL_STRAT)
+    parser.add_argument('--buy-strat', default=trader.BUY_STRAT)
+    parser.add_argument('--sell-strat', default=trader.SELL_STRAT)
+    parser.add_argument('--initial-cash-balance', type=float, default=trader.INITIAL_CASH_BALANCE)
+    parser.add_argument('--random-seed', type=int, default=None)
+    parser.add_argument('--symbols', nargs='+', default=None)
+    parser.add_argument('--days-per-second', type=float, default=None, help="replay speed (default: no pacing)")
+    parser.add_argument('--quiet', action='store_true', help="do not print every order")
+    args = parser.parse_args(argv)
+
+    config = trader.BacktestConfig(trade_eval_strat=args.trade_eval_strat,
+                                   buy_strat=args.buy_strat,
+                                   sell_strat=args.sell_strat,
+                                   ticker_symbol_list=args.symbols,
+                                   initial_cash_balance=args.initial_cash_balance,
+                                   random_seed=args.random_seed,
+                                   quiet=args.quiet)
+    engine = StreamingEngine(config)
+    bar_latency = []
+    for date, bars in CsvReplaySource(config, args.days_per_second):
+        start = time.perf_counter()
+        orders = engine.on_bars(date, bars)
+        bar_latency.append(time.perf_counter() - start)
+        if not config.quiet:
+            for order in orders:
+                print(pricestore.date_int_to_str(date) + " " + repr(order))
+    result = engine.get_result(True)
+    if len(bar_latency) > 0:
+        print("per day latency: mean = " + '%.1f' % (1e6 * np.mean(bar_latency)) + " us, max = " +
+              '%.1f' % (1e6 * np.max(bar_latency)) + " us")
+    return result
+
+
+# --- Main App ---
+if __name__ == '__main__':
+    main()
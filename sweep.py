@@ -0,0 +1,171 @@
+"""
+parameter sweep runner
+runs a grid of back test configs across a process pool and compares the results
+
+price and static data is loaded once per distinct data set in the parent process, workers
+inherit it read only (fork copy on write) or map it from the static data cache when the
+platform can not fork
+
+Tyler Pool
+2022
+"""
+
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import analytics
+import execution
+import resultstore
+import tables
+import trader
+
+# data key -> MarketData (None if invalid), populated before workers start
+_shared_market_data = {}
+
+
+# --- Functions
+def build_config_grid(base_config, **param_values):
+    # every combination of the given parameter values applied on top of the base config
+    # e.g. build_config_grid(config, trade_eval_strat=['eval_random', 'moving_avg'], initial_cash_balance=[1e4, 1e5])
+    param_names = list(param_values.keys())
+    config_grid = []
+    for combination in itertools.product(*(param_values[name] for name in param_names)):
+        config_grid.append(base_config.copy(**dict(zip(param_names, combination))))
+    return config_grid
+
+
+def load_shared_data(config_list):
+    for config in config_list:
+        data_key = config.get_data_key()
+        if data_key not in _shared_market_data:
+            _shared_market_data[data_key] = trader.load_market_data(config)
+    return _shared_market_data
+
+
+def get_shared_market_data(config):
+    return _shared_market_data[config.get_data_key()]
+
+
+def run_config(config):
+    market_data = get_shared_market_data(config)
+    if market_data is None:
+        return None
+    return trader.simulate_back_test(config, market_data, False)
+
+
+def run_sweep(config_list, max_workers=None, store=None):
+    # results are returned in the same order as config_list, None for configs with invalid data
+    # with a result store, configs that already ran on the same code and data are not run again and
+    # new results are stored, data is only loaded for configs that have to run
+    if store is None:
+        return _run_configs(config_list, max_workers)
+
+    run_keys = [store.get_run_key(config, trader.get_price_file_names(config)) for config in config_list]
+    result_list = []
+    for config, run_key in zip(config_list, run_keys):
+        stored_run = store.load_run(run_key)
+        result_list.append(trader.get_stored_result(stored_run, config) if stored_run is not None else None)
+    missing = [config_number for config_number, result in enumerate(result_list) if result is None]
+    new_result_list = _run_configs([config_list[config_number] for config_number in missing], max_workers)
+    for config_number, result in zip(missing, new_result_list):
+        result_list[config_number] = result
+        if result is not None:
+            store.save_run(run_keys[config_number], result,
+                           trader.get_result_metrics(result, get_shared_market_data(result.config)))
+    return result_list
+
+
+def create_executor(config_list, max_workers=None):
+    # process pool whose workers see the shared market data of every config in config_list
+    # load_shared_data must be called first
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers=max_workers,
+                                   mp_context=multiprocessing.get_context('fork'))
+    return ProcessPoolExecutor(max_workers=max_workers,
+                               initializer=load_shared_data,
+                               initargs=(config_list,))
+
+
+def get_chunk_size(task_count, max_workers=None):
+    worker_count = max_workers or multiprocessing.cpu_count()
+    return max(1, task_count // (worker_count * 4))
+
+
+def format_results_table(result_list):
+    # comparison table of sweep results, best final balance first
+    columns = ['final balance', 'S&P 500 par', 'trades', 'trade eval', 'buy', 'sell', 'execution', 'initial cash']
+    rows = []
+    for result in sorted((result for result in result_list if result is not None),
+                         key=lambda result: result.final_balance,
+                         reverse=True):
+        rows.append(['%.2f' % result.final_balance,
+                     '%.2f' % result.comparison_par_balance,
+                     str(result.trade_count),
+                     result.config.trade_eval_strat,
+                     result.config.buy_strat,
+                     result.config.sell_strat,
+                     result.config.execution_model,
+                     str(result.config.initial_cash_balance)])
+    return tables.format_table(columns, rows)
+
+
+def _run_configs(config_list, max_workers):
+    if len(config_list) == 0:
+        return []
+    load_shared_data(config_list)
+    if max_workers == 1:
+        return [run_config(config) for config in config_list]
+
+    with create_executor(config_list, max_workers) as executor:
+        return list(executor.map(run_config, config_list, chunksize=get_chunk_size(len(config_list), max_workers)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run a grid of algorithmic trading back tests")
+    parser.add_argument('--trade-eval-strat', nargs='+', default=[trader.TRADE_EVAL_STRAT])
+    parser.add_argument('--buy-strat', nargs='+', default=[trader.BUY_STRAT])
+    parser.add_argument('--sell-strat', nargs='+', default=[trader.SELL_STRAT])
+    parser.add_argument('--initial-cash-balance', nargs='+', type=float, default=[trader.INITIAL_CASH_BALANCE])
+    parser.add_argument('--random-seed', nargs='+', type=int, default=[None])
+    parser.add_argument('--execution-model', nargs='+', default=[execution.DEFAULT_EXECUTION_MODEL],
+                        choices=sorted(execution.EXECUTION_MODELS))
+    parser.add_argument('--symbols', nargs='+', default=None)
+    parser.add_argument('--first-trading-day', default=trader.FIRST_TRADING_DAY)
+    parser.add_argument('--last-trading-day', default=trader.LAST_TRADING_DAY)
+    parser.add_argument('--repeat', type=int, default=1, help="run every config this many times")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--sort-by', default=None, choices=analytics.METRIC_NAMES,
+                        help="print performance metrics of every run ranked by this metric")
+    parser.add_argument('--store', nargs='?', const=resultstore.RESULT_STORE_FILE_NAME, default=None,
+                        help="reuse and save results in a result store (default file " +
+                             resultstore.RESULT_STORE_FILE_NAME + ")")
+    args = parser.parse_args(argv)
+
+    base_config = trader.BacktestConfig(ticker_symbol_list=args.symbols,
+                                        first_trading_day=args.first_trading_day,
+                                        last_trading_day=args.last_trading_day)
+    config_list = build_config_grid(base_config,
+                                    trade_eval_strat=args.trade_eval_strat,
+                                    buy_strat=args.buy_strat,
+                                    sell_strat=args.sell_strat,
+                                    initial_cash_balance=args.initial_cash_balance,
+                                    random_seed=args.random_seed,
+                                    execution_model=args.execution_model) * args.repeat
+    if args.store is not None:
+        with resultstore.ResultStore(args.store) as store:
+            result_list = run_sweep(config_list, args.workers, store)
+    else:
+        result_list = run_sweep(config_list, args.workers)
+    print(format_results_table(result_list))
+    valid_result_list = [result for result in result_list if result is not None]
+    if args.sort_by is not None and len(valid_result_list) > 0:
+        load_shared_data([base_config])
+        metrics = analytics.compute_result_metrics(valid_result_list, get_shared_market_data(base_config))
+        print(analytics.format_metrics_table(valid_result_list, metrics, args.sort_by))
+    return result_list
+
+
+# --- Main App ---
+if __name__ == '__main__':
+    main()
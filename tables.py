@@ -0,0 +1,18 @@
+"""
+plain text tables for the command line reports (sweep, walk forward, benchmark, monte carlo,
+metrics and stored runs), every column is left aligned and as wide as its widest cell
+
+Tyler Pool
+2022
+"""
+
+
+# --- Functions
+def format_table(columns, rows):
+    # columns = header names, rows = lists of cell strings in column order
+    col_widths = [max([len(columns[col])] + [len(row[col]) for row in rows]) for col in range(len(columns))]
+    lines = [" | ".join(columns[col].ljust(col_widths[col]) for col in range(len(columns))),
+             "-+-".join("-" * width for width in col_widths)]
+    for row in rows:
+        lines.append(" | ".join(row[col].ljust(col_widths[col]) for col in range(len(columns))))
+    return "\n".join(lines)
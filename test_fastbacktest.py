@@ -0,0 +1,74 @@
+"""
+parity of the vectorized fast path against the event loop
+both engines run the same configs over synthetic price data (benchmark.generate_benchmark_data)
+and must produce the same trade history, final balance and equity curve
+
+Tyler Pool
+2022
+"""
+
+import pytest
+import benchmark
+import trader
+
+SYMBOL_COUNT = 12
+DAY_COUNT = 320
+DATA_SEED = 7
+# the last symbol is listed late and has gaps in its price history
+LATE_LISTING_DAYS = 40
+GAP_DAYS = (100, 101, 102, 180, 250)
+
+
+# --- Functions
+def _drop_price_rows(price_file_name, day_numbers):
+    with open(price_file_name) as price_file:
+        lines = price_file.read().splitlines()
+    # line 0 is the header, line n + 1 is trading day n
+    kept_lines = [line for line_number, line in enumerate(lines) if line_number - 1 not in day_numbers]
+    with open(price_file_name, 'w') as price_file:
+        price_file.write("\n".join(kept_lines) + "\n")
+
+
+@pytest.fixture(scope='module')
+def base_config(tmp_path_factory):
+    config = benchmark.generate_benchmark_data(str(tmp_path_factory.mktemp('data')), SYMBOL_COUNT, DAY_COUNT,
+                                               DATA_SEED)
+    gapped_symbol = config.ticker_symbol_list[-1]
+    _drop_price_rows(config.stock_data_file_path + gapped_symbol + trader.FILE_EXTENSION_TYPE,
+                     set(range(LATE_LISTING_DAYS)) | set(GAP_DAYS))
+    return config
+
+
+@pytest.fixture(scope='module')
+def market_data(base_config):
+    return trader.load_market_data(base_config.copy(load_workers=1))
+
+
+@pytest.mark.parametrize('execution_model', ['ideal', 'retail'])
+@pytest.mark.parametrize('trade_eval_strat, buy_strat, sell_strat, buy_params, sell_params', [
+    ('eval_random', 'highscore', 'lowscore', None, None),
+    ('eval_random', 'topk', 'bottomk', {'k': 3, 'sizing': 'fixed'}, {'k': 3, 'sizing': 'fixed'}),
+    ('moving_avg', 'highscore', 'lowscore', None, None),
+    ('moving_avg', 'topk', 'bottomk', {'k': 3, 'sizing': 'fixed'}, {'k': 3, 'sizing': 'fixed'}),
+])
+def test_vectorized_parity(base_config, market_data, execution_model,
+                           trade_eval_strat, buy_strat, sell_strat, buy_params, sell_params):
+    config = base_config.copy(trade_eval_strat=trade_eval_strat,
+                              buy_strat=buy_strat,
+                              sell_strat=sell_strat,
+                              buy_params=buy_params,
+                              sell_params=sell_params,
+                              random_seed=11,
+                              execution_model=execution_model)
+    assert trader.check_vectorized_parity(config, market_data) == []
+
+
+def test_gapped_symbol_is_traded(base_config, market_data):
+    # the late listed symbol must be part of the parity runs: loaded, missing on its gap days and traded
+    gapped_symbol = base_config.ticker_symbol_list[-1]
+    symbol_id = market_data.symbol_index[gapped_symbol]
+    assert not market_data.available[:LATE_LISTING_DAYS, symbol_id].any()
+    assert market_data.available[LATE_LISTING_DAYS:, symbol_id].sum() == DAY_COUNT - LATE_LISTING_DAYS - len(GAP_DAYS)
+    result = trader.simulate_back_test(base_config.copy(trade_eval_strat='eval_random', random_seed=11),
+                                       market_data, False)
+    assert gapped_symbol in result.trade_history.get_trade_symbols()
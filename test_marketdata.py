@@ -0,0 +1,48 @@
+"""
+trading day range of the market data: the calendar is cut to the config's first and last
+trading day and indicators keep their warm up on the bars before the range
+
+Tyler Pool
+2022
+"""
+
+import numpy as np
+import pytest
+import benchmark
+import marketdata
+import trader
+
+SYMBOL_COUNT = 4
+DAY_COUNT = 300
+DATA_SEED = 3
+
+
+# --- Functions
+@pytest.fixture(scope='module')
+def base_config(tmp_path_factory):
+    return benchmark.generate_benchmark_data(str(tmp_path_factory.mktemp('data')), SYMBOL_COUNT, DAY_COUNT,
+                                             DATA_SEED).copy(load_workers=1)
+
+
+def test_calendar_is_cut_to_the_trading_day_range(base_config):
+    full_market_data = trader.load_market_data(base_config)
+    config = base_config.copy(first_trading_day='2015-01-02', last_trading_day='2015-03-01')
+    market_data = trader.load_market_data(config)
+    first_day = full_market_data.get_day_index('2015-01-02')
+    assert market_data.get_date_str(0) == '2015-01-02'
+    assert market_data.get_date_str(market_data.simulation_days - 1) == '2015-02-27'
+    assert np.array_equal(market_data.close_cents,
+                          full_market_data.close_cents[first_day:first_day + market_data.simulation_days])
+    # indicators are the full history values, warmed up on the bars before the range
+    for indicator_name in market_data.price_stores[0].get_indicator_names():
+        assert np.array_equal(market_data.get_indicator_matrix(indicator_name),
+                              full_market_data.get_indicator_matrix(indicator_name)[
+                                  first_day:first_day + market_data.simulation_days])
+
+
+def test_range_without_bars_has_no_trading_days(base_config):
+    config = base_config.copy(first_trading_day='1999-01-01', last_trading_day='1999-02-01')
+    assert trader.load_market_data(config) is None
+    calendar = np.array([20150102, 20150105, 20150106], dtype=np.int64)
+    assert marketdata.get_calendar_range(calendar, '1999-01-01', '1999-02-01') == (0, 0)
+    assert marketdata.get_calendar_range(calendar, '2015-01-03', '2015-01-05') == (1, 2)
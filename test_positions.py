@@ -0,0 +1,93 @@
+"""
+position book lot accounting: realized P&L and cost basis of FIFO, LIFO and average cost sells,
+prices and P&L are int cents
+
+Tyler Pool
+2022
+"""
+
+import numpy as np
+import pytest
+import ledger
+import marketdata
+import positions
+import trader
+
+
+# --- Functions
+def _get_position(lots):
+    position = positions.Position('XYZ')
+    for day, (qty, price) in enumerate(lots):
+        position.add_lot(qty, price, day)
+    return position
+
+
+@pytest.mark.parametrize('sale_type, realized_pnl, cost_basis, open_lots', [
+    ('FIFO', 10 * 30 + 5 * 10, 5 * 120, [(5, 12000)]),
+    ('LIFO', 10 * 10 + 5 * 30, 5 * 100, [(5, 10000)]),
+    # average cost 110, lots are still consumed oldest first
+    ('AVG', 15 * 20, 5 * 110, [(5, 12000)]),
+])
+def test_realized_pnl_by_sale_type(sale_type, realized_pnl, cost_basis, open_lots):
+    position = _get_position([(10, 10000), (10, 12000)])
+    assert position.remove_qty(15, 13000, sale_type) == realized_pnl * 100
+    assert position.realized_pnl == realized_pnl * 100
+    assert position.cost_basis == cost_basis * 100
+    assert position.qty == 5
+    assert [(lot.qty, lot.price) for lot in position.lots] == open_lots
+    assert sum(lot.realized_pnl for lot in position.closed_lots + list(position.lots)) == realized_pnl * 100
+
+
+def test_cost_basis_after_partial_lot_sales():
+    position = _get_position([(3, 10100), (4, 9900)])
+    position.remove_qty(2, 10500, 'FIFO')
+    assert position.cost_basis == 1 * 10100 + 4 * 9900
+    assert [(lot.qty, lot.sold_qty) for lot in position.lots] == [(1, 2), (4, 0)]
+    position.remove_qty(2, 10500, 'LIFO')
+    assert position.cost_basis == 1 * 10100 + 2 * 9900
+    assert [(lot.qty, lot.sold_qty) for lot in position.lots] == [(1, 2), (2, 2)]
+
+
+def test_average_cost_sales_keep_whole_cents():
+    # cost basis 302 cents over 3 shares does not split into whole cents per share
+    position = _get_position([(1, 100), (2, 101)])
+    assert position.remove_qty(1, 150, 'AVG') == 150 - 100
+    assert position.cost_basis == 202
+    assert isinstance(position.cost_basis, int)
+    assert position.remove_qty(2, 150, 'AVG') == 300 - 202
+    assert position.cost_basis == 0
+    assert position.realized_pnl == 3 * 150 - 302
+
+
+def test_oversell_and_unknown_sale_type_raise():
+    position = _get_position([(10, 10000)])
+    with pytest.raises(ValueError):
+        position.remove_qty(11, 10000)
+    with pytest.raises(ValueError):
+        position.remove_qty(1, 10000, 'HIFO')
+    assert position.qty == 10
+    assert position.cost_basis == 10 * 10000
+    with pytest.raises(ValueError):
+        positions.PositionBook().remove('ABC', 1, 10000)
+    with pytest.raises(ValueError):
+        trader.Portfolio(10000, sale_type='HIFO')
+
+
+@pytest.mark.parametrize('sale_type, realized_pnl', [('FIFO', 2 * 3000), ('LIFO', 2 * 1000), ('AVG', 2 * 2000)])
+def test_portfolio_fills_sells_with_its_sale_type(sale_type, realized_pnl):
+    # buy 2 @ $100.00, buy 2 @ $120.00, sell 2 @ $130.00
+    close_cents = np.array([[10000], [12000], [13000]], dtype=np.int64)
+    market_data = marketdata.from_arrays(['XYZ'],
+                                         np.array([20150105, 20150106, 20150107], dtype=np.int64),
+                                         np.arange(3, dtype=np.int64)[:, np.newaxis],
+                                         np.ones((3, 1), dtype=bool),
+                                         close_cents,
+                                         close_cents,
+                                         np.full((3, 1), 1000000, dtype=np.int64),
+                                         {})
+    portfolio = trader.Portfolio(10000, ticker_symbol_list=['XYZ'], sale_type=sale_type)
+    portfolio.place_orders(ledger.SIDE_BUY, {'XYZ': 2}, market_data, 0)
+    portfolio.place_orders(ledger.SIDE_BUY, {'XYZ': 2}, market_data, 1)
+    portfolio.place_orders(ledger.SIDE_SELL, {'XYZ': 2}, market_data, 2)
+    assert portfolio.position_book.get_qty('XYZ') == 2
+    assert portfolio.position_book.get_realized_pnl() == realized_pnl
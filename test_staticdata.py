@@ -0,0 +1,66 @@
+"""
+indicators extended over new price rows (static data cache of a grown price file) must be the
+same as indicators calculated from scratch, or a back test would depend on the cache history
+
+Tyler Pool
+2022
+"""
+
+import os
+import shutil
+import numpy as np
+import benchmark
+import staticdata
+import trader
+
+SYMBOL_COUNT = 3
+DAY_COUNT = 400
+CACHED_DAY_COUNT = 300
+DATA_SEED = 5
+INDICATOR_DEFINITIONS = [staticdata.IndicatorDefinition('sma_20', 'sma', 20),
+                         staticdata.IndicatorDefinition('ema_12', 'ema', 12),
+                         staticdata.IndicatorDefinition('std_30', 'rolling_std', 30),
+                         staticdata.IndicatorDefinition('rsi_14', 'rsi', 14)]
+
+
+# --- Functions
+def _load_indicators(config):
+    market_data = trader.load_market_data(config)
+    return {symbol: dict(market_data.get_stock_history(symbol).price_store.indicators)
+            for symbol in market_data.symbols}
+
+
+def test_extended_indicators_match_a_full_calculation():
+    closes = 100.0 * np.exp(np.cumsum(np.random.default_rng(DATA_SEED).normal(0.0, 0.02, DAY_COUNT)))
+    cached_columns = staticdata.compute_indicators(closes[0:CACHED_DAY_COUNT], INDICATOR_DEFINITIONS)
+    extended_columns = staticdata.extend_indicators(closes, cached_columns, CACHED_DAY_COUNT, INDICATOR_DEFINITIONS)
+    full_columns = staticdata.compute_indicators(closes, INDICATOR_DEFINITIONS)
+    for definition in INDICATOR_DEFINITIONS:
+        assert np.array_equal(extended_columns[definition.name], full_columns[definition.name]), definition.name
+
+
+def test_extended_cache_matches_a_rebuilt_cache(tmp_path):
+    config = benchmark.generate_benchmark_data(str(tmp_path), SYMBOL_COUNT, DAY_COUNT, DATA_SEED).copy(load_workers=1)
+    full_files = {}
+    for symbol in config.ticker_symbol_list:
+        price_file_name = config.stock_data_file_path + symbol + trader.FILE_EXTENSION_TYPE
+        with open(price_file_name) as price_file:
+            full_files[price_file_name] = price_file.read()
+        # header plus the first CACHED_DAY_COUNT days
+        with open(price_file_name, 'w') as price_file:
+            price_file.write("\n".join(full_files[price_file_name].splitlines()[0:CACHED_DAY_COUNT + 1]) + "\n")
+    _load_indicators(config)
+
+    # rows appended to the price files, the cached indicators are extended
+    for price_file_name, content in full_files.items():
+        with open(price_file_name, 'w') as price_file:
+            price_file.write(content)
+    extended_indicators = _load_indicators(config)
+
+    shutil.rmtree(config.static_data_file_path)
+    os.makedirs(config.static_data_file_path)
+    rebuilt_indicators = _load_indicators(config)
+    for symbol, indicator_columns in rebuilt_indicators.items():
+        for indicator_name, indicator_column in indicator_columns.items():
+            assert len(indicator_column) == DAY_COUNT
+            assert np.array_equal(extended_indicators[symbol][indicator_name], indicator_column), indicator_name
@@ -1,30 +1,63 @@
 '''
 file containing trade evaluation functions
+
+strategies can be evaluated one symbol and day at a time through eval_trade, or for the whole
+simulation at once through eval_trade_batch, batch strategies are methods named
+<strategy name>_batch that take (trading day x symbol) indicator matrices and return a
+(trading day x symbol) score matrix
 '''
 
 import random
+import numpy as np
+import pricestore
 
 
 class TradeEvalObj(object):
     # NOTE input parameters for methods below are in form of list of Objects
     # it is up to the caller to consult this file to figure out what order input arguments are in
-    def __init__(self):
-        print("eval object created")
+    def __init__(self, seed=None):
+        # seeded random streams make eval_random runs reproducible, None seeds from the OS
+        self.random = random.Random(seed)
+        self.rng = np.random.default_rng(seed)
 
     def eval_trade(self, strategy_name: str, arguments_list: list):
         return getattr(self, strategy_name)(arguments_list)
 
+    def eval_trade_batch(self, strategy_name: str, indicator_matrices: dict):
+        # indicator_matrices maps indicator name -> (trading day x symbol) matrix
+        # strategies without a batch method are evaluated one cell at a time through eval_trade
+        batch_method = getattr(self, strategy_name + '_batch', None)
+        if batch_method is not None:
+            return batch_method(indicator_matrices)
+
+        indicator_names = list(indicator_matrices.keys())
+        matrix_list = [indicator_matrices[name] for name in indicator_names]
+        shape = matrix_list[0].shape
+        score_matrix = np.zeros(shape)
+        for day in range(shape[0]):
+            day_rows = [matrix[day].tolist() for matrix in matrix_list]
+            for symbol_id in range(shape[1]):
+                technical_analysis_data_dict = {name: day_rows[col][symbol_id]
+                                                for col, name in enumerate(indicator_names)}
+                score_matrix[day, symbol_id] = self.eval_trade(strategy_name, [technical_analysis_data_dict])
+        return score_matrix
+
     def eval_random(self, arguments_list):
         rnd_sign = 1.0
-        if random.random() > 0.5:
+        if self.random.random() > 0.5:
             rnd_sign = -1.0
-        return random.random() * rnd_sign
+        return self.random.random() * rnd_sign
+
+    def eval_random_batch(self, indicator_matrices):
+        shape = _get_matrix_shape(indicator_matrices)
+        rnd_sign = np.where(self.rng.random(shape) > 0.5, -1.0, 1.0)
+        return self.rng.random(shape) * rnd_sign
 
     def moving_avg(self, arguments_list):
         # evaluation based on short term average being above or below long term avg
         technical_analysis_data_dict = arguments_list[0]
-        moving_avg_15 = price_str_to_float(technical_analysis_data_dict["15_day_moving_avg"])
-        moving_avg_50 = price_str_to_float(technical_analysis_data_dict["50_day_moving_avg"])
+        moving_avg_15 = pricestore.price_to_dollars(technical_analysis_data_dict["15_day_moving_avg"])
+        moving_avg_50 = pricestore.price_to_dollars(technical_analysis_data_dict["50_day_moving_avg"])
         if moving_avg_15 > 0.0 and moving_avg_50 > 0.0:
             moving_avg_delta_15_over_50 = (moving_avg_15 - moving_avg_50)
             moving_avg_15_10_perc = moving_avg_50 * 0.10
@@ -34,6 +67,18 @@ class TradeEvalObj(object):
                 return -1.0
             else:
                 return moving_avg_delta_15_over_50 / moving_avg_15_10_perc
+        # moving averages not available yet (not enough trading days), no opinion
+        return 0.0
+
+    def moving_avg_batch(self, indicator_matrices):
+        moving_avg_15 = pricestore.truncate_to_cents(indicator_matrices["15_day_moving_avg"])
+        moving_avg_50 = pricestore.truncate_to_cents(indicator_matrices["50_day_moving_avg"])
+        available = (moving_avg_15 > 0.0) & (moving_avg_50 > 0.0)
+        moving_avg_delta_15_over_50 = moving_avg_15 - moving_avg_50
+        moving_avg_15_10_perc = moving_avg_50 * 0.10
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.clip(moving_avg_delta_15_over_50 / moving_avg_15_10_perc, -1.0, 1.0)
+        return np.where(available, scores, 0.0)
 
     def meb_faber_indicator(self):
         # SPY 200 day moving avg, if SPY closes above it, stay long or get long
@@ -41,8 +86,7 @@ class TradeEvalObj(object):
 
 
 # --- Functions
-def price_str_to_float(input_str):
-    return float(input_str[0:input_str.index('.') + 3])
-
-
-
+def _get_matrix_shape(indicator_matrices):
+    for matrix in indicator_matrices.values():
+        return matrix.shape
+    raise ValueError("batch evaluation needs at least one indicator matrix")
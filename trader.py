@@ -4,12 +4,22 @@ Tyler Pool
 2022
 """
 
-import csv
-import os.path
+import numpy as np
+import analytics
+import execution
+import fastbacktest
+import ledger
+import marketdata
+import positions
+import pricestore
+import resultstore
 import tradeeval
 import staticdata
+import staticcache
+import stockloader
 import buystrat
 import sellstrat
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 
 # --- Constants
@@ -17,8 +27,7 @@ from datetime import datetime, timedelta
 STOCK_DATA_FILE_PATH = 'input/stocks/'
 STATIC_DATA_FILE_PATH = 'input/static data/'
 FILE_EXTENSION_TYPE = '.csv'
-TICKER_SYMBOL_LIST = {'SPY', 'GLD', 'AMZN', 'RH', 'XOM', 'WM'}
-FILE_COLUMN_WIDTH = 7
+TICKER_SYMBOL_LIST = ('SPY', 'GLD', 'AMZN', 'RH', 'XOM', 'WM')
 INITIAL_CASH_BALANCE = 10000
 HIGH_DATE = "9999-12-31"
 FIRST_TRADING_DAY = '2014-11-17'
@@ -26,128 +35,278 @@ LAST_TRADING_DAY = "2019-11-14"
 TRADE_EVAL_STRAT = "eval_random"
 BUY_STRAT = "highscore"
 SELL_STRAT = "lowscore"
-STATIC_DATA_DERIVED_FIELDS = ['date', '15_day_moving_avg', '50_day_moving_avg']
+SALE_TYPE = "FIFO"
+COMPARISON_PAR_SYMBOL = 'SPY'
 
 
 # --- classes
+class BacktestConfig:
+    # every setting that drives a single back test run, defaults come from the module constants
+    def __init__(self,
+                 trade_eval_strat=TRADE_EVAL_STRAT,
+                 buy_strat=BUY_STRAT,
+                 sell_strat=SELL_STRAT,
+                 ticker_symbol_list=None,
+                 first_trading_day=FIRST_TRADING_DAY,
+                 last_trading_day=LAST_TRADING_DAY,
+                 initial_cash_balance=INITIAL_CASH_BALANCE,
+                 stock_data_file_path=STOCK_DATA_FILE_PATH,
+                 static_data_file_path=STATIC_DATA_FILE_PATH,
+                 random_seed=None,
+                 buy_params=None,
+                 sell_params=None,
+                 vectorized=True,
+                 quiet=False,
+                 load_workers=None,
+                 execution_model=execution.DEFAULT_EXECUTION_MODEL,
+                 execution_params=None,
+                 sale_type=SALE_TYPE):
+        if ticker_symbol_list is None:
+            ticker_symbol_list = TICKER_SYMBOL_LIST
+        self.trade_eval_strat = trade_eval_strat
+        self.buy_strat = buy_strat
+        self.sell_strat = sell_strat
+        # symbol order decides symbol ids (random draws, tie breaking, run keys), unordered sets are sorted
+        self.ticker_symbol_list = get_ordered_symbols(ticker_symbol_list)
+        self.first_trading_day = first_trading_day
+        self.last_trading_day = last_trading_day
+        self.initial_cash_balance = initial_cash_balance
+        self.stock_data_file_path = stock_data_file_path
+        self.static_data_file_path = static_data_file_path
+        self.random_seed = random_seed
+        # parameter overrides for score array buy / sell strategies, e.g. {'k': 25, 'sizing': 'equal'}
+        self.buy_params = dict(buy_params) if buy_params else {}
+        self.sell_params = dict(sell_params) if sell_params else {}
+        # use the vectorized fast path when the strategies support it
+        self.vectorized = vectorized
+        # skip printing every trade, the summary is still printed
+        self.quiet = quiet
+        # threads used to load symbols (None = ThreadPoolExecutor default, 1 = load in the calling thread)
+        self.load_workers = load_workers
+        # order execution model (see execution.EXECUTION_MODELS) and parameter overrides, e.g. {'spread': 0.002}
+        self.execution_model = execution_model
+        self.execution_params = dict(execution_params) if execution_params else {}
+        # lots a sell consumes and the cost its realized P&L is measured against (positions.SALE_TYPES)
+        self.sale_type = sale_type
+
+    def __repr__(self):
+        return "BacktestConfig(" + ", ".join(key + "=" + repr(value) for key, value in vars(self).items()) + ")"
+
+    def __eq__(self, other):
+        return isinstance(other, BacktestConfig) and vars(self) == vars(other)
+
+    def __hash__(self):
+        return hash(repr(self))
+
+    def copy(self, **changes):
+        config_values = dict(vars(self))
+        config_values.update(changes)
+        return BacktestConfig(**config_values)
+
+    def get_execution_params(self):
+        return execution.get_execution_params(self.execution_model, self.execution_params)
+
+    def get_data_key(self):
+        # configs with the same data key can share one load of price and static data
+        return (self.ticker_symbol_list,
+                self.first_trading_day,
+                self.last_trading_day,
+                self.stock_data_file_path,
+                self.static_data_file_path)
+
+
+class BacktestResult:
+    def __init__(self, config, simulation_days, cash_balance, final_balance, comparison_par_balance, trade_count,
+                 trade_history=None, equity_curve=None, vectorized=False):
+        self.config = config
+        self.simulation_days = simulation_days
+        self.cash_balance = cash_balance
+        self.final_balance = final_balance
+        self.comparison_par_balance = comparison_par_balance
+        self.trade_count = trade_count
+        self.trade_history = trade_history
+        # portfolio value (cash + holdings at the close) for every trading day
+        self.equity_curve = equity_curve
+        self.vectorized = vectorized
+
+    def __repr__(self):
+        return ("Backtest Result: final balance = $" + str(self.final_balance) +
+                ", trades = " + str(self.trade_count) + ", " + repr(self.config))
+
+
 class Portfolio:
-    def __init__(self, initial_balance):
-        self.cash_balance = initial_balance
-        self.stock_shares = []
-        self.trade_history = []
+    def __init__(self, initial_balance, buy_strat=BUY_STRAT, sell_strat=SELL_STRAT, ticker_symbol_list=None,
+                 buy_params=None, sell_params=None, execution_params=None, sale_type=SALE_TYPE):
+        if ticker_symbol_list is None:
+            ticker_symbol_list = TICKER_SYMBOL_LIST
+        # cash and position book prices are int cents
+        self.cash_cents = pricestore.dollars_to_cents(initial_balance)
+        self.buy_strat = buy_strat
+        self.sell_strat = sell_strat
+        self.buy_params = buy_params
+        self.sell_params = sell_params
+        self.ticker_symbol_list = get_ordered_symbols(ticker_symbol_list)
+        self.position_book = positions.PositionBook()
+        self.trade_history = ledger.TradeLedger(self.ticker_symbol_list)
+        if execution_params is None:
+            execution_params = execution.get_execution_params()
+        self.execution_params = execution_params
+        if sale_type not in positions.SALE_TYPES:
+            raise ValueError("unknown sale type: " + str(sale_type))
+        self.sale_type = sale_type
+        # (sides, symbol ids, qtys) of orders waiting for the next trading day (next open fills)
+        self.pending_orders = []
 
     def __repr__(self):
         share_dict = {}
-        for symbol in TICKER_SYMBOL_LIST:
+        for symbol in self.ticker_symbol_list:
             share_dict[symbol] = self.get_share_qty_by_symbol(symbol)
         return str(share_dict)
 
     def __str__(self):
         share_dict = {}
-        for symbol in TICKER_SYMBOL_LIST:
+        for symbol in self.ticker_symbol_list:
             share_dict[symbol] = self.get_share_qty_by_symbol(symbol)
         return str(share_dict)
 
+    @property
+    def cash_balance(self):
+        return pricestore.cents_to_dollars(self.cash_cents)
+
     def get_trade_history_str(self):
-        trade_history_string = ""
-        for trade in self.trade_history:
-            trade_history_string += str(trade) + "\n"
-        return trade_history_string
+        return self.trade_history.get_trade_history_str()
+
+    @property
+    def stock_shares(self):
+        # one StockShare per share held, only built on request for compatibility with older callers
+        stock_shares = []
+        for lot in self.position_book.get_open_lots():
+            for i in range(lot.qty):
+                stock_shares.append(StockShare(lot.symbol, pricestore.cents_to_dollars(lot.price), lot.date))
+        return stock_shares
 
     def get_share_qty_by_symbol(self, symbol):
-        share_qty = 0
-        for share in self.stock_shares:
-            if share.symbol == symbol:
-                share_qty += 1
-        return share_qty
-
-    def buy_share(self, symbol, date, price, qty):
-        for i in range(qty):
-            self.stock_shares.append(StockShare(symbol, price, date))
-            self.cash_balance -= price
-        self.trade_history.append(list_to_str(["On ",
-                                               date,
-                                               ": Buy ",
-                                               qty,
-                                               " x ",
-                                               symbol,
-                                               " @ $",
-                                               price,
-                                               " cash = $",
-                                               self.cash_balance]))
-
-    def sell_share(self, symbol, date, price, qty, sale_type):
+        return self.position_book.get_qty(symbol)
+
+    def buy_share(self, symbol, day, price_cents, qty, commission_cents=0):
+        self.position_book.add(symbol, qty, price_cents, day)
+        self.cash_cents -= price_cents * qty + commission_cents
+        self.trade_history.append(day, symbol, ledger.SIDE_BUY, qty, price_cents, self.cash_cents, commission_cents)
+
+    def sell_share(self, symbol, day, price_cents, qty, sale_type, commission_cents=0):
         # Method assumes that following:
         # - verification such as price being correct and qty of shares actually owned is done by the caller
-        # - share list sorted by trade date
         # list of sale types:
         # - FIFO = first in, first out
-        if sale_type == "FIFO":
-            shares_sold = 0
-            remaining_shares_list = []
-            # TODO: make loop below more efficient
-            for share in self.stock_shares:
-                if share.symbol == symbol:
-                    if shares_sold < qty:
-                        self.cash_balance += price
-                        shares_sold += 1
-                    else:
-                        remaining_shares_list.append(share)
-                else:
-                    remaining_shares_list.append(share)
-            self.stock_shares = remaining_shares_list
-            self.trade_history.append(list_to_str(["On ",
-                                                   date,
-                                                   ": Sell ",
-                                                   qty,
-                                                   " x ",
-                                                   symbol,
-                                                   " @ $",
-                                                   price,
-                                                   " cash = $",
-                                                   self.cash_balance]))
-            if self.stock_shares == None:
-                self.stock_shares = []
-
-    def execute_buy_strategy(self, potential_trades_by_evaluation_score, stock_history_data_object_list, day):
-        buy_order = buystrat.get_buy_order(BUY_STRAT, potential_trades_by_evaluation_score)
+        # - LIFO = last in, first out
+        # - AVG = average cost
+        self.position_book.remove(symbol, qty, price_cents, sale_type)
+        self.cash_cents += price_cents * qty - commission_cents
+        self.trade_history.append(day, symbol, ledger.SIDE_SELL, qty, price_cents, self.cash_cents, commission_cents)
+
+    def execute_buy_strategy(self, day_scores, market_data, day):
+        # day_scores holds one evaluation score per market data symbol
+        if buystrat.is_score_array_strategy(self.buy_strat):
+            buy_order = buystrat.get_buy_order_from_scores(self.buy_strat,
+                                                           market_data.symbols,
+                                                           day_scores,
+                                                           market_data.closes[day],
+                                                           self.cash_balance,
+                                                           self.buy_params)
+        else:
+            buy_order = buystrat.get_buy_order(self.buy_strat, get_potential_trades(market_data.symbols, day_scores))
         if len(buy_order) > 0:
-            for order_symbol in buy_order.keys():
-                buy_qty = buy_order[order_symbol]
-                buy_symbol = order_symbol
-                buy_price = get_closing_price(stock_history_data_object_list,
-                                              buy_symbol,
-                                              day)
-                if self.cash_balance > (buy_qty * buy_price):
-                    self.buy_share(buy_symbol, "Day " + str(day), buy_price, buy_qty)
+            self.place_orders(ledger.SIDE_BUY, buy_order, market_data, day)
 
     def execute_sell_strategy(self,
-                              potential_trades_by_evaluation_score,
-                              stock_history_data_object_list,
+                              day_scores,
+                              market_data,
                               day):
 
-        sell_order = sellstrat.get_sell_order(SELL_STRAT, potential_trades_by_evaluation_score)
+        if sellstrat.is_score_array_strategy(self.sell_strat):
+            holdings = None
+            if sellstrat.needs_holdings(self.sell_strat, self.sell_params):
+                holdings = market_data.get_holdings_vector(self.position_book)
+            sell_order = sellstrat.get_sell_order_from_scores(self.sell_strat,
+                                                              market_data.symbols,
+                                                              day_scores,
+                                                              holdings,
+                                                              self.sell_params)
+        else:
+            sell_order = sellstrat.get_sell_order(self.sell_strat, get_potential_trades(market_data.symbols, day_scores))
         if len(sell_order) > 0:
-            for order_symbol in sell_order:
-                sell_qty = sell_order[order_symbol]
-                sell_symbol = order_symbol
-                sell_price = get_closing_price(stock_history_data_object_list,
-                                               sell_symbol,
-                                               day)
-                if self.get_share_qty_by_symbol(sell_symbol) >= sell_qty:
-                    self.sell_share(sell_symbol,
-                                         "Day " + str(day),
-                                         sell_price,
-                                         sell_qty,
-                                         "FIFO")
+            self.place_orders(ledger.SIDE_SELL, sell_order, market_data, day)
+
+    def place_orders(self, side, order, market_data, day):
+        # order = dict of symbol -> qty in execution order, filled now or queued for the next trading day
+        symbol_ids = market_data.get_symbol_ids(list(order.keys()))
+        qtys = np.fromiter(order.values(), dtype=np.int64, count=len(order))
+        sides = np.full(len(order), side, dtype=np.int64)
+        if execution.get_fill_day_offset(self.execution_params) > 0:
+            self.pending_orders.append((sides, symbol_ids, qtys))
+        else:
+            self.fill_orders(sides, symbol_ids, qtys, market_data, day)
+
+    def fill_pending_orders(self, market_data, day):
+        # fill the orders queued on the previous trading day, called before the day's strategies run
+        if len(self.pending_orders) == 0:
+            return
+        sides, symbol_ids, qtys = (np.concatenate(column) for column in zip(*self.pending_orders))
+        self.pending_orders = []
+        self.fill_orders(sides, symbol_ids, qtys, market_data, day)
+
+    def fill_orders(self, sides, symbol_ids, qtys, market_data, day):
+        # fills a batch of orders in order through the execution model, cash and holdings are checked for
+        # the whole batch at once, only filled trades touch the position book and ledger
+        fill_days = np.full(len(symbol_ids), day, dtype=np.int64)
+        fill_qtys, fill_prices, commissions = execution.get_fills(
+            self.execution_params,
+            sides,
+            qtys,
+            execution.get_base_prices(self.execution_params, market_data, fill_days, symbol_ids),
+            market_data.volumes[day, symbol_ids],
+            market_data.available[day, symbol_ids])
+        filled, cash_after = execution.fill_orders(symbol_ids, sides, fill_qtys, fill_prices, commissions,
+                                                   self.cash_cents,
+                                                   market_data.get_holdings_vector(self.position_book))[0:2]
+        filled_orders = np.flatnonzero(filled)
+        if len(filled_orders) == 0:
+            return
+        fill_symbol_ids = symbol_ids[filled_orders]
+        fill_sides = sides[filled_orders]
+        fill_qtys = fill_qtys[filled_orders]
+        fill_prices = fill_prices[filled_orders]
+        for symbol_id, side, qty, price in zip(fill_symbol_ids.tolist(), fill_sides.tolist(), fill_qtys.tolist(),
+                                               fill_prices.tolist()):
+            if side == ledger.SIDE_BUY:
+                self.position_book.add(market_data.symbols[symbol_id], qty, price, day)
+            else:
+                self.position_book.remove(market_data.symbols[symbol_id], qty, price, self.sale_type)
+        self.cash_cents = int(cash_after[filled_orders[-1]])
+        self.trade_history.extend(fill_days[filled_orders],
+                                  [self.trade_history.get_symbol_id(market_data.symbols[symbol_id])
+                                   for symbol_id in fill_symbol_ids.tolist()],
+                                  fill_sides,
+                                  fill_qtys,
+                                  fill_prices,
+                                  cash_after[filled_orders],
+                                  commissions[filled_orders])
 
 
 class StockDataHistory:
-    def __init__(self, symbol, begin, end):
+    def __init__(self, symbol, begin, end,
+                 stock_data_file_path=STOCK_DATA_FILE_PATH,
+                 static_data_file_path=STATIC_DATA_FILE_PATH):
         self.symbol = symbol
         self.first_day = begin
         self.last_day = end
-        self.trading_day_object_list = []
+        self.stock_data_file_path = stock_data_file_path
+        self.static_data_file_path = static_data_file_path
+        self.price_store = pricestore.PriceStore(symbol)
+        self.static_cache = None
+        self.source_fingerprint = None
+        self.source_digest = None
+        self.cached_rows = 0
 
     def __str__(self):
         return "Stock Data History for: " + str(self.symbol)
@@ -155,95 +314,95 @@ class StockDataHistory:
     def __repr__(self):
         return "Stock Data History for: " + str(self.symbol)
 
+    @property
+    def trading_day_object_list(self):
+        # TradingDay objects are views into the price store, created only when indexed
+        return self.price_store.get_trading_day_list()
+
     def get_closing_prices(self):
-        closing_prices = []
-        for day in self.trading_day_object_list:
-            closing_prices.append(day.close)
-        return closing_prices
+        return self.price_store.closes
 
     def populate_stock_historical_data(self):
         # using Yahoo finance historical data website
         # manually downloading csv files - TODO transition to web service to retrieve data
-        # historical data csv file format:
-        # columns: 0=date, 1=open, 2=high, 3=low, 4=close, 5=adj close, 6=volume
-        # 0 row is column titles
-        print("loading historic price data for ticker: " + self.symbol)
-        historical_data = stockdata_csv_to_list_by_symbol(self.symbol)
-        historical_data = historical_data[1:]  # remove col tile row
-        print("row count = " + str(len(historical_data)))
-        for day_row in historical_data:
-            if len(day_row) == FILE_COLUMN_WIDTH:
-                self.trading_day_object_list.append(TradingDay(self.symbol,
-                                                               day_row[0],
-                                                               price_str_to_float(day_row[1]),
-                                                               price_str_to_float(day_row[4]),
-                                                               day_row[6]))
+        # runs on the loader threads, progress is reported by load_symbols on the calling thread
+        source_file_name = self.stock_data_file_path + self.symbol + FILE_EXTENSION_TYPE
+        self.source_fingerprint = staticcache.get_source_fingerprint(source_file_name)
+        self.source_digest = None
+        self.cached_rows = 0
+        self.static_cache = staticcache.read_static_cache(staticcache.get_cache_file_name(self.static_data_file_path,
+                                                                                          self.symbol))
+        if self.static_cache is not None and self.static_cache.source_is_unchanged(self.source_fingerprint):
+            # price file untouched since the cache was written, map the cached columns without parsing
+            self.price_store = self.static_cache.price_store
+            self.source_digest = self.static_cache.header['source_digest']
+            self.cached_rows = len(self.price_store)
+            return
+
+        if self.static_cache is not None and self.source_fingerprint[0] > self.static_cache.header['source_size']:
+            # price file grew, if the cached part of the file is unchanged only the new rows are parsed
+            cached_size = self.static_cache.header['source_size']
+            scan = stockloader.scan_price_file(self.symbol, source_file_name, cached_size, cached_size)
+            if scan.prefix_digest == self.static_cache.header['source_digest']:
+                cached_store = self.static_cache.price_store
+                self.price_store = pricestore.PriceStore(self.symbol,
+                                                         np.concatenate((cached_store.dates, scan.dates)),
+                                                         np.concatenate((cached_store.open_cents, scan.open_cents)),
+                                                         np.concatenate((cached_store.close_cents, scan.close_cents)),
+                                                         np.concatenate((cached_store.volumes, scan.volumes)))
+                self.source_fingerprint = (scan.source_size, self.source_fingerprint[1])
+                self.source_digest = scan.source_digest
+                self.cached_rows = len(cached_store)
+                return
+
+        scan = stockloader.scan_price_file(self.symbol, source_file_name)
+        self.price_store = scan.get_price_store()
+        self.source_fingerprint = (scan.source_size, self.source_fingerprint[1])
+        self.source_digest = scan.source_digest
+        if self.static_cache is not None and self.static_cache.source_digest_matches(self.source_digest):
+            # price file was touched but its content is the same
+            self.cached_rows = len(self.price_store)
+        else:
+            # price file content changed, cached static data can not be reused
+            self.static_cache = None
 
     def populate_technical_analysis_data(self, duration: int):
         # determine if static data fields used for technical analysis have already been generated
         # or need to be populated and saved
-        file_name = STATIC_DATA_FILE_PATH + self.symbol + ' SD.csv'
-        static_data_write_required = False
-        static_fields_list = []
-        all_trading_days = self.trading_day_object_list
-        number_of_trading_days = len(all_trading_days)
-
-        if os.path.exists(file_name):
-            # validate that existing static data file meets date criteria for
-            with open(file_name, newline='') as csvfile:
-                static_data_str_list = list(csv.reader(csvfile, delimiter=' ', quotechar='|'))
-                for row_as_str in static_data_str_list:
-                    row_as_list = row_as_str[0].split(',')
-                    static_fields_list.append(row_as_list)
-            if len(static_fields_list) - 1 != duration:
-                static_data_write_required = True
+        number_of_trading_days = len(self.price_store)
+        indicator_signature = staticcache.get_indicator_signature(staticdata.get_indicator_definitions())
+        cache_file_name = staticcache.get_cache_file_name(self.static_data_file_path, self.symbol)
+
+        if (self.static_cache is not None and self.cached_rows > 0 and
+                self.static_cache.indicators_are_valid(indicator_signature, self.cached_rows)):
+            if self.static_cache.price_store is self.price_store:
+                # all required static data fields are already mapped from the cache file
+                return
+            cached_indicators = self.static_cache.price_store.indicators
+            if self.cached_rows == number_of_trading_days:
+                # price file was touched but its content is the same, reuse the cached fields
+                extended_indicators = cached_indicators
             else:
-                for required_field in STATIC_DATA_DERIVED_FIELDS:
-                    if required_field not in static_fields_list[0]:
-                        static_data_write_required = True
-                # validate date range
-                if static_fields_list[0][0] == 'date':
-                    if static_fields_list[1][0] != FIRST_TRADING_DAY or static_fields_list[-1][0] != LAST_TRADING_DAY:
-                        static_data_write_required = True
+                # new rows were appended, carry the cached fields on from their last computed day
+                extended_indicators = staticdata.extend_indicators(self.price_store.closes,
+                                                                   cached_indicators,
+                                                                   self.cached_rows)
+            for indicator_name, indicator_column in extended_indicators.items():
+                self.price_store.set_indicator(indicator_name, indicator_column)
         else:
-            static_data_write_required = True
+            # generate static data used for technical analysis
+            self.price_store.indicators = {}
+            staticdata.get_static_data_fields(self, number_of_trading_days)
 
-        if static_data_write_required:
-            # generate and save static data used for technical analysis
-            self.trading_day_object_list = staticdata.get_static_data_fields(self,
-                                                                             number_of_trading_days)
-            write_static_data_fields(self.trading_day_object_list, self.symbol)
-        else:
-            # all required static data fields can be loaded from existing file
-            # reminder that width of static field list and list of required static fields determined to be == above
-            # remove first static fields row that contains the col names
-            for day_number in range(number_of_trading_days):
-                for col_num in range(len(static_fields_list[0])):
-                    col_name = static_fields_list[0][col_num]
-                    self.trading_day_object_list[day_number].technical_analysis_data[col_name] = static_fields_list[day_number + 1][col_num]
+        # save prices and static data so the next run can map them straight from the cache file
+        staticcache.write_static_cache(cache_file_name,
+                                       self.price_store,
+                                       self.source_fingerprint,
+                                       self.source_digest,
+                                       indicator_signature)
 
     def get_closing_price(self, day):
-        return self.trading_day_object_list[day].close
-
-
-class TradingDay:
-    def __init__(self, symbol="", date="", open_price=0.0, close_price=0.0, volume=0):
-        self.symbol = symbol
-        self.date = date
-        self.open = open_price
-        self.close = close_price
-        self.volume = volume
-        self.technical_analysis_data = {}
-
-    def __str__(self):
-        return "date = " + str(self.date) + ", open = " + str(self.open)
-
-    def __repr__(self):
-        return list_to_str(['Trading Day Object: ', self.symbol,
-                            '\n date = ', self.date,
-                           '\n open-close-vol = ', self.open, '-', self.close, '-', self.volume,
-                            '\n technical data dict:\n',
-                            self.technical_analysis_data])
+        return float(self.price_store.closes[day])
 
 
 class StockShare:
@@ -257,16 +416,20 @@ class StockShare:
 
 # --- Functions
 # --- --- Basic Operation Functions
-def price_str_to_float(input_str):
-    return float(input_str[0:input_str.index('.') + 3])
+def list_to_str(input_list: list):
+    return "".join(str(item) for item in input_list)
 
 
-def list_to_str(input_list: list):
-    output_string = ""
-    if len(input_list) > 0:
-        for item in input_list:
-            output_string += str(item)
-    return output_string
+def get_ordered_symbols(symbols):
+    # symbols as a tuple in a repeatable order, sets have no order of their own and are sorted
+    if isinstance(symbols, (set, frozenset)):
+        return tuple(sorted(symbols))
+    return tuple(symbols)
+
+
+def get_potential_trades(symbols, day_scores):
+    # nested list of symbol, score lists used by the original buy / sell strategy functions
+    return [list(symbol_score) for symbol_score in zip(symbols, day_scores.tolist())]
 
 
 def get_date_diff_days(first_day_str: str, last_day_str: str):
@@ -280,124 +443,359 @@ def get_date_diff_days(first_day_str: str, last_day_str: str):
 
 
 # --- --- Data Functions
-def stockdata_csv_to_list_by_symbol(symbol):
-    output_list = []
-    with open(STOCK_DATA_FILE_PATH + symbol + FILE_EXTENSION_TYPE, newline='') as csvfile:
-        historical_data_str_list = list(csv.reader(csvfile, delimiter=' ', quotechar='|'))
-        for row_as_str in historical_data_str_list:
-            row_as_list = row_as_str[0].split(',')
-            output_list.append(row_as_list)
-    return output_list
-
-
-def get_static_data_is_valid(stock_history_data_object_list: list):
-    # verify date range and return number of rows of trading data
-    trading_day_qty = -1
+def get_static_data_is_valid(stock_history_data_object_list: list,
+                             first_trading_day=FIRST_TRADING_DAY,
+                             last_trading_day=LAST_TRADING_DAY):
+    # verify every symbol has price data and return the number of trading days in the master calendar
+    # between the first and last trading day, 0 if the range holds no bars
+    # symbols can have different row counts (later listing, gaps), they are aligned by date in MarketData
     for stock_history_data_object in stock_history_data_object_list:
-        file_length = len(stock_history_data_object.trading_day_object_list)
-        if trading_day_qty == -1:
-            trading_day_qty = file_length
-        if (stock_history_data_object.first_day != FIRST_TRADING_DAY or
-                stock_history_data_object.last_day != LAST_TRADING_DAY or
-                file_length != trading_day_qty):
+        if len(stock_history_data_object.price_store) == 0:
             return 0
 
-    return trading_day_qty
+    calendar = marketdata.get_trading_calendar([stock_history_data_object.price_store
+                                                for stock_history_data_object in stock_history_data_object_list])
+    first_day, end_day = marketdata.get_calendar_range(calendar, first_trading_day, last_trading_day)
+    return end_day - first_day
 
 
-def write_static_data_fields(static_field_row_list: list, symbol: str):
-    # static_field_row_list is list of dicts
-    # each dict row should have keys for all static derived (i.e. technical analysis) fields
-    with open(STATIC_DATA_FILE_PATH + symbol + ' SD.csv', 'w', newline='') as csvfile:
-        fieldnames = STATIC_DATA_DERIVED_FIELDS
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+# --- --- Trading Functions
+def get_comparison_par(cash, market_data: marketdata.MarketData, symbol=COMPARISON_PAR_SYMBOL):
+    # using purchase of SPY S&P 500 as par to calculate alpha
+    # buy as many whole shares as the cash allows at the open of the first trading day SPY has a bar
+    # for, hold them to the close of the last trading day, prices come from the loaded market data
+    # NaN if SPY is not part of the market data
+    if symbol not in market_data.symbol_index:
+        return float('nan')
+    symbol_id = market_data.get_symbol_id(symbol)
+    bar_days = np.flatnonzero(market_data.row_index[:, symbol_id] >= 0)
+    if len(bar_days) == 0:
+        return float('nan')
+    cash_cents = pricestore.dollars_to_cents(cash)
+    initial_price = int(market_data.open_cents[bar_days[0], symbol_id])
+    final_price = int(market_data.close_cents[-1, symbol_id])
+    qty = cash_cents // initial_price if initial_price > 0 else 0
+    starting_balance = cash_cents - (qty * initial_price)
+    final_balance = starting_balance + (qty * final_price)
+    return pricestore.cents_to_dollars(final_balance)
+
+
+# --- --- Primary Functions
+def load_symbol_history_data(config: BacktestConfig, symbol):
+    # load, validate and generate static data for one symbol, run on the loader threads
+    stock_history_object = StockDataHistory(symbol,
+                                            config.first_trading_day,
+                                            config.last_trading_day,
+                                            config.stock_data_file_path,
+                                            config.static_data_file_path)
+    stock_history_object.populate_stock_historical_data()
+    if len(stock_history_object.price_store) == 0:
+        raise ValueError("no valid price rows in the price file")
+    stock_history_object.populate_technical_analysis_data(len(stock_history_object.price_store))
+    return stock_history_object
+
+
+def load_symbols(config: BacktestConfig, progress_callback=None):
+    # load every symbol in the config across a bounded thread pool, file reads and cache writes
+    # for different symbols overlap instead of waiting on each other
+    # a symbol that fails to load is left out and reported, it does not stop the other symbols
+    # returns (list of StockDataHistory objects in config symbol order, dict of symbol -> error message)
+    if progress_callback is None:
+        progress_callback = print_load_progress
+    symbol_count = len(config.ticker_symbol_list)
+    loaded = {}
+    failures = {}
+    if config.load_workers == 1:
+        for symbol in config.ticker_symbol_list:
+            _load_symbol_isolated(config, symbol, loaded, failures)
+            progress_callback(len(loaded) + len(failures), symbol_count, symbol, failures.get(symbol))
+    else:
+        with ThreadPoolExecutor(max_workers=config.load_workers) as executor:
+            futures = {executor.submit(_load_symbol_isolated, config, symbol, loaded, failures): symbol
+                       for symbol in config.ticker_symbol_list}
+            for completed_count, future in enumerate(as_completed(futures), 1):
+                symbol = futures[future]
+                progress_callback(completed_count, symbol_count, symbol, failures.get(symbol))
+    stock_history_data_object_list = [loaded[symbol] for symbol in config.ticker_symbol_list if symbol in loaded]
+    return stock_history_data_object_list, failures
+
+
+def print_load_progress(completed_count, symbol_count, symbol, error):
+    if error is not None:
+        print("failed to load " + symbol + " (" + str(completed_count) + "/" + str(symbol_count) + "): " + error)
+    else:
+        print("loaded " + symbol + " (" + str(completed_count) + "/" + str(symbol_count) + ")")
+
+
+def load_stock_history_data(config: BacktestConfig, progress_callback=None):
+    # load and validate price data and static data for every symbol in the config
+    # returns the list of StockDataHistory objects and the number of trading days, or (None, 0) if invalid
+    stock_history_data_object_list, failures = load_symbols(config, progress_callback)
+    if len(failures) > 0:
+        print("skipping " + str(len(failures)) + " symbols that failed to load: " + ", ".join(sorted(failures)))
+    simulation_days = 0
+    if len(stock_history_data_object_list) > 0:
+        simulation_days = get_static_data_is_valid(stock_history_data_object_list,
+                                                   config.first_trading_day,
+                                                   config.last_trading_day)
+    if simulation_days > 0:
+        print("all historic stock data valid")
+    else:
+        print("historic stock data validation failed")
+        return None, 0
 
-        writer.writeheader()
-        for trading_day_object in static_field_row_list:
-            writer.writerow(trading_day_object.technical_analysis_data)
+    return stock_history_data_object_list, simulation_days
 
-    return True
 
+def _load_symbol_isolated(config, symbol, loaded, failures):
+    try:
+        loaded[symbol] = load_symbol_history_data(config, symbol)
+    except Exception as error:
+        # bad or missing price file, unreadable cache directory, ...
+        failures[symbol] = type(error).__name__ + ": " + str(error)
 
-# --- --- Trading Functions
-def get_comparison_par(cash, days):
-    # using purchase of SPY S&P 500 as par to calculate alpha
-    # starting price on 11-17-14 = 201.66
-    # final price on 11-15-19 = 311.79
-    SPY_history_list = stockdata_csv_to_list_by_symbol("SPY")
-    initial_price = price_str_to_float(SPY_history_list[1][1])
-    final_price = price_str_to_float(SPY_history_list[days][4])
-    qty = cash % initial_price
-    starting_balance = cash - (qty * initial_price)
-    final_balance = starting_balance + (qty * final_price)
-    return final_balance
 
+def load_market_data(config: BacktestConfig):
+    # symbol indexed, date aligned market data for the config, or None if the data is invalid
+    stock_history_data_object_list, simulation_days = load_stock_history_data(config)
+    if stock_history_data_object_list is None:
+        return None
+    return marketdata.MarketData(stock_history_data_object_list, simulation_days,
+                                 config.first_trading_day, config.last_trading_day)
 
-def get_closing_price(all_stocks_historical_data, symbol, day):
-    for stock_historical_data in all_stocks_historical_data:
-        if stock_historical_data.symbol == symbol:
-            return stock_historical_data.trading_day_object_list[day].close
 
+def simulate_back_test(config: BacktestConfig,
+                       market_data: marketdata.MarketData,
+                       print_to_console: bool):
+    # market data is only read during the simulation, so it can be shared between runs
+    # evaluate every symbol on every trading day in one call
+    eval_obj = tradeeval.TradeEvalObj(config.random_seed)
+    score_matrix = eval_obj.eval_trade_batch(config.trade_eval_strat, market_data.get_indicator_matrices())
+    # symbols without a bar on a trading day are skipped by the strategies
+    score_matrix = market_data.mask_scores(score_matrix)
 
-# --- --- Primary Function
-def run_back_test(print_to_console: bool,
-                  save_results: bool):
+    if config.vectorized and fastbacktest.is_supported(config.buy_strat, config.buy_params,
+                                                       config.sell_strat, config.sell_params):
+        return simulate_back_test_vectorized(config, market_data, score_matrix, print_to_console)
+    return simulate_back_test_event_loop(config, market_data, score_matrix, print_to_console)
 
-    if print_to_console:
-        print("Algorithmic Stock Trading App:")
-    # load and validate static data
-    stock_history_data_object_list = []
-    for symbol in TICKER_SYMBOL_LIST:
-        stock_history_object = StockDataHistory(symbol, FIRST_TRADING_DAY, LAST_TRADING_DAY)
-        stock_history_object.populate_stock_historical_data()
-        stock_history_data_object_list.append(stock_history_object)
-    simulation_days = get_static_data_is_valid(stock_history_data_object_list)
-    if simulation_days > 0:
-        print("all historic stock data valid")
-    else:
-        print("historic stock data validation failed")
-        return
-    for stock_history_object in stock_history_data_object_list:
-        stock_history_object.populate_technical_analysis_data(simulation_days)
 
+def simulate_back_test_event_loop(config: BacktestConfig,
+                                  market_data: marketdata.MarketData,
+                                  score_matrix,
+                                  print_to_console: bool):
+    simulation_days = market_data.simulation_days
     # initialize starting portfolio
     days_simulated = 0
-    portfolio = Portfolio(INITIAL_CASH_BALANCE)
-    print('begin trading simulation - portfolio balance: $' + str(INITIAL_CASH_BALANCE))
+    portfolio = Portfolio(config.initial_cash_balance,
+                          config.buy_strat,
+                          config.sell_strat,
+                          config.ticker_symbol_list,
+                          config.buy_params,
+                          config.sell_params,
+                          config.get_execution_params(),
+                          config.sale_type)
+    equity_curve = np.zeros(simulation_days)
+    if print_to_console:
+        print('begin trading simulation - portfolio balance: $' + str(config.initial_cash_balance))
 
     # begin simulation
-    # TODO: use multithreading for running trade simulations
-    eval_obj = tradeeval.TradeEvalObj()
-
     while days_simulated < simulation_days:
 
-        potential_trades_by_evaluation_score = []
-        for stock_history_object in stock_history_data_object_list:
-            technical_analysis_dict = stock_history_object.trading_day_object_list[days_simulated].technical_analysis_data
-            potential_trades_by_evaluation_score.append([stock_history_object.symbol,
-                                                         eval_obj.eval_trade(TRADE_EVAL_STRAT,
-                                                                             [technical_analysis_dict])])
-
+        # orders placed yesterday that fill at today's open
+        portfolio.fill_pending_orders(market_data, days_simulated)
         # sell orders - do sales first to maximize potential cash to buy
-        portfolio.execute_sell_strategy(potential_trades_by_evaluation_score,
-                                        stock_history_data_object_list,
+        portfolio.execute_sell_strategy(score_matrix[days_simulated],
+                                        market_data,
                                         days_simulated)
-        portfolio.execute_buy_strategy(potential_trades_by_evaluation_score,
-                                       stock_history_data_object_list,
+        portfolio.execute_buy_strategy(score_matrix[days_simulated],
+                                       market_data,
                                        days_simulated)
+        equity_curve[days_simulated] = market_data.mark_to_market(portfolio, days_simulated)
 
         days_simulated += 1
     # simulate cash out of all positions
+    portfolio_value_cents = market_data.get_position_value_cents(portfolio.position_book, simulation_days-1)
+
+    return report_back_test(config, market_data, portfolio.trade_history, portfolio.cash_cents,
+                            portfolio_value_cents, equity_curve, False, print_to_console)
+
+
+def simulate_back_test_vectorized(config: BacktestConfig,
+                                  market_data: marketdata.MarketData,
+                                  score_matrix,
+                                  print_to_console: bool):
+    # same trades and balances as the event loop, computed with array operations over the whole period
+    simulation_days = market_data.simulation_days
+    if print_to_console:
+        print('begin trading simulation - portfolio balance: $' + str(config.initial_cash_balance))
+    output = fastbacktest.run_vectorized(score_matrix,
+                                         market_data.close_cents,
+                                         pricestore.dollars_to_cents(config.initial_cash_balance),
+                                         config.buy_strat,
+                                         config.buy_params,
+                                         config.sell_strat,
+                                         config.sell_params,
+                                         config.get_execution_params(),
+                                         market_data.open_cents,
+                                         market_data.volumes,
+                                         market_data.available)
+    trade_history = ledger.TradeLedger(market_data.symbols, len(output.trade_days))
+    trade_history.extend(output.trade_days,
+                         output.trade_symbol_ids,
+                         output.trade_sides,
+                         output.trade_qtys,
+                         output.trade_prices,
+                         output.trade_cash_after,
+                         output.trade_commissions)
+    portfolio_value_cents = int(output.final_holdings @ market_data.close_cents[simulation_days-1])
+
+    return report_back_test(config, market_data, trade_history, output.final_cash,
+                            portfolio_value_cents, pricestore.cents_to_dollars(output.equity_curve), True,
+                            print_to_console)
+
+
+def report_back_test(config: BacktestConfig,
+                     market_data: marketdata.MarketData,
+                     trade_history: ledger.TradeLedger,
+                     cash_cents,
+                     portfolio_value_cents,
+                     equity_curve,
+                     vectorized: bool,
+                     print_to_console: bool):
+    simulation_days = market_data.simulation_days
+    comparison_par_balance = get_comparison_par(config.initial_cash_balance, market_data)
+    final_balance = pricestore.cents_to_dollars(cash_cents + portfolio_value_cents)
+    if print_to_console:
+        metrics = None
+        if len(equity_curve) > 0:
+            metrics = analytics.compute_metrics(equity_curve,
+                                                config.initial_cash_balance,
+                                                analytics.get_benchmark_returns(market_data, COMPARISON_PAR_SYMBOL))
+            metrics = {name: float(values[0]) for name, values in metrics.items()}
+        print_back_test_summary(config, trade_history, comparison_par_balance, final_balance, metrics)
+
+    return BacktestResult(config,
+                          simulation_days,
+                          pricestore.cents_to_dollars(cash_cents),
+                          final_balance,
+                          comparison_par_balance,
+                          len(trade_history),
+                          trade_history,
+                          equity_curve,
+                          vectorized)
+
+
+def print_back_test_summary(config: BacktestConfig,
+                            trade_history: ledger.TradeLedger,
+                            comparison_par_balance,
+                            final_balance,
+                            metrics=None):
+    # metrics = dict of metric name -> value (see analytics.METRIC_NAMES)
     print("trading simulation complete")
-    for trade in portfolio.trade_history:
-        print(trade)
-    print("S&P 500 strategy trade outcome = $" + str(get_comparison_par(INITIAL_CASH_BALANCE, simulation_days)))
-    portfolio_value = 0.0
-    for share in portfolio.stock_shares:
-        portfolio_value += get_closing_price(stock_history_data_object_list, share.symbol, simulation_days-1)
-    print("algorithmic trade portfolio balance = $" + str(portfolio_value + portfolio.cash_balance))
+    if not config.quiet:
+        for trade in trade_history:
+            print(trade)
+    print("S&P 500 strategy trade outcome = $" + str(comparison_par_balance))
+    print("algorithmic trade portfolio balance = $" + str(final_balance))
+    if metrics is not None:
+        print("sharpe ratio = " + '%.4f' % metrics['sharpe'] +
+              ", max drawdown = " + '%.4f' % metrics['max drawdown'] +
+              ", alpha = " + '%.4f' % metrics['alpha'] +
+              ", beta = " + '%.4f' % metrics['beta'])
+
+
+def get_result_metrics(result: BacktestResult, market_data: marketdata.MarketData):
+    # metric name -> value of a single result, benchmark returns come from the market data it ran on
+    return {name: float(values[0]) for name, values in analytics.compute_result_metrics([result],
+                                                                                         market_data,
+                                                                                         COMPARISON_PAR_SYMBOL).items()}
+
+
+def check_vectorized_parity(config: BacktestConfig, market_data: marketdata.MarketData):
+    # run the config through the event loop and the vectorized fast path and list any differences
+    # eval_random configs need a random_seed so both runs see the same scores
+    differences = []
+    if not fastbacktest.is_supported(config.buy_strat, config.buy_params, config.sell_strat, config.sell_params):
+        differences.append("strategies not supported by the vectorized fast path")
+        return differences
+    loop_result = simulate_back_test(config.copy(vectorized=False), market_data, False)
+    vectorized_result = simulate_back_test(config.copy(vectorized=True), market_data, False)
+    if loop_result.trade_history != vectorized_result.trade_history:
+        differences.append("trade history differs")
+    if loop_result.final_balance != vectorized_result.final_balance:
+        differences.append("final balance differs: " + str(loop_result.final_balance) +
+                           " != " + str(vectorized_result.final_balance))
+    if not np.allclose(loop_result.equity_curve, vectorized_result.equity_curve):
+        differences.append("equity curve differs")
+    return differences
+
+
+def run_back_test(print_to_console: bool,
+                  save_results: bool,
+                  config: BacktestConfig = None):
+
+    if config is None:
+        config = BacktestConfig()
+    if print_to_console:
+        print("Algorithmic Stock Trading App:")
+    if save_results:
+        with resultstore.ResultStore() as store:
+            return simulate_back_test_stored(config, store, None, print_to_console)
+    market_data = load_market_data(config)
+    if market_data is None:
+        return None
+
+    result = simulate_back_test(config, market_data, print_to_console)
     # TODO: possibly use GUI module to visualize performance
+    return result
+
+
+def simulate_back_test_stored(config: BacktestConfig,
+                              store: resultstore.ResultStore,
+                              market_data: marketdata.MarketData = None,
+                              print_to_console: bool = False):
+    # stored result of an identical earlier run (same config, code and price data), otherwise the config is
+    # simulated and its result stored, market data is only loaded (if not given) when there is no stored result
+    run_key = store.get_run_key(config, get_price_file_names(config))
+    stored_run = store.load_run(run_key)
+    if stored_run is not None:
+        result = get_stored_result(stored_run, config)
+        if print_to_console:
+            print("using stored result " + run_key)
+            print_back_test_summary(config, result.trade_history, result.comparison_par_balance, result.final_balance,
+                                    stored_run.get_metrics())
+        return result
+
+    if market_data is None:
+        market_data = load_market_data(config)
+        if market_data is None:
+            return None
+    result = simulate_back_test(config, market_data, print_to_console)
+    store.save_run(run_key, result, get_result_metrics(result, market_data))
+    return result
+
+
+def get_stored_result(stored_run: resultstore.StoredRun, config: BacktestConfig):
+    row = stored_run.row
+    comparison_par_balance = row['comparison_par_balance']
+    if comparison_par_balance is None:
+        comparison_par_balance = float('nan')
+    return BacktestResult(config,
+                          row['simulation_days'],
+                          row['cash_balance'],
+                          row['final_balance'],
+                          comparison_par_balance,
+                          row['trade_count'],
+                          stored_run.trade_history,
+                          stored_run.equity_curve,
+                          bool(row['vectorized']))
+
+
+def get_price_file_names(config: BacktestConfig):
+    return [config.stock_data_file_path + symbol + FILE_EXTENSION_TYPE for symbol in config.ticker_symbol_list]
 
-# --- Main App ---
-run_back_test(True, False)
 
+# --- Main App ---
+if __name__ == '__main__':
+    run_back_test(True, False)
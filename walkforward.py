@@ -0,0 +1,216 @@
+"""
+walk forward and rolling window back testing
+price data is loaded and indicators are computed over the full history once, every window is
+then a MarketData view of its trading days (see MarketData.get_window) so indicator warm up
+uses the days before the window and nothing is reloaded or copied per window
+
+walk forward: every candidate config is run on the train period of a window, the best one
+(highest final balance) is run on the test period that follows it
+rolling: every candidate config is run on every window, there is no train period
+
+window runs are spread across the sweep process pool
+
+Tyler Pool
+2022
+"""
+
+import argparse
+import sweep
+import tables
+import trader
+
+
+# --- classes
+class BacktestWindow:
+    # trading day index ranges (first day, day count) into the full history
+    # train_days is 0 for rolling windows
+    def __init__(self, train_first_day, train_days, test_first_day, test_days):
+        self.train_first_day = train_first_day
+        self.train_days = train_days
+        self.test_first_day = test_first_day
+        self.test_days = test_days
+
+    def __repr__(self):
+        return ("Backtest Window: train days " + str(self.train_first_day) + "-" +
+                str(self.train_first_day + self.train_days - 1) + ", test days " + str(self.test_first_day) + "-" +
+                str(self.test_first_day + self.test_days - 1))
+
+
+class WindowResult:
+    def __init__(self, window, train_results, selected_config, test_results):
+        self.window = window
+        # one result per candidate config, empty for rolling windows
+        self.train_results = train_results
+        # config picked on the train period, None for rolling windows
+        self.selected_config = selected_config
+        self.test_results = test_results
+
+    def __repr__(self):
+        return "Window Result: " + repr(self.window) + ", " + str(len(self.test_results)) + " test results"
+
+
+# --- Functions
+def get_walk_forward_windows(simulation_days, train_days, test_days, step_days=None, anchored=False):
+    # consecutive (train, test) windows, each test period directly follows its train period
+    # the windows move forward step_days at a time (default test_days, so test periods do not overlap)
+    # anchored windows keep the train period starting on day 0 (expanding train period)
+    if train_days <= 0 or test_days <= 0:
+        raise ValueError("walk forward windows need train and test days")
+    if step_days is None:
+        step_days = test_days
+    windows = []
+    train_first_day = 0
+    while train_first_day + train_days + test_days <= simulation_days:
+        test_first_day = train_first_day + train_days
+        if anchored:
+            windows.append(BacktestWindow(0, test_first_day, test_first_day, test_days))
+        else:
+            windows.append(BacktestWindow(train_first_day, train_days, test_first_day, test_days))
+        train_first_day += step_days
+    return windows
+
+
+def get_rolling_windows(simulation_days, window_days, step_days=None):
+    # test only windows of window_days trading days, step_days apart (default window_days)
+    if window_days <= 0:
+        raise ValueError("rolling windows need at least one day")
+    if step_days is None:
+        step_days = window_days
+    return [BacktestWindow(first_day, 0, first_day, window_days)
+            for first_day in range(0, simulation_days - window_days + 1, step_days)]
+
+
+def run_window(task):
+    # task = (config, first day, day count), run in the sweep worker processes
+    config, first_day, day_count = task
+    market_data = sweep.get_shared_market_data(config)
+    if market_data is None:
+        return None
+    return trader.simulate_back_test(config, market_data.get_window(first_day, day_count), False)
+
+
+def get_final_balance(result):
+    return result.final_balance
+
+
+def run_windows(config_list, windows, max_workers=None, selection_key=get_final_balance):
+    # every config in config_list must share the same data key (same loaded market data)
+    # returns one WindowResult per window
+    sweep.load_shared_data(config_list)
+    train_tasks = [(config, window.train_first_day, window.train_days)
+                   for window in windows if window.train_days > 0 for config in config_list]
+    train_results = _run_tasks(config_list, train_tasks, max_workers)
+
+    # best config of every train period, all configs for rolling windows
+    window_train_results = []
+    window_test_configs = []
+    test_tasks = []
+    for window in windows:
+        if window.train_days > 0:
+            candidate_results = train_results[0:len(config_list)]
+            train_results = train_results[len(config_list):]
+            valid_results = [result for result in candidate_results if result is not None]
+            test_configs = [max(valid_results, key=selection_key).config] if len(valid_results) > 0 else []
+        else:
+            candidate_results = []
+            test_configs = config_list
+        window_train_results.append(candidate_results)
+        window_test_configs.append(test_configs)
+        test_tasks.extend((config, window.test_first_day, window.test_days) for config in test_configs)
+    test_results = _run_tasks(config_list, test_tasks, max_workers)
+
+    window_result_list = []
+    for window, candidate_results, test_configs in zip(windows, window_train_results, window_test_configs):
+        selected_config = test_configs[0] if window.train_days > 0 and len(test_configs) > 0 else None
+        window_result_list.append(WindowResult(window, candidate_results, selected_config,
+                                               test_results[0:len(test_configs)]))
+        test_results = test_results[len(test_configs):]
+    return window_result_list
+
+
+def get_compounded_return(window_result_list):
+    # growth of the initial balance chaining the first test result of every window
+    compounded_return = 1.0
+    for window_result in window_result_list:
+        if len(window_result.test_results) > 0 and window_result.test_results[0] is not None:
+            test_result = window_result.test_results[0]
+            compounded_return *= test_result.final_balance / test_result.config.initial_cash_balance
+    return compounded_return
+
+
+def format_window_table(window_result_list, market_data):
+    columns = ['test period', 'train period', 'final balance', 'S&P 500 par', 'trades', 'trade eval', 'buy', 'sell']
+    rows = []
+    for window_result in window_result_list:
+        window = window_result.window
+        test_period = _get_period_str(market_data, window.test_first_day, window.test_days)
+        train_period = _get_period_str(market_data, window.train_first_day, window.train_days)
+        for result in window_result.test_results:
+            if result is None:
+                continue
+            rows.append([test_period,
+                         train_period,
+                         '%.2f' % result.final_balance,
+                         '%.2f' % result.comparison_par_balance,
+                         str(result.trade_count),
+                         result.config.trade_eval_strat,
+                         result.config.buy_strat,
+                         result.config.sell_strat])
+    return tables.format_table(columns, rows)
+
+
+def _run_tasks(config_list, task_list, max_workers):
+    if len(task_list) == 0:
+        return []
+    if max_workers == 1:
+        return [run_window(task) for task in task_list]
+    with sweep.create_executor(config_list, max_workers) as executor:
+        return list(executor.map(run_window, task_list, chunksize=sweep.get_chunk_size(len(task_list), max_workers)))
+
+
+def _get_period_str(market_data, first_day, day_count):
+    if day_count <= 0:
+        return "-"
+    return (market_data.get_date_str(first_day) + " to " +
+            market_data.get_date_str(first_day + day_count - 1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="walk forward / rolling window algorithmic trading back tests")
+    parser.add_argument('--train-days', type=int, default=252, help="0 runs rolling test only windows")
+    parser.add_argument('--test-days', type=int, default=63)
+    parser.add_argument('--step-days', type=int, default=None)
+    parser.add_argument('--anchored', action='store_true', help="train periods all start on the first day")
+    parser.add_argument('--trade-eval-strat', nargs='+', default=[trader.TRADE_EVAL_STRAT])
+    parser.add_argument('--buy-strat', nargs='+', default=[trader.BUY_STRAT])
+    parser.add_argument('--sell-strat', nargs='+', default=[trader.SELL_STRAT])
+    parser.add_argument('--random-seed', nargs='+', type=int, default=[None])
+    parser.add_argument('--symbols', nargs='+', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    base_config = trader.BacktestConfig(ticker_symbol_list=args.symbols, quiet=True)
+    config_list = sweep.build_config_grid(base_config,
+                                          trade_eval_strat=args.trade_eval_strat,
+                                          buy_strat=args.buy_strat,
+                                          sell_strat=args.sell_strat,
+                                          random_seed=args.random_seed)
+    sweep.load_shared_data(config_list)
+    market_data = sweep.get_shared_market_data(base_config)
+    if market_data is None:
+        return None
+    if args.train_days > 0:
+        windows = get_walk_forward_windows(market_data.simulation_days, args.train_days, args.test_days,
+                                           args.step_days, args.anchored)
+    else:
+        windows = get_rolling_windows(market_data.simulation_days, args.test_days, args.step_days)
+    window_result_list = run_windows(config_list, windows, args.workers)
+    print(format_window_table(window_result_list, market_data))
+    if args.train_days > 0:
+        print("compounded out of sample return = " + '%.4f' % get_compounded_return(window_result_list))
+    return window_result_list
+
+
+# --- Main App ---
+if __name__ == '__main__':
+    main()